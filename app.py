@@ -1,369 +1,20 @@
 import os
+import threading
 import streamlit as st
 import time
 import pandas as pd
-from groq import Groq
 from dotenv import load_dotenv
-from prompt_builder import ImprovedPromptBuilder
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from contify.brands import BrandStore
+from contify.cache import ResponseCache
+from contify.generator import GroqContentGenerator, VARIATION_COUNT
+from contify.history import HistoryStore
+from contify.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue, WorkerPool
+from contify.router import AUTO_MODEL, ModelRouter
+from contify.telemetry import STAGES, Telemetry
 
 load_dotenv()
 
-class GroqContentGenerator:
-    def __init__(self):
-        self.api_key = os.getenv("GROQ_API_KEY")
-        if not self.api_key or not self.api_key.startswith("gsk_"):
-            st.error("Invalid GROQ_API_KEY. Please check your .env file.")
-            st.stop()
-        
-        self.client = Groq(api_key=self.api_key)
-        self.prompt_builder = ImprovedPromptBuilder()
-    
-    def test_connection(self):
-        try:
-            self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": "Test"}],
-                max_completion_tokens=5
-            )
-            return True
-        except Exception as e:
-            st.error(f"Connection failed: {self._handle_error(e)}")
-            return False
-    
-    def generate_single_variation(self, data: dict, variation_number: int, content_type: str, 
-                                model: str, streaming: bool = False, placeholder=None):
-        try:
-            prompt = self.prompt_builder.build_focused_prompt(data, variation_number, content_type)
-            
-            # Simple parameter variation
-            temperature = 0.7 + (variation_number * 0.1)
-            top_p = 0.85 + (variation_number * 0.05)
-            
-            params = {
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": f"You are a professional fashion copywriter creating variation {variation_number}."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": temperature,
-                "max_completion_tokens": 800,
-                "top_p": top_p,
-                "stream": streaming
-            }
-            
-            completion = self.client.chat.completions.create(**params)
-            
-            if streaming and placeholder:
-                full_content = ""
-                for chunk in completion:
-                    if chunk.choices[0].delta.content:
-                        full_content += chunk.choices[0].delta.content
-                        placeholder.markdown(f"**Variation {variation_number}**\n\n{full_content}")
-                return self._clean_content(full_content, data, content_type)
-            else:
-                result = completion.choices[0].message.content
-                return self._clean_content(result, data, content_type)
-                
-        except Exception as e:
-            st.error(f"Generation error: {self._handle_error(e)}")
-            return self.prompt_builder.create_fallback_content(data, content_type, variation_number)
-    
-    def generate_variations(self, data: dict, content_type: str, model: str, streaming: bool = False):
-        if not self.test_connection():
-            return []
-        
-        # Reset session state for new generation
-        self._reset_session_state()
-        
-        variations = []
-        progress_bar = st.progress(0, text="Starting generation...")
-        
-        for i in range(3):
-            progress_bar.progress(i / 3, text=f"Generating variation {i+1}/3...")
-            
-            placeholder = st.empty() if streaming else None
-            if streaming:
-                st.markdown(f"### Variation {i+1}")
-                placeholder = st.empty()
-            
-            response = self.generate_single_variation(
-                data, i + 1, content_type, model, streaming, placeholder
-            )
-            
-            if response:
-                variations.append({
-                    "variation": i + 1,
-                    "style": self._get_style_name(i + 1),
-                    "content": response,
-                    "char_count": len(response),
-                    "word_count": len(response.split()),
-                    "model_used": model,
-                    "generation_time": time.strftime("%H:%M:%S")
-                })
-                
-                # Store for uniqueness tracking
-                self._store_content(response)
-        
-        progress_bar.progress(1.0, text="Generation complete!")
-        time.sleep(0.5)
-        progress_bar.empty()
-        
-        return variations
-    
-    def _clean_content(self, content: str, data: dict, content_type: str) -> str:
-        if not content:
-            return self.prompt_builder.create_fallback_content(data, content_type, 1)
-        
-        # Remove unwanted labels and formatting
-        lines = []
-        for line in content.split('\n'):
-            line = line.strip()
-            if line and not any(label in line.lower() for label in 
-                              ['headline:', 'subject:', 'description:', 'cta:', 'variation', 'format:', 'line 1:', 'line 2:']):
-                lines.append(line)
-        
-        # Handle PMAX format specifically
-        if content_type == "PMAX":
-            return self._format_pmax_content(content, data)
-        
-        # Handle Email format (subject + body + cta)
-        if content_type == "Email Subject Lines":
-            return self._format_email_content(lines, data)
-        
-        # WhatsApp format (5 lines for storytelling)
-        if content_type == "WhatsApp Broadcast":
-            return self._format_whatsapp_content(lines, data)
-        
-        # Concise Content (3 lines: headline + 1 description + cta)
-        if content_type == "Concise Content":
-            return self._format_concise_content(lines, data)
-        
-        # Long Content (4 lines: headline + 2 description + cta)  
-        if content_type == "Long Content":
-            return self._format_long_content(lines, data)
-        
-        # Standard format fallback
-        filtered_lines = [line for line in lines if len(line) > 3][:3]
-        while len(filtered_lines) < 3:
-            filtered_lines.append("Shop Now")
-        
-        return '\n\n'.join(filtered_lines)
-    
-    def _format_email_content(self, lines: list, data: dict) -> str:
-        """Format email: subject + body + cta (3 lines)"""
-        subject_line = ""
-        body_line = ""
-        cta_line = ""
-        
-        for line in lines:
-            if len(line) > 5:  # Substantial content
-                if not subject_line:
-                    subject_line = line.replace('**', '').strip()
-                elif not body_line and line != subject_line and len(line) > 20:
-                    body_line = line.strip()
-                elif not cta_line and len(line.split()) <= 4 and line != subject_line and line != body_line:
-                    cta_line = line.strip()
-                    break
-        
-        # Fallbacks
-        if not subject_line:
-            subject_line = f"New {data.get('product', 'Collection')} Perfect for {data.get('festival', 'You')}"
-        if not body_line:
-            body_line = f"Stunning {data.get('fabric', 'premium')} pieces designed for memorable moments."
-        if not cta_line:
-            cta_line = "Shop Now"
-        
-        return f"**{subject_line}**\n{body_line}\n{cta_line}"
-    
-    def _format_whatsapp_content(self, lines: list, data: dict) -> str:
-        """Format WhatsApp: headline + 3 story lines + cta (5 lines)"""
-        filtered_lines = [line for line in lines if len(line) > 5]
-        
-        if len(filtered_lines) >= 5:
-            return '\n'.join(filtered_lines[:5])
-        
-        # Build from available lines
-        headline = filtered_lines[0] if filtered_lines else f"Style Speaks Softly"
-        story_lines = filtered_lines[1:4] if len(filtered_lines) > 3 else []
-        cta = filtered_lines[-1] if filtered_lines and len(filtered_lines[-1].split()) <= 4 else "Shop Now"
-        
-        # Fill missing story lines
-        default_stories = [
-            f"New {data.get('product', 'collection')} arrives where style meets comfort.",
-            f"Designed for seamless transitions from day to {data.get('festival', 'evening')}.",
-            f"These pieces effortlessly adapt to your unique style story."
-        ]
-        
-        while len(story_lines) < 3:
-            story_lines.append(default_stories[len(story_lines)])
-        
-        return f"{headline}\n{story_lines[0]}\n{story_lines[1]}\n{story_lines[2]}\n{cta}"
-    
-    def _format_concise_content(self, lines: list, data: dict) -> str:
-        """Format Concise: headline + 1 description + cta (3 lines)"""
-        filtered_lines = [line for line in lines if len(line) > 5]
-        
-        headline = filtered_lines[0] if filtered_lines else f"New {data.get('product', 'Collection')}"
-        description = ""
-        cta = "Shop Now"
-        
-        # Find description and CTA
-        for line in filtered_lines[1:]:
-            if len(line.split()) > 4 and not description:
-                description = line
-            elif len(line.split()) <= 4 and line != headline:
-                cta = line
-                break
-        
-        if not description:
-            description = f"Premium {data.get('fabric', 'quality')} pieces for your {data.get('festival', 'style')} wardrobe."
-        
-        return f"{headline}\n{description}\n{cta}"
-    
-    def _format_long_content(self, lines: list, data: dict) -> str:
-        """Format Long: headline + 2 descriptions + cta (4 lines)"""
-        filtered_lines = [line for line in lines if len(line) > 5]
-        
-        headline = filtered_lines[0] if filtered_lines else f"New {data.get('product', 'Collection')}"
-        descriptions = []
-        cta = "Shop Now"
-        
-        # Extract descriptions and CTA
-        for line in filtered_lines[1:]:
-            if len(line.split()) > 4 and len(descriptions) < 2:
-                descriptions.append(line)
-            elif len(line.split()) <= 4 and line != headline:
-                cta = line
-                break
-        
-        # Fill missing descriptions
-        default_descriptions = [
-            f"Premium {data.get('fabric', 'quality')} pieces crafted for discerning taste.",
-            f"Perfect for your {data.get('festival', 'special')} wardrobe and beyond."
-        ]
-        
-        while len(descriptions) < 2:
-            descriptions.append(default_descriptions[len(descriptions)])
-        
-        return f"{headline}\n{descriptions[0]}\n{descriptions[1]}\n{cta}"
-    
-    def _format_pmax_content(self, content: str, data: dict) -> str:
-        """Improved PMAX formatting with proper parsing"""
-        lines = [line.strip() for line in content.split('\n') if line.strip()]
-        
-        headlines = []
-        descriptions = []
-        long_headlines = []
-        
-        current_section = None
-        
-        for line in lines:
-            line_lower = line.lower()
-            
-            # Detect section headers
-            if 'headlines:' in line_lower and 'long' not in line_lower:
-                current_section = 'headlines'
-                continue
-            elif 'descriptions:' in line_lower:
-                current_section = 'descriptions'
-                continue
-            elif 'long headlines:' in line_lower or 'long-headlines:' in line_lower:
-                current_section = 'long_headlines'
-                continue
-            
-            # Skip empty lines and section headers
-            if not line or line_lower in ['headlines:', 'descriptions:', 'long headlines:']:
-                continue
-            
-            # Add content to appropriate section with character limits
-            if current_section == 'headlines' and len(headlines) < 15:
-                headlines.append(line[:30])
-            elif current_section == 'descriptions' and len(descriptions) < 5:
-                descriptions.append(line[:90])
-            elif current_section == 'long_headlines' and len(long_headlines) < 5:
-                long_headlines.append(line[:120])
-        
-        # Fill missing content with templates
-        product = data.get('product', 'Collection')
-        brand = data.get('brand', 'Premium')
-        fabric = data.get('fabric', 'Quality')
-        festival = data.get('festival', 'Special')
-        
-        # Fill headlines (need 15)
-        headline_templates = [
-            f"New {product}", f"{brand} Style", f"Premium {fabric}", 
-            f"Perfect for {festival}", "Quality First", "Shop Now", "Get Yours",
-            "Trending Style", "Must Have", "Best Choice", "Modern Look",
-            "Classic Style", "Fresh Design", "Top Quality", "Great Value"
-        ]
-        
-        while len(headlines) < 15:
-            template = headline_templates[len(headlines) % len(headline_templates)]
-            if template[:30] not in [h[:30] for h in headlines]:
-                headlines.append(template[:30])
-            else:
-                headlines.append(f"Style {len(headlines) + 1}")
-        
-        # Fill descriptions (need 5)
-        desc_templates = [
-            f"Premium {fabric} {product} for {festival} celebrations",
-            f"{brand} quality craftsmanship in every piece",
-            f"Perfect {product} designed for your special moments",
-            f"Handpicked {fabric} pieces for discerning taste",
-            f"New {product} collection now available"
-        ]
-        
-        while len(descriptions) < 5:
-            template = desc_templates[len(descriptions) % len(desc_templates)]
-            descriptions.append(template[:90])
-        
-        # Fill long headlines (need 5)
-        long_templates = [
-            f"{brand} Premium {product} - Quality {fabric} Collection",
-            f"Perfect {fabric} {product} for {festival} Celebrations", 
-            f"New {product} Collection - Handcrafted {fabric} Pieces",
-            f"{brand} {fabric} {product} - Modern Style Statement",
-            f"Premium {product} in {fabric} - Shop the Collection"
-        ]
-        
-        while len(long_headlines) < 5:
-            template = long_templates[len(long_headlines) % len(long_templates)]
-            long_headlines.append(template[:120])
-        
-        # Build final result
-        result = "Headlines:\n" + '\n'.join(headlines[:15])
-        result += "\n\nDescriptions:\n" + '\n'.join(descriptions[:5])
-        result += "\n\nLong Headlines:\n" + '\n'.join(long_headlines[:5])
-        
-        return result
-    
-    def _handle_error(self, error: Exception) -> str:
-        error_str = str(error).lower()
-        if "authentication" in error_str:
-            return "Invalid API key"
-        elif "rate limit" in error_str:
-            return "Rate limit exceeded - wait a moment"
-        elif "quota" in error_str:
-            return "API quota exceeded"
-        else:
-            return "API error - please try again"
-    
-    def _reset_session_state(self):
-        for key in ['previous_content', 'generation_counter']:
-            if key in st.session_state:
-                del st.session_state[key]
-    
-    def _store_content(self, content: str):
-        if 'previous_content' not in st.session_state:
-            st.session_state.previous_content = []
-        st.session_state.previous_content.append(content)
-        if len(st.session_state.previous_content) > 10:
-            st.session_state.previous_content = st.session_state.previous_content[-10:]
-    
-    def _get_style_name(self, variation: int) -> str:
-        styles = {1: "Direct & Clear", 2: "Personal & Warm", 3: "Aspirational & Bold"}
-        return styles.get(variation, f"Style {variation}")
-
 # Streamlit UI
 st.set_page_config(page_title="AI Fashion Copywriter", page_icon="✨", layout="wide")
 
@@ -383,29 +34,178 @@ if not os.getenv("GROQ_API_KEY"):
     st.error("Missing GROQ_API_KEY! Add it to your .env file.")
     st.stop()
 
+# Brand profiles, shared by every session and the job workers
+BRANDS_PATH = os.getenv("CONTIFY_BRANDS_PATH", ".contify_brands.sqlite")
+
+@st.cache_resource
+def init_brands():
+    return BrandStore(BRANDS_PATH, max_builders=int(os.getenv("CONTIFY_BRANDS_CACHED", "1000")))
+
 # Initialize generator
 @st.cache_resource
 def init_generator():
-    return GroqContentGenerator()
+    cache = ResponseCache(
+        path=os.getenv("CONTIFY_CACHE_PATH", ".contify_cache.sqlite") or None,
+        ttl_seconds=int(os.getenv("CONTIFY_CACHE_TTL", str(24 * 3600)))
+    )
+    # Past this many seconds a variation is served as template copy; the late answer is still cached
+    latency_budget = float(os.getenv("CONTIFY_LATENCY_BUDGET", "15")) or None
+    router = ModelRouter(target_latency=float(os.getenv("CONTIFY_TARGET_LATENCY", "3")))
+    # Stage timings go to CONTIFY_TRACE_PATH / CONTIFY_METRICS_FILE, and to /metrics on CONTIFY_METRICS_PORT
+    telemetry = Telemetry.from_env()
+    if os.getenv("CONTIFY_METRICS_PORT"):
+        telemetry.serve(os.getenv("CONTIFY_METRICS_HOST", "127.0.0.1"), int(os.getenv("CONTIFY_METRICS_PORT")))
+    return GroqContentGenerator(cache=cache, latency_budget=latency_budget, router=router, telemetry=telemetry,
+                                brands=init_brands())
+
+try:
+    generator = init_generator()
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
 
-generator = init_generator()
+# Recent copy for every session, kept compact and bounded in one process-wide store
+@st.cache_resource
+def init_history():
+    return HistoryStore(
+        per_session=int(os.getenv("CONTIFY_HISTORY_PER_SESSION", "10")),
+        max_sessions=int(os.getenv("CONTIFY_HISTORY_MAX_SESSIONS", "1000"))
+    )
+
+history = init_history()
+brands = init_brands()
+
+# Durable job queue; its worker processes are started once per server (0 = run `python -m contify.jobs` instead)
+@st.cache_resource
+def init_jobs():
+    path = os.getenv("CONTIFY_JOB_QUEUE", ".contify_jobs.sqlite")
+    queue = JobQueue(path)
+    workers = int(os.getenv("CONTIFY_JOB_WORKERS", "2"))
+    if workers:
+        WorkerPool(path, workers, os.getenv("CONTIFY_CACHE_PATH", ".contify_cache.sqlite") or None, BRANDS_PATH).start()
+    return queue
+
+jobs = init_jobs()
+JOB_POLL_SECONDS = 1.0
+session_id = get_script_run_ctx().session_id
+
+def in_script_thread(callback):
+    """Let generator callbacks running on worker or event loop threads write to this session's page"""
+    ctx = get_script_run_ctx()
+    
+    def wrapped(*args):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return callback(*args)
+    return wrapped
+
+def run_generation(data: dict, content_type: str, model: str, streaming: bool, parallel: bool,
+                   use_cache: bool = True, single_call: bool = False, dedupe: bool = True) -> list:
+    progress_bar = st.progress(0, text="Starting generation...")
+    
+    placeholders = {}
+    if streaming or parallel:
+        for variation_number in range(1, VARIATION_COUNT + 1):
+            if streaming:
+                st.markdown(f"### Variation {variation_number}")
+            placeholders[variation_number] = st.empty()
+    
+    def show(variation_number: int, text: str):
+        if text:
+            placeholders[variation_number].markdown(f"**Variation {variation_number}**\n\n{text}")
+    
+    # Runs on the process-wide event loop and connection pool shared by every session
+    variations = generator.generate_variations_pooled(
+        data, content_type, model, streaming, parallel,
+        on_progress=in_script_thread(lambda fraction, text: progress_bar.progress(fraction, text=text)),
+        on_stream=in_script_thread(show) if streaming else None,
+        on_variation=in_script_thread(show) if parallel and not streaming else None,
+        on_error=in_script_thread(st.error),
+        use_cache=use_cache,
+        single_call=single_call,
+        dedupe=dedupe,
+        history=history,
+        session_id=session_id
+    )
+    
+    for var in variations:
+        history.add(session_id, var["content"])
+    
+    time.sleep(0.5)
+    progress_bar.empty()
+    if not streaming:
+        for placeholder in placeholders.values():
+            placeholder.empty()
+    
+    return variations
 
 # Header
 st.markdown('<h1 class="main-title">✨ AI Fashion Copywriter</h1>', unsafe_allow_html=True)
 st.markdown("### Professional ad copy with maximum creative diversity")
 
+health = generator.health_status()
+if health["last_confirmed"]:
+    status = "🟢 API healthy" if health["healthy"] else "🟡 API check pending"
+    st.caption(f"{status} • last confirmed at {health['last_confirmed']} ({health['seconds_since_confirmed']:.0f}s ago)")
+if generator.cache is not None:
+    cache_stats = generator.cache.stats
+    cache_hits = cache_stats["memory_hits"] + cache_stats["disk_hits"]
+    st.caption(f"♻️ Cache: {cache_hits} hits • {cache_stats['misses']} misses • {generator.cache.hit_rate():.0%} hit rate")
+limiter_stats = generator.rate_limiter.metrics()
+if limiter_stats["throttled"] or limiter_stats["retries"]:
+    st.caption(f"⏳ Throttled {limiter_stats['throttled']}x ({limiter_stats['throttle_wait_seconds']:.1f}s) • "
+               f"{limiter_stats['retries']} retries • {limiter_stats['rate_limited']} rate limited")
+if generator.deadline_stats["fallbacks"]:
+    st.caption(f"⏱️ {generator.deadline_stats['fallbacks']} variations missed the {generator.latency_budget:g}s "
+               f"latency budget • {generator.deadline_stats['late_results']} late answers finished in the background")
+coalesce_stats = generator.coalescer.metrics()
+if coalesce_stats["coalesced"]:
+    st.caption(f"🔗 {coalesce_stats['coalesced']} requests shared an identical in-flight generation "
+               f"({coalesce_stats['coalesced_rate']:.0%} of calls)")
+telemetry_summary = generator.telemetry.summary()
+if telemetry_summary["stages"]:
+    with st.expander("📊 Performance Metrics"):
+        stage_rank = {stage: rank for rank, stage in enumerate(STAGES + ["generation", "render"])}
+        st.dataframe(pd.DataFrame([
+            {"Stage": stage, "Count": stats["count"], "p50 (ms)": stats["p50_ms"], "p95 (ms)": stats["p95_ms"],
+             "Max (ms)": stats["max_ms"]}
+            for stage, stats in sorted(telemetry_summary["stages"].items(),
+                                       key=lambda item: stage_rank.get(item[0], len(stage_rank)))
+        ]), use_container_width=True, hide_index=True)
+        tokens = telemetry_summary["tokens"]
+        st.caption(f"🔢 {tokens.get('prompt_tokens', 0)} prompt tokens • {tokens.get('completion_tokens', 0)} completion tokens • "
+                   + " • ".join(f"{count} {result}" for result, count in sorted(telemetry_summary["outcomes"].items())))
+job_counts = jobs.counts()
+if job_counts[QUEUED] or job_counts[RUNNING]:
+    st.caption(f"📬 Background jobs: {job_counts[QUEUED]} queued • {job_counts[RUNNING]} running")
+
 # Model and settings selection
 col1, col2, col3 = st.columns([2, 1, 1])
 with col1:
     model_options = {
         "💡 Gemma2 9B (Recommended)": "gemma2-9b-it",
-        "⚡ Llama 3.1 8B (Fastest)": "llama-3.1-8b-instant"
+        "⚡ Llama 3.1 8B (Fastest)": "llama-3.1-8b-instant",
+        "🧭 Auto (Route by latency and load)": AUTO_MODEL
     }
     selected_model = model_options[st.selectbox("🤖 AI Model", list(model_options.keys()))]
+    if selected_model == AUTO_MODEL:
+        router_stats = generator.router.metrics()
+        st.caption(" • ".join(
+            f"{model}: {stats['latency_ms']:.0f} ms, {stats['error_rate']:.0%} errors" if stats["latency_ms"] is not None
+            else f"{model}: not measured yet"
+            for model, stats in router_stats.items()
+        ))
 with col2:
     streaming = st.toggle("🎬 Live Streaming", help="Watch generation in real-time")
+    parallel = st.toggle("⚡ Parallel Generation", value=True, help="Generate all variations at once")
+    single_request = st.toggle("🧩 Single Request", help="Ask for all variations in one API call (fewer tokens, no live streaming)")
+    bypass_cache = st.toggle("🆕 Bypass Cache", help="Always request fresh copy instead of reusing identical past results")
+    avoid_repeats = st.toggle("🔁 Avoid Repeats", value=True,
+                              help="Regenerate variations that nearly repeat each other or earlier copy in this session")
+    background = st.toggle("📬 Background Job",
+                           help="Queue the generation for background workers; results survive reruns and reloads (no live streaming)")
 with col3:
     if st.button("🔄 Reset Session"):
+        history.clear(session_id)
         for key in list(st.session_state.keys()):
             del st.session_state[key]
         st.success("Session reset!")
@@ -435,6 +235,17 @@ FABRIC_TYPES = [
     "Crepe", "Velvet", "Satin", "Muslin", "Chiffon", "Organza", "Net"
 ]
 
+BRAND_VOICES = ["Premium & Aspirational", "Warm & Personal", "Playful & Fun", "Sophisticated", "Friendly & Approachable"]
+
+# A saved brand profile prefills the brand fields and brings the brand's voice and rules
+with st.sidebar:
+    if "select_brand" in st.session_state:
+        st.session_state["brand_profile"] = st.session_state.pop("select_brand")
+    brand_choices = {"➕ New brand": None, **{brand["name"]: brand["id"] for brand in brands.list()}}
+    selected_brand = brand_choices.get(st.selectbox("🗂️ Brand Profile", list(brand_choices), key="brand_profile"))
+    profile = (brands.get(selected_brand) if selected_brand else None) or {}
+profile_tone = BRAND_VOICES.index(profile["tone"]) if profile.get("tone") in BRAND_VOICES else 0
+
 # EASY MODE
 if mode == "🎯 Easy Mode":
     with st.sidebar:
@@ -442,18 +253,18 @@ if mode == "🎯 Easy Mode":
         
         with st.expander("🏷️ Product Details", expanded=True):
             garment_type = st.selectbox("Garment Type", GARMENT_TYPES)
-            brand_name = st.text_input("Brand Name", placeholder="e.g., Dolly J, Safaa")
-            usp = st.text_input("Unique Selling Point", placeholder="e.g., Effortless Glamour")
+            brand_name = st.text_input("Brand Name", value=profile.get("name", ""), placeholder="e.g., Dolly J, Safaa")
+            usp = st.text_input("Unique Selling Point", value=profile.get("usp", ""), placeholder="e.g., Effortless Glamour")
         
         with st.expander("🎨 Style Details", expanded=True):
-            fabric = st.multiselect("Fabric Types", FABRIC_TYPES[:10])
+            fabric = st.multiselect("Fabric Types", FABRIC_TYPES[:10],
+                                    default=[f for f in profile.get("fabrics", []) if f in FABRIC_TYPES[:10]])
             festival = st.selectbox("Occasion", FESTIVALS_OCCASIONS)
         
         with st.expander("⚙️ Campaign Settings", expanded=True):
             content_type = st.selectbox("Content Type", 
                 ["Email Subject Lines", "Long Content", "Concise Content", "PMAX", "WhatsApp Broadcast"])
-            tone = st.selectbox("Brand Voice", 
-                ["Premium & Aspirational", "Warm & Personal", "Playful & Fun", "Sophisticated", "Friendly & Approachable"])
+            tone = st.selectbox("Brand Voice", BRAND_VOICES, index=profile_tone)
             discount = st.number_input("Discount %", min_value=0, max_value=100, step=5, value=0)
             
             if content_type == "PMAX":
@@ -476,17 +287,17 @@ elif mode == "⚙️ Advanced Mode":
         
         with st.expander("🏷️ Product Information", expanded=True):
             product = st.text_input("Product Name", placeholder="e.g., Wedding Collection")
-            brand_name = st.text_input("Brand Name", placeholder="e.g., Dolly J")
-            usp = st.text_input("Unique Selling Point", placeholder="e.g., Effortless Glamour")
+            brand_name = st.text_input("Brand Name", value=profile.get("name", ""), placeholder="e.g., Dolly J")
+            usp = st.text_input("Unique Selling Point", value=profile.get("usp", ""), placeholder="e.g., Effortless Glamour")
             attributes = st.text_area("Product Attributes", placeholder="e.g., Handcrafted, Premium comfort")
-            fabric = st.multiselect("Fabric Types", FABRIC_TYPES)
+            fabric = st.multiselect("Fabric Types", FABRIC_TYPES,
+                                    default=[f for f in profile.get("fabrics", []) if f in FABRIC_TYPES])
             emotion = st.text_input("Emotional Hook", placeholder="e.g., Celebrate Bonds")
         
         with st.expander("⚙️ Content Settings", expanded=True):
             content_type = st.selectbox("Content Type", 
                 ["Email Subject Lines", "Long Content", "Concise Content", "PMAX", "WhatsApp Broadcast"])
-            tone = st.selectbox("Brand Voice", 
-                ["Premium & Aspirational", "Warm & Personal", "Playful & Fun", "Sophisticated", "Friendly & Approachable"])
+            tone = st.selectbox("Brand Voice", BRAND_VOICES, index=profile_tone)
         
         with st.expander("🎯 Marketing Details", expanded=True):
             discount = st.number_input("Discount %", min_value=0, max_value=100, step=5, value=0)
@@ -508,6 +319,134 @@ elif mode == "⚙️ Advanced Mode":
         
         generate_btn = st.button("✨ Generate Variations", type="primary")
 
+# The brand's own rules, saved with the fields above as its profile
+with st.sidebar:
+    with st.expander("🗣️ Brand Voice & Rules", expanded=bool(profile)):
+        voice = st.text_area("Voice", value=profile.get("voice", ""),
+                             placeholder="e.g., Warm and confident, short sentences, never pushy")
+        banned_words = st.text_input("Banned Words", value=", ".join(profile.get("banned_words", [])),
+                                     placeholder="e.g., cheap, bargain", help="Added to the house list")
+        preferred_ctas = st.text_input("Preferred CTAs", value=", ".join(profile.get("ctas", [])),
+                                       placeholder="e.g., Shop the Edit, Find Your Fit")
+        preferred_greetings = st.text_input("Preferred Greetings", value=", ".join(profile.get("greetings", [])),
+                                            placeholder="e.g., Hello lovely, Dear friend")
+        if st.button("💾 Save Brand Profile", disabled=not brand_name):
+            # Without a selected profile this creates a brand; an existing one keeps its id when renamed
+            try:
+                saved = brands.save({
+                    "id": profile.get("id"), "name": brand_name, "usp": usp, "tone": tone, "fabrics": fabric,
+                    "voice": voice, "banned_words": banned_words, "ctas": preferred_ctas,
+                    "greetings": preferred_greetings
+                })
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.session_state["select_brand"] = saved["name"]
+                st.rerun()
+    if profile:
+        st.caption(f"🗂️ {profile['name']} profile v{profile['version']}")
+
+# Results, for a generation that just ran or a finished background job
+def show_variations(variations: list, data: dict, content_type: str, generated_at: float = None):
+    # Generation info
+    st.markdown("### 🎯 Generated Variations")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Generated at: {time.strftime("%H:%M:%S", time.localtime(generated_at))}</div>', unsafe_allow_html=True)
+    with col2:
+        st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Total Variations: {len(variations)}</div>', unsafe_allow_html=True)
+    with col3:
+        st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Model: {variations[0].get("model_used", "Unknown")}</div>', unsafe_allow_html=True)
+    
+    # Display table
+    df = pd.DataFrame([{
+        "Variation": f"#{v['variation']}",
+        "Style": v['style'],
+        "Content": v['content'][:100] + "..." if len(v['content']) > 100 else v['content'],
+        "Characters": v['char_count'],
+        "Words": v['word_count'],
+        "Time": v['generation_time']
+    } for v in variations])
+    
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Variation": st.column_config.TextColumn("Var", width="small"),
+            "Style": st.column_config.TextColumn("Style", width="medium"),
+            "Content": st.column_config.TextColumn("Preview", width="large"),
+            "Characters": st.column_config.NumberColumn("Chars", width="small"),
+            "Words": st.column_config.NumberColumn("Words", width="small"),
+            "Time": st.column_config.TextColumn("Time", width="small")
+        }
+    )
+    
+    # Individual variation cards for better readability
+    st.markdown("### 📄 Detailed View")
+    for i, var in enumerate(variations):
+        with st.expander(f"Variation {var['variation']} - {var['style']} ({var['char_count']} chars)"):
+            # Display content in card format
+            formatted_content = var["content"].replace("\n", "<br>")
+            st.markdown(f'<div class="variation-card">{formatted_content}</div>', unsafe_allow_html=True)
+            
+            col1, col2 = st.columns([2, 1])
+            with col1:
+                st.code(var["content"], language="text")
+            with col2:
+                st.caption(f"🤖 {var.get('model_used', 'Unknown')}")
+                routing = var.get("routing")
+                if routing:
+                    failover = f" after {', '.join(routing['failover_from'])} failed" if routing["failover_from"] else ""
+                    st.caption(f"🧭 Routed automatically{failover} (target {routing['target_ms']} ms)")
+                st.caption(f"⏰ {var.get('generation_time', 'Unknown')}")
+                var_metrics = var.get("metrics", {})
+                if var_metrics.get("near_duplicate"):
+                    st.caption("🔁 Still close to other copy from this session")
+                elif var_metrics.get("regenerated"):
+                    st.caption(f"🔁 Regenerated {var_metrics['regenerated']}x to avoid repeating other copy")
+                if var_metrics.get("cached"):
+                    st.caption("♻️ Served from cache")
+                elif var_metrics.get("coalesced"):
+                    st.caption("🔗 Shared with an identical request already in flight")
+                elif var_metrics.get("invalid"):
+                    st.caption(f"⚠️ Template copy: the reply still failed validation after retrying "
+                               f"({var_metrics['invalid']})")
+                elif var_metrics.get("fallback"):
+                    st.caption(f"⏱️ Template copy: the model missed the {var_metrics['deadline_ms'] / 1000:g}s budget")
+                elif var_metrics.get("failed"):
+                    st.caption("⚠️ Template copy: the model call failed")
+                elif var_metrics.get("total_ms") is not None:
+                    speed = f" • {var_metrics['tokens_per_sec']} tok/s" if var_metrics.get("tokens_per_sec") else ""
+                    ttft = f"TTFT {var_metrics['ttft_ms']:.0f} ms • " if var_metrics.get("ttft_ms") is not None else ""
+                    st.caption(f"⚡ {ttft}{var_metrics['total_ms']:.0f} ms{speed}")
+                    if var_metrics.get("finish_reason") == "complete":
+                        st.caption("✂️ Stream closed once the copy was complete")
+                    elif var_metrics.get("finish_reason") == "length":
+                        st.caption("📏 Reply reached its token budget")
+                    if var_metrics.get("rejected"):
+                        st.caption(f"🛑 Cut off and re-asked: {'; '.join(var_metrics['rejected'])}")
+                stages = var_metrics.get("stages_ms")
+                if stages:
+                    st.caption("🧮 " + " • ".join(f"{stage} {ms:g} ms" for stage, ms in stages.items()))
+                st.download_button(
+                    "📥 Download",
+                    var["content"],
+                    f"{data.get('brand', 'content')}_{content_type}_v{var['variation']}.txt",
+                    key=f"download_{i}"
+                )
+    
+    # Action buttons
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("🔄 Generate New Set"):
+            st.query_params.pop("job", None)
+            st.rerun()
+    with col2:
+        all_content = "\n\n--- VARIATION ---\n\n".join([v["content"] for v in variations])
+        st.download_button("📦 Download All", all_content, f"{data.get('brand', 'content')}_variations.txt")
+
 # Generation
 if generate_btn:
     # Validation based on mode
@@ -550,76 +489,56 @@ if generate_btn:
             'emotion': emotion or "Exclusive luxury"
         }
     
-    with st.spinner("Generating variations..."):
-        variations = generator.generate_variations(data, content_type, selected_model, streaming)
+    # The stored profile's voice, banned words, CTAs and greetings apply as long as its name is kept
+    if profile and brand_name == profile["name"]:
+        data['brand_id'] = profile["id"]
     
-    if variations:
-        # Generation info
-        st.markdown("### 🎯 Generated Variations")
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Generated at: {time.strftime("%H:%M:%S")}</div>', unsafe_allow_html=True)
-        with col2:
-            st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Total Variations: {len(variations)}</div>', unsafe_allow_html=True)
-        with col3:
-            st.markdown(f'<div style="background: linear-gradient(135deg, #ffeaa7 0%, #fab1a0 100%); padding: 0.5rem; border-radius: 8px; font-size: 0.9rem;">Model: {variations[0].get("model_used", "Unknown")}</div>', unsafe_allow_html=True)
-        
-        # Display table
-        df = pd.DataFrame([{
-            "Variation": f"#{v['variation']}",
-            "Style": v['style'],
-            "Content": v['content'][:100] + "..." if len(v['content']) > 100 else v['content'],
-            "Characters": v['char_count'],
-            "Words": v['word_count'],
-            "Time": v['generation_time']
-        } for v in variations])
-        
-        st.dataframe(
-            df,
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "Variation": st.column_config.TextColumn("Var", width="small"),
-                "Style": st.column_config.TextColumn("Style", width="medium"),
-                "Content": st.column_config.TextColumn("Preview", width="large"),
-                "Characters": st.column_config.NumberColumn("Chars", width="small"),
-                "Words": st.column_config.NumberColumn("Words", width="small"),
-                "Time": st.column_config.TextColumn("Time", width="small")
-            }
-        )
-        
-        # Individual variation cards for better readability
-        st.markdown("### 📄 Detailed View")
-        for i, var in enumerate(variations):
-            with st.expander(f"Variation {var['variation']} - {var['style']} ({var['char_count']} chars)"):
-                # Display content in card format
-                formatted_content = var["content"].replace("\n", "<br>")
-                st.markdown(f'<div class="variation-card">{formatted_content}</div>', unsafe_allow_html=True)
-                
-                col1, col2 = st.columns([2, 1])
-                with col1:
-                    st.code(var["content"], language="text")
-                with col2:
-                    st.caption(f"🤖 {var.get('model_used', 'Unknown')}")
-                    st.caption(f"⏰ {var.get('generation_time', 'Unknown')}")
-                    st.download_button(
-                        "📥 Download",
-                        var["content"],
-                        f"{data.get('brand', 'content')}_{content_type}_v{var['variation']}.txt",
-                        key=f"download_{i}"
-                    )
-        
-        # Action buttons
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("🔄 Generate New Set"):
-                st.rerun()
-        with col2:
-            all_content = "\n\n--- VARIATION ---\n\n".join([v["content"] for v in variations])
-            st.download_button("📦 Download All", all_content, f"{data.get('brand', 'content')}_variations.txt")
+    if background:
+        st.query_params["job"] = jobs.submit(data, content_type, selected_model, {
+            "parallel": parallel, "use_cache": not bypass_cache, "single_call": single_request, "dedupe": avoid_repeats
+        })
+    else:
+        st.query_params.pop("job", None)
+        with st.spinner("Generating variations..."):
+            variations = run_generation(data, content_type, selected_model, streaming, parallel, not bypass_cache,
+                                        single_request, avoid_repeats)
+        
+        if variations:
+            render_started = time.perf_counter()
+            show_variations(variations, data, content_type)
+            generator.telemetry.record("render", time.perf_counter() - render_started)
+        else:
+            st.error("Failed to generate variations. Please try again.")
+
+# Background job, kept in the URL so it survives reruns, reloads and reconnects
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def watch_job(job_id: str):
+    job = jobs.get(job_id)
+    # A deleted job reruns too, and the page reports it gone
+    if job is None or job["status"] in (DONE, FAILED):
+        st.rerun()
+    ready = len(job["variations"])
+    st.progress(ready / VARIATION_COUNT, text=f"📬 Background job {job['status']}: {ready}/{VARIATION_COUNT} variations ready")
+    for var in job["variations"]:
+        st.markdown(f"**Variation {var['variation']}**\n\n{var['content']}")
+
+job_id = st.query_params.get("job")
+if job_id:
+    job = jobs.get(job_id)
+    if job is None:
+        st.warning("That background job no longer exists.")
+        st.query_params.pop("job", None)
+    elif job["status"] == DONE:
+        recorded_jobs = st.session_state.setdefault("recorded_jobs", set())
+        if job_id not in recorded_jobs:
+            recorded_jobs.add(job_id)
+            for var in job["variations"]:
+                history.add(session_id, var["content"])
+        show_variations(job["variations"], job["data"], job["content_type"], job["finished_at"])
+    elif job["status"] == FAILED:
+        st.error(f"Background job failed: {job['error']}")
     else:
-        st.error("Failed to generate variations. Please try again.")
+        watch_job(job_id)
 
 st.markdown("---")
 st.markdown("✨ **Powered by Groq AI** • Optimized for Fashion Marketing")
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""Load driver for the full generation pipeline against the mock Groq server.
+
+Usage (from the repo root):
+    python -m benchmarks.load --generations 200 --concurrency 16 --latency 0.3 \\
+        --tokens-per-sec 250 --rate-limit-rate 0.05 --error-rate 0.02 --stream
+
+Starts contify.mock_server in-process (or targets ``--url``), runs N
+``generate_variations`` calls from a thread pool through a real
+``GroqContentGenerator`` over HTTP, and reports throughput, latency
+percentiles and how often the pipeline fell back to template copy. ``--async``
+sends the same load through ``generate_variations_pooled`` (one event loop and
+connection pool) instead of a worker thread per variation. ``--latency-budget``
+caps each variation's wait for the model (template copy past the deadline).
+Per-stage latencies (prompt build, queue wait, TTFT, LLM, post-processing) are
+printed at the end; ``--trace`` also writes every span to a JSONL file and
+``--metrics-file`` the Prometheus text exposition.
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.hot_paths import CONTENT_TYPES, percentile, synthetic_catalog
+from contify.generator import GroqContentGenerator, VARIATION_COUNT
+from contify.mock_server import add_settings_arguments, server_url, settings_from_args, start_server
+from contify.rate_limit import RateLimiter
+from contify.router import ROUTED_MODELS
+from contify.telemetry import Telemetry
+
+
+def run_load(generator: GroqContentGenerator, catalog: list, generations: int, concurrency: int,
+             model: str, streaming: bool, parallel: bool, single_call: bool = False,
+             use_async: bool = False) -> dict:
+    latencies = []
+    fallbacks = [0]
+    lock = threading.Lock()
+
+    def one(i: int):
+        data = catalog[i % len(catalog)]
+        start = time.perf_counter()
+        generate = generator.generate_variations_pooled if use_async else generator.generate_variations
+        records = generate(data, data['category'], model, streaming, parallel,
+                           use_cache=False, single_call=single_call)
+        elapsed = time.perf_counter() - start
+        # Failed calls, missed latency budgets and replies that stayed invalid all ship template copy
+        template = sum(1 for record in records if record["metrics"].get("fallback") or record["metrics"].get("failed"))
+        with lock:
+            latencies.append(elapsed)
+            fallbacks[0] += template + VARIATION_COUNT - len(records)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(generations)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "generations": generations,
+        "wall_seconds": round(wall, 2),
+        "generations_per_sec": round(generations / wall, 2),
+        "variations_per_sec": round(generations * VARIATION_COUNT / wall, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "fallback_rate": round(fallbacks[0] / (generations * VARIATION_COUNT), 4)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the generation pipeline against a mock Groq API")
+    parser.add_argument("--url", help="Use an already running mock server instead of starting one")
+    parser.add_argument("--generations", type=int, default=100, help="generate_variations calls to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent generations")
+    parser.add_argument("--model", default="llama-3.1-8b-instant", help="Model name, or 'auto' for routing")
+    parser.add_argument("--content-type", choices=CONTENT_TYPES, help="Use one content type for every product")
+    parser.add_argument("--products", type=int,
+                        help="Distinct products to cycle through (default: one per generation); "
+                             "fewer products means more identical concurrent requests")
+    parser.add_argument("--stream", action="store_true", help="Use streaming completions")
+    parser.add_argument("--sequential-variations", action="store_true",
+                        help="Generate each product's variations one after another")
+    parser.add_argument("--single-call", action="store_true", help="Request all variations in one call")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Use the async client on the shared event loop and connection pool")
+    parser.add_argument("--latency-budget", type=float,
+                        help="Seconds a variation may wait for the model before falling back to template copy")
+    parser.add_argument("--trace", help="Append per-variation stage spans to this JSONL file")
+    parser.add_argument("--metrics-file", help="Write Prometheus metrics to this file at the end")
+    parser.add_argument("--client-rpm", type=float, default=1e9, help="Client-side RPM limit per model")
+    parser.add_argument("--client-tpm", type=float, default=1e12, help="Client-side TPM limit per model")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if not url:
+        server = start_server(settings_from_args(args))
+        url = server_url(server)
+
+    limits = {"rpm": args.client_rpm, "tpm": args.client_tpm}
+    generator = GroqContentGenerator(
+        api_key="gsk_mock", base_url=url,
+        rate_limiter=RateLimiter({model: limits for model in [args.model, "default", *ROUTED_MODELS]}, base_delay=0.2),
+        on_error=lambda message: None,
+        latency_budget=args.latency_budget,
+        telemetry=Telemetry(trace_path=args.trace)
+    )
+
+    catalog = synthetic_catalog(max(args.products or args.generations, 1), seed=args.seed or 0)
+    if args.content_type:
+        for product in catalog:
+            product['category'] = args.content_type
+    random.Random(args.seed).shuffle(catalog)
+
+    result = run_load(generator, catalog, args.generations, args.concurrency, args.model,
+                      args.stream, not args.sequential_variations, args.single_call, args.use_async)
+
+    print(f"Target: {url} ({'streaming' if args.stream else 'non-streaming'}, {'async' if args.use_async else 'threads'}, "
+          f"concurrency {args.concurrency})")
+    for name, value in result.items():
+        print(f"  {name:<22} {value}")
+    print(f"  {'client_limiter':<22} {generator.rate_limiter.metrics()}")
+    print(f"  {'coalescer':<22} {generator.coalescer.metrics()}")
+    print(f"  {'router':<22} {generator.router.metrics()}")
+    if args.latency_budget:
+        print(f"  {'deadline':<22} {generator.deadline_stats}")
+    summary = generator.telemetry.summary()
+    for stage, stats in summary["stages"].items():
+        print(f"  {'stage ' + stage:<22} p50 {stats['p50_ms']} ms • p95 {stats['p95_ms']} ms • "
+              f"max {stats['max_ms']} ms ({stats['count']} samples)")
+    print(f"  {'tokens':<22} {summary['tokens']}")
+    print(f"  {'outcomes':<22} {summary['outcomes']}")
+    if args.metrics_file:
+        generator.telemetry.write_textfile(args.metrics_file)
+    if server is not None:
+        print(f"  {'server':<22} {server.RequestHandlerClass.settings.stats}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
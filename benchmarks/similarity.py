@@ -0,0 +1,122 @@
+"""Accuracy and lookup-cost check for near-duplicate detection.
+
+Usage (from the repo root):
+    python -m benchmarks.similarity
+    python -m benchmarks.similarity --size 50000 --pairs 2000
+
+Builds short ads (headline, one or two body lines, CTA) from the sample copy
+in contify.fake_llm and measures, on the real ``simhash`` and
+``SimilarityIndex``:
+
+    detection     share of one- and two-word edits the index finds
+    false matches share of different ads for the same product it reports
+    candidates    entries a lookup compares against, with ``--size`` random
+                  fingerprints indexed
+
+Exits non-zero if any of them drifts past the limits pinned below, so a
+change to the fingerprint, bands or distance that trades accuracy for speed
+(or the other way round) shows up.
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.hot_paths import FABRICS, GARMENTS
+from contify.fake_llm import SAMPLE_OUTPUTS
+from contify.similarity import FINGERPRINT_BITS, SimilarityIndex, simhash
+
+# Pinned limits
+MIN_ONE_EDIT_DETECTION = 0.97
+MIN_TWO_EDIT_DETECTION = 0.85
+MAX_FALSE_MATCHES = 0.002
+# Per lookup, as a share of the indexed entries (about 1/240 expected)
+MAX_CANDIDATE_SHARE = 1 / 150
+
+CTAS = ["Shop Now", "Get Yours", "Order Today", "Find Yours", "Shop The Edit"]
+FILLER = ["soft", "bright", "festive", "easy", "fresh", "classic", "modern", "light", "rich", "bold",
+          "evening", "summer", "weekend", "wedding", "pooja", "dinner", "gift", "colour", "detail", "drape"]
+
+
+def copy_lines() -> tuple:
+    """(headlines, body lines) from the sample copy, labels and headers left out"""
+    lines = [line.strip() for text in SAMPLE_OUTPUTS.values() for line in text.split("\n")
+             if len(line.split()) >= 3 and ":" not in line]
+    return [line for line in lines if len(line.split()) <= 6], [line for line in lines if len(line.split()) > 6]
+
+
+def ad(rng: random.Random, product: str, headline: str, bodies: list) -> str:
+    return "\n".join([f"{headline} for your {product}"] + bodies + [rng.choice(CTAS)])
+
+
+def edit(rng: random.Random, text: str, words: int) -> str:
+    """text with words random words replaced"""
+    tokens = text.split(" ")
+    for _ in range(words):
+        tokens[rng.randrange(len(tokens))] = rng.choice(FILLER)
+    return " ".join(tokens)
+
+
+def accuracy(pairs: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    headlines, bodies = copy_lines()
+    found = {"one_edit": 0, "two_edits": 0, "false_matches": 0}
+    for _ in range(pairs):
+        product = f"{rng.choice(FABRICS)} {rng.choice(GARMENTS)}".lower()
+        first, second = rng.sample(headlines, 2)
+        lines = rng.sample(bodies, 4)
+        body_count = rng.choice([1, 2])
+        text = ad(rng, product, first, lines[:body_count])
+        other = ad(rng, product, second, lines[2:2 + body_count])
+
+        index = SimilarityIndex()
+        index.add_text("original", text)
+        found["one_edit"] += bool(index.query(simhash(edit(rng, text, 1))))
+        found["two_edits"] += bool(index.query(simhash(edit(rng, text, 2))))
+        found["false_matches"] += bool(index.query(simhash(other)))
+    return {name: count / pairs for name, count in found.items()}
+
+
+def lookup_cost(size: int, queries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    index = SimilarityIndex()
+    for key in range(size):
+        index.add(key, rng.getrandbits(FINGERPRINT_BITS))
+    started = time.perf_counter()
+    candidates = sum(len(index.candidates(rng.getrandbits(FINGERPRINT_BITS))) for _ in range(queries))
+    elapsed = time.perf_counter() - started
+    return {"candidates": candidates / queries, "lookup_us": elapsed / queries * 1e6}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Near-duplicate detection accuracy and lookup cost")
+    parser.add_argument("--size", type=int, default=20000, help="Random fingerprints indexed for the cost check")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pairs", type=int, default=1000, help="Ads edited for the accuracy check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rates = accuracy(args.pairs, args.seed)
+    cost = lookup_cost(args.size, args.queries, args.seed)
+    print(f"one-word edits found   {rates['one_edit']:.1%}")
+    print(f"two-word edits found   {rates['two_edits']:.1%}")
+    print(f"false matches          {rates['false_matches']:.2%}")
+    print(f"candidates per lookup  {cost['candidates']:.1f} of {args.size} "
+          f"({cost['candidates'] / args.size:.2%}), {cost['lookup_us']:.0f} us")
+
+    failures = []
+    if rates["one_edit"] < MIN_ONE_EDIT_DETECTION:
+        failures.append(f"one-word edit detection below {MIN_ONE_EDIT_DETECTION:.0%}")
+    if rates["two_edits"] < MIN_TWO_EDIT_DETECTION:
+        failures.append(f"two-word edit detection below {MIN_TWO_EDIT_DETECTION:.0%}")
+    if rates["false_matches"] > MAX_FALSE_MATCHES:
+        failures.append(f"false matches above {MAX_FALSE_MATCHES:.1%}")
+    if cost["candidates"] > args.size * MAX_CANDIDATE_SHARE:
+        failures.append(f"more than 1/{round(1 / MAX_CANDIDATE_SHARE)} of the index compared per lookup")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""Content generation core shared by the Streamlit app and batch jobs.
+
+Nothing in this package imports Streamlit or pandas, so it can be loaded from
+workers, batch jobs and benchmarks without starting a UI.
+"""
+from contify.prompt_builder import ImprovedPromptBuilder
+from contify.generator import GroqContentGenerator
+
+__all__ = ["GroqContentGenerator", "ImprovedPromptBuilder"]
@@ -0,0 +1,121 @@
+"""Process-wide asyncio runtime and pooled HTTP client for Groq calls.
+
+Streamlit runs every session's script on its own thread. Instead of each
+session fanning out worker threads with their own connections, async
+generation runs on one event loop thread per process, and every ``AsyncGroq``
+client on it shares a single ``httpx.AsyncClient``. Keep-alive connections
+(HTTP/2 when the ``h2`` package is installed) are therefore reused across
+sessions, and a TLS handshake is only paid when the pool grows.
+
+Pool size and timeouts come from the environment:
+
+    GROQ_POOL_MAX_CONNECTIONS   open connections in total (default 100)
+    GROQ_POOL_MAX_KEEPALIVE     idle connections kept open (default 20)
+    GROQ_POOL_KEEPALIVE_EXPIRY  seconds an idle connection is kept (default 30)
+    GROQ_CONNECT_TIMEOUT        seconds to establish a connection (default 5)
+    GROQ_READ_TIMEOUT           seconds to wait for response data (default 60)
+    GROQ_HTTP2                  "1"/"0" to force HTTP/2 on or off (default: on if h2 is installed)
+"""
+import asyncio
+import atexit
+import importlib.util
+import os
+import threading
+
+import httpx
+from groq import AsyncGroq
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class PoolSettings:
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20, keepalive_expiry: float = 30.0,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0, http2: bool = None):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        # HTTP/2 needs the optional h2 package (pip install "httpx[http2]")
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+
+    @classmethod
+    def from_env(cls) -> "PoolSettings":
+        http2 = os.getenv("GROQ_HTTP2")
+        return cls(
+            max_connections=int(_env_float("GROQ_POOL_MAX_CONNECTIONS", 100)),
+            max_keepalive=int(_env_float("GROQ_POOL_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=_env_float("GROQ_POOL_KEEPALIVE_EXPIRY", 30.0),
+            connect_timeout=_env_float("GROQ_CONNECT_TIMEOUT", 5.0),
+            read_timeout=_env_float("GROQ_READ_TIMEOUT", 60.0),
+            http2=None if not http2 else http2.lower() in ("1", "true", "yes")
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_keepalive,
+                            keepalive_expiry=self.keepalive_expiry)
+
+
+class AsyncRuntime:
+    """An event loop on a daemon thread that owns one pooled httpx.AsyncClient"""
+
+    def __init__(self, settings: PoolSettings = None):
+        self.settings = settings or PoolSettings.from_env()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="contify-async", daemon=True)
+        self._thread.start()
+        self.http_client = self.run(self._open_client())
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    async def _open_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(limits=self.settings.limits(), timeout=self.settings.timeout(),
+                                 http2=self.settings.http2)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop from any thread; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """Run a coroutine on the loop and block the calling thread until it finishes"""
+        return self.submit(coro).result(timeout)
+
+    def groq_client(self, api_key: str, base_url: str = None) -> AsyncGroq:
+        """AsyncGroq client for this key, sending through the shared connection pool"""
+        with self._lock:
+            key = (api_key, base_url)
+            if key not in self._clients:
+                # Retries are handled by the rate limiter, as for the sync client
+                self._clients[key] = AsyncGroq(api_key=api_key, base_url=base_url, max_retries=0,
+                                               timeout=self.settings.timeout(), http_client=self.http_client)
+            return self._clients[key]
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        if self.loop.is_running():
+            self.run(self.http_client.aclose(), timeout=5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=5)
+        self.loop.close()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_runtime(settings: PoolSettings = None) -> AsyncRuntime:
+    """The process-wide runtime, started on first use (settings only apply then)"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AsyncRuntime(settings)
+            atexit.register(_shared.close)
+        return _shared
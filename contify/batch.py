@@ -0,0 +1,385 @@
+"""Headless batch campaigns: a CSV/JSONL catalog in, generated copy out.
+
+Usage:
+    python -m contify.batch products.csv -o campaign.jsonl --content-type PMAX --concurrency 8 \\
+        --compliance-report compliance.csv
+
+Every input row is one product ``data`` dict (the same keys the Streamlit form
+builds). Output is appended one product at a time, so an interrupted run can be
+restarted with the same arguments: it skips products already written, drops a
+record the crash cut short and generates only the variations still missing.
+Rows that cannot be read (an unknown content type, a non-numeric discount) are
+counted as failed and the rest of the catalog still runs.
+Re-running a finished PMAX batch with ``--compliance-report`` therefore only
+checks the existing output.
+
+``--dedupe`` keeps a ``SimilarityIndex`` of all copy written so far (including
+output from earlier runs) and regenerates variations that nearly repeat it, so
+two products never ship the same lines. Each check costs a few bucket lookups,
+not a comparison against the whole catalog.
+
+With ``--brands``, rows that carry a ``brand_id`` are written with that brand's
+stored profile (voice, banned words, CTAs and greetings).
+
+``--rpm`` / ``--tpm`` set the client-side rate limits per model, for accounts
+above the free tier or several batches sharing one key.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contify.brands import BrandStore
+from contify.cache import ResponseCache
+from contify.generator import DEDUPE_ATTEMPTS, GroqContentGenerator
+from contify.pmax import batch_compliance, print_summary, write_report
+from contify.rate_limit import RateLimiter
+from contify.router import AUTO_MODEL
+from contify.similarity import SimilarityIndex
+
+CONTENT_TYPES = ["Email Subject Lines", "Long Content", "Concise Content", "PMAX", "WhatsApp Broadcast"]
+
+DEFAULT_CHAR_LIMITS = {
+    "Email Subject Lines": 200,
+    "WhatsApp Broadcast": 400,
+    "Concise Content": 120,
+    "Long Content": 300,
+    "PMAX": {'headlines': 30, 'description': 90, 'long_headlines': 120}
+}
+
+# Bytes read at a time when looking back for the last complete record
+READ_BLOCK = 64 * 1024
+
+OUTPUT_FIELDS = ["product_id", "content_type", "variation", "style", "content",
+                 "char_count", "word_count", "model_used", "generation_time"]
+
+
+def read_products(path: str) -> list:
+    """Load product rows from a .csv or .jsonl file"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            return [dict(row) for row in csv.DictReader(f)]
+
+    products = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                products.append(json.loads(line))
+    return products
+
+
+def read_output(path: str) -> list:
+    """Records already in a JSONL/CSV output file; a partial record left by a crash is skipped"""
+    if not os.path.exists(path):
+        return []
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            # A cut-off row comes back with its trailing fields missing
+            return [row for row in csv.DictReader(f) if None not in row.values()]
+
+        records = []
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def normalize_product(row: dict, index: int, content_type: str) -> tuple:
+    """Return (product_id, content_type, data) with the defaults the UI applies"""
+    row = {k: v for k, v in row.items() if v not in (None, "")}
+    product_id = str(row.pop("id", None) or row.pop("sku", None) or index)
+    content_type = row.get("category") or content_type
+    if content_type not in CONTENT_TYPES:
+        raise ValueError(f"Product {product_id}: unknown content type '{content_type}'")
+
+    char_limit = row.get("char_limit", DEFAULT_CHAR_LIMITS[content_type])
+    if content_type == "PMAX":
+        char_limit = DEFAULT_CHAR_LIMITS["PMAX"]
+    elif isinstance(char_limit, str):
+        char_limit = int(char_limit)
+
+    data = {
+        'brand': row.get('brand', "Premium Brand"),
+        'category': content_type,
+        'tone': row.get('tone', "Premium & Aspirational"),
+        'product': row.get('product', "Premium Collection"),
+        'usp': row.get('usp', "Premium Quality"),
+        'attributes': row.get('attributes', "Expertly crafted"),
+        'fabric': row.get('fabric', "Premium materials"),
+        'festival': row.get('festival', "Special occasion"),
+        'discount': int(float(row.get('discount', 0))),
+        'timing': row.get('timing', "Limited time"),
+        'char_limit': char_limit,
+        'emotion': row.get('emotion', "Exclusive luxury")
+    }
+    if row.get('brand_id'):
+        data['brand_id'] = row['brand_id']
+    return product_id, content_type, data
+
+
+class BatchWriter:
+    """Append-only JSONL/CSV sink that also remembers which variations are on disk"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = "csv" if path.endswith(".csv") else "jsonl"
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._cut_partial_record()
+        self.written = self._load_written()
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def _cut_partial_record(self):
+        """Drop the unterminated record a crash can leave at the end, so appends start on a fresh line"""
+        terminator = b"\r\n" if self.format == "csv" else b"\n"
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(0, end - len(terminator)))
+            if end == 0 or f.read() == terminator:
+                return
+            while end > 0:
+                start = max(0, end - READ_BLOCK)
+                f.seek(start)
+                # Overlap the previous block by a byte so a split "\r\n" is still found
+                found = f.read(end - start + len(terminator) - 1).rfind(terminator)
+                if found != -1:
+                    f.truncate(start + found + len(terminator))
+                    return
+                end = start
+            f.truncate(0)
+
+    def _load_written(self) -> dict:
+        """product id -> variation numbers already written"""
+        written = {}
+        for record in read_output(self.path):
+            if record.get("product_id") is not None and record.get("variation") is not None:
+                written.setdefault(str(record["product_id"]), set()).add(int(record["variation"]))
+        return written
+
+    def missing(self, product_id: str, variations: int) -> list:
+        """Variation numbers of a product not on disk yet"""
+        written = self.written.get(product_id, ())
+        return [n for n in range(1, variations + 1) if n not in written]
+
+    def write(self, records: list):
+        """Write one product's new variations and flush them to disk together"""
+        with self._lock:
+            for record in records:
+                if self.format == "csv":
+                    self._csv.writerow({k: record.get(k) for k in OUTPUT_FIELDS})
+                else:
+                    self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            for record in records:
+                self.written.setdefault(record["product_id"], set()).add(record["variation"])
+
+    def close(self):
+        self._file.close()
+
+
+class BatchRunner:
+    """Generate every variation for every product with bounded concurrency"""
+
+    def __init__(self, generator, model: str, concurrency: int = 4, variations: int = 3,
+                 on_progress=None, single_call: bool = False, dedupe: bool = False):
+        self.generator = generator
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.variations = variations
+        self.on_progress = on_progress
+        self.single_call = single_call
+        self.index = SimilarityIndex() if dedupe else None
+        self._stats_lock = threading.Lock()
+        self.stats = {"total": 0, "skipped": 0, "done": 0, "failed": 0, "regenerated": 0}
+
+    def remember(self, records):
+        """Index copy written earlier so new products are checked against it too"""
+        for record in records:
+            if record.get("content"):
+                self.index.add_text(f"{record['product_id']}/v{record['variation']}", record["content"])
+
+    def _generate_product(self, product_id: str, content_type: str, data: dict, variation_numbers: list) -> list:
+        metrics = {}
+
+        def collect_metrics(variation_number: int, values: dict):
+            metrics[variation_number] = values
+
+        contents = {}
+        if self.single_call:
+            contents = self.generator.generate_combined(data, variation_numbers, content_type, self.model,
+                                                        on_metrics=collect_metrics)
+        for variation_number in variation_numbers:
+            if variation_number not in contents:
+                contents[variation_number] = self.generator.generate_single_variation(
+                    data, variation_number, content_type, self.model, on_metrics=collect_metrics
+                )
+
+        if self.index is not None:
+            for attempt in range(1, DEDUPE_ATTEMPTS + 1):
+                # Template fallbacks are left alone
+                duplicates = [n for n in self.generator.near_duplicates(contents, self.index)
+                              if self.generator.from_model(metrics.get(n))]
+                if not duplicates:
+                    break
+                with self._stats_lock:
+                    self.stats["regenerated"] += len(duplicates)
+                for variation_number in duplicates:
+                    contents[variation_number] = self.generator.generate_single_variation(
+                        data, variation_number, content_type, self.model, on_metrics=collect_metrics, attempt=attempt
+                    )
+            for variation_number, content in contents.items():
+                self.index.add_text(f"{product_id}/v{variation_number}", content)
+
+        records = []
+        for variation_number in variation_numbers:
+            values = metrics.get(variation_number, {})
+            record = self.generator.variation_record(variation_number, contents[variation_number],
+                                                     values.get("model", self.model), values.get("routing"))
+            record.update({"product_id": product_id, "content_type": content_type})
+            records.append(record)
+        return records
+
+    def run(self, products: list, writer: BatchWriter, content_type: str) -> dict:
+        self.stats["total"] = len(products)
+        pending = []
+        for index, row in enumerate(products):
+            try:
+                product_id, row_content_type, data = normalize_product(row, index, content_type)
+            except ValueError as e:
+                self.stats["failed"] += 1
+                print(f"Row {index} skipped: {e}", file=sys.stderr)
+                continue
+            # A run interrupted part-way through a product left some of its variations behind
+            missing = writer.missing(product_id, self.variations)
+            if missing:
+                pending.append((product_id, row_content_type, data, missing))
+            else:
+                self.stats["skipped"] += 1
+        self._report()
+
+        # Keep at most `concurrency` products in flight so memory stays flat on large catalogs
+        queue = iter(pending)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                while len(in_flight) < self.concurrency:
+                    job = next(queue, None)
+                    if job is None:
+                        break
+                    in_flight[executor.submit(self._generate_product, *job)] = job[0]
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    product_id = in_flight.pop(future)
+                    try:
+                        writer.write(future.result())
+                        self.stats["done"] += 1
+                    except Exception as e:
+                        self.stats["failed"] += 1
+                        print(f"Product {product_id} failed: {e}", file=sys.stderr)
+                    self._report()
+
+        return self.stats
+
+    def _report(self):
+        if self.on_progress:
+            self.on_progress(dict(self.stats))
+
+
+def record_banned_words(generator, products: list, content_type: str):
+    """A function giving an output record the banned words of its product's brand"""
+    brand_ids = {}
+    for index, row in enumerate(products):
+        try:
+            product_id, _, data = normalize_product(row, index, content_type)
+        except ValueError:
+            continue
+        brand_ids[product_id] = data.get("brand_id")
+
+    def banned_words(record: dict) -> list:
+        return generator.builder_for({"brand_id": brand_ids.get(str(record["product_id"]))}).banned_words
+    return banned_words
+
+
+def _print_progress(started: float):
+    def report(stats: dict):
+        processed = stats["done"] + stats["failed"]
+        remaining = stats["total"] - stats["skipped"]
+        rate = processed / max(time.time() - started, 1e-6)
+        print(f"\r[{processed}/{remaining}] done={stats['done']} failed={stats['failed']} "
+              f"skipped={stats['skipped']} regenerated={stats['regenerated']} ({rate:.2f} products/s)",
+              end="", file=sys.stderr, flush=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate campaign copy for a product catalog")
+    parser.add_argument("input", help="CSV or JSONL file of product rows")
+    parser.add_argument("-o", "--output", required=True, help="JSONL or CSV file to append results to")
+    parser.add_argument("--content-type", default="Concise Content", choices=CONTENT_TYPES,
+                        help="Used for rows without a 'category' column")
+    parser.add_argument("--model", default="llama-3.1-8b-instant",
+                        help=f"Model name, or '{AUTO_MODEL}' to route each variation by live latency and load")
+    parser.add_argument("--concurrency", type=int, default=4, help="Products generated at the same time")
+    parser.add_argument("--variations", type=int, default=3)
+    parser.add_argument("--single-call", action="store_true",
+                        help="Request all of a product's variations in one API call")
+    parser.add_argument("--cache", help="SQLite response cache to reuse identical requests across runs")
+    parser.add_argument("--seed", type=int, help="Seed prompt randomness so the run can be replayed exactly")
+    parser.add_argument("--brands", help="SQLite brand profile store; rows with a brand_id use that brand's profile")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Regenerate variations that nearly repeat copy already in the output")
+    parser.add_argument("--rpm", type=float, help="Requests per minute allowed per model (default: GROQ_RPM_LIMIT "
+                                                  "or the free-tier limit)")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute allowed per model (default: GROQ_TPM_LIMIT "
+                                                  "or the free-tier limit)")
+    parser.add_argument("--compliance-report", metavar="CSV",
+                        help="After the run, check every PMAX asset group in the output and write a report")
+    args = parser.parse_args(argv)
+
+    try:
+        generator = GroqContentGenerator(cache=ResponseCache(args.cache) if args.cache else None, seed=args.seed,
+                                         brands=BrandStore(args.brands, seed=args.seed) if args.brands else None,
+                                         rate_limiter=RateLimiter.from_env(args.rpm, args.tpm))
+    except ValueError as e:
+        sys.exit(str(e))
+    if not generator.ensure_connection():
+        sys.exit("Could not reach the Groq API")
+
+    products = read_products(args.input)
+    writer = BatchWriter(args.output)
+    runner = BatchRunner(generator, args.model, args.concurrency, args.variations,
+                         on_progress=_print_progress(time.time()), single_call=args.single_call, dedupe=args.dedupe)
+    if args.dedupe and writer.written:
+        runner.remember(read_output(args.output))
+    try:
+        stats = runner.run(products, writer, args.content_type)
+    finally:
+        writer.close()
+    print(f"\nFinished: {stats['done']} generated, {stats['skipped']} already done, "
+          f"{stats['failed']} failed, {stats['regenerated']} near-duplicates regenerated", file=sys.stderr)
+
+    if args.compliance_report:
+        table, report = batch_compliance(read_output(args.output),
+                                         record_banned_words(generator, products, args.content_type))
+        write_report(report, args.compliance_report)
+        print_summary(table, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Brand profiles, stored once and served to every request for that brand.
+
+A profile holds what used to be typed into the sidebar on every run (name,
+USP, tone, default fabrics) plus the brand's own rules: extra banned words,
+preferred CTAs and greetings, and a free-text voice. Profiles live in a SQLite
+file shared by the app, job workers and batch runs; each save bumps the
+profile's version. Ids are fixed when a brand is created, so renaming a brand
+never lets it collide with, or be overwritten by, another.
+
+``BrandStore.builder`` returns an ``ImprovedPromptBuilder`` loaded with the
+profile and with every template already compiled. Builders are kept in an LRU
+of ``max_builders`` brands, so hundreds of brands are served from one process
+without rebuilding anything per request. A save through the store drops the
+brand's builder at once; saves from other processes are picked up within
+``refresh_seconds``, when the cached builder's version is checked again.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from contify.prompt_builder import ImprovedPromptBuilder
+
+# Profile fields: free text, then lists
+TEXT_FIELDS = ["name", "usp", "tone", "voice"]
+LIST_FIELDS = ["fabrics", "banned_words", "ctas", "greetings"]
+
+# Seconds a cached builder is trusted before its version is checked against the file
+REFRESH_SECONDS = 5.0
+
+
+def brand_id(name: str) -> str:
+    """Stable id for a brand name: lower case, runs of anything else collapsed to '-'"""
+    return re.sub(r"[^a-z0-9]+", "-", name.casefold()).strip("-")
+
+
+def normalize_profile(profile: dict) -> dict:
+    """Trimmed text fields and de-duplicated lists (comma-separated strings are split)"""
+    name = (profile.get("name") or "").strip()
+    if not name:
+        raise ValueError("A brand profile needs a name")
+    normalized = {"id": profile.get("id") or None}
+    for field in TEXT_FIELDS:
+        normalized[field] = (profile.get(field) or "").strip()
+    for field in LIST_FIELDS:
+        values = profile.get(field) or []
+        if isinstance(values, str):
+            values = values.split(",")
+        seen = set()
+        normalized[field] = []
+        for value in values:
+            value = value.strip()
+            if value and value.casefold() not in seen:
+                seen.add(value.casefold())
+                normalized[field].append(value)
+    return normalized
+
+
+class _Cached:
+    __slots__ = ("version", "builder", "checked_at")
+
+    def __init__(self, version: int, builder: ImprovedPromptBuilder, checked_at: float):
+        self.version = version
+        self.builder = builder
+        self.checked_at = checked_at
+
+
+class BrandStore:
+    def __init__(self, path: str, max_builders: int = 1000, refresh_seconds: float = REFRESH_SECONDS,
+                 seed: int = None):
+        self.path = path
+        self.max_builders = max_builders
+        self.refresh_seconds = refresh_seconds
+        self.seed = seed
+        self._builders = OrderedDict()  # brand id -> _Cached, least recently used first
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "builds": 0, "invalidations": 0, "evictions": 0}
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS brands ("
+            "id TEXT PRIMARY KEY, name TEXT NOT NULL, profile TEXT NOT NULL, version INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        # Names are unique across processes too, not just within one store's lock
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS brands_name ON brands (name COLLATE NOCASE)")
+        self._db.commit()
+
+    def save(self, profile: dict) -> dict:
+        """Create a profile, or replace the one with the same id; returns it normalized, with its new version.
+
+        A profile without an id is a new brand: its id is a slug of its name, suffixed when a renamed
+        brand already holds that slug. Ids never change, so a renamed brand keeps its own. Raises
+        ValueError when another brand already has the name.
+        """
+        profile = normalize_profile(profile)
+        with self._lock:
+            named = self._db.execute("SELECT id FROM brands WHERE name = ? COLLATE NOCASE",
+                                     (profile["name"],)).fetchone()
+            if named is not None and named[0] != profile["id"]:
+                raise ValueError(f"A brand named '{profile['name']}' already exists")
+
+            row = None
+            if profile["id"] is None:
+                profile["id"] = self._free_id(brand_id(profile["name"]) or "brand")
+            else:
+                row = self._db.execute("SELECT version FROM brands WHERE id = ?", (profile["id"],)).fetchone()
+            profile["version"] = (row[0] if row else 0) + 1
+            values = (profile["name"], json.dumps(profile, ensure_ascii=False), profile["version"], time.time(),
+                      profile["id"])
+            try:
+                # An update, never INSERT OR REPLACE: that would delete another brand holding the name
+                if row is not None:
+                    self._db.execute("UPDATE brands SET name = ?, profile = ?, version = ?, updated_at = ? "
+                                     "WHERE id = ?", values)
+                else:
+                    self._db.execute("INSERT INTO brands (name, profile, version, updated_at, id) "
+                                     "VALUES (?, ?, ?, ?, ?)", values)
+                self._db.commit()
+            except sqlite3.IntegrityError as e:
+                # Another process saved a brand with this name, or created this id, in the meantime
+                self._db.rollback()
+                if "brands.name" in str(e):
+                    raise ValueError(f"A brand named '{profile['name']}' already exists")
+                raise ValueError(f"Brand id '{profile['id']}' is already taken")
+            self._drop(profile["id"])
+        return profile
+
+    def _free_id(self, slug: str) -> str:
+        """slug, or slug-2, slug-3, ... when a brand already has it"""
+        candidate, number = slug, 1
+        while self._db.execute("SELECT 1 FROM brands WHERE id = ?", (candidate,)).fetchone():
+            number += 1
+            candidate = f"{slug}-{number}"
+        return candidate
+
+    def get(self, brand: str):
+        """The stored profile, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT profile FROM brands WHERE id = ?", (brand,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self) -> list:
+        """[{"id", "name", "version"}] for every brand, by name"""
+        with self._lock:
+            rows = self._db.execute("SELECT id, name, version FROM brands ORDER BY name COLLATE NOCASE").fetchall()
+        return [{"id": row[0], "name": row[1], "version": row[2]} for row in rows]
+
+    def delete(self, brand: str):
+        with self._lock:
+            self._db.execute("DELETE FROM brands WHERE id = ?", (brand,))
+            self._db.commit()
+            self._drop(brand)
+
+    def builder(self, brand: str):
+        """The brand's prompt builder, compiled on first use and rebuilt when its profile changes; None if unknown"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._builders.get(brand)
+            if cached is not None and now - cached.checked_at < self.refresh_seconds:
+                self._builders.move_to_end(brand)
+                self.stats["hits"] += 1
+                return cached.builder
+
+            row = self._db.execute("SELECT version FROM brands WHERE id = ?", (brand,)).fetchone()
+            if row is None:
+                self._drop(brand)
+                return None
+            if cached is not None and cached.version == row[0]:
+                cached.checked_at = now
+                self._builders.move_to_end(brand)
+                self.stats["hits"] += 1
+                return cached.builder
+            if cached is not None:
+                self.stats["invalidations"] += 1
+
+            profile = json.loads(self._db.execute("SELECT profile FROM brands WHERE id = ?", (brand,)).fetchone()[0])
+            builder = ImprovedPromptBuilder(self.seed, profile).precompile()
+            self._builders[brand] = _Cached(profile["version"], builder, now)
+            self._builders.move_to_end(brand)
+            self.stats["builds"] += 1
+            while len(self._builders) > self.max_builders:
+                self._builders.popitem(last=False)
+                self.stats["evictions"] += 1
+            return builder
+
+    def _drop(self, brand: str):
+        if self._builders.pop(brand, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, cached_builders=len(self._builders))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
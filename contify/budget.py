@@ -0,0 +1,57 @@
+"""Completion budgets: how many tokens to allow and where a reply stops.
+
+Every request used to allow 800 completion tokens, whatever it asked for.
+``completion_budget`` sizes the allowance from what the ``_format_*`` handlers
+actually keep: the character limit for free-form copy, or the PMAX section
+limits and counts for asset sets. That leaves headroom for labels and overshoot,
+but not for rambling. ``STOP_SEQUENCES`` end a reply at the notes models tend
+to add after the copy. Streamed replies are also closed as soon as the copy is
+complete (see ``contify.incremental``).
+"""
+from contify.pmax import PMAX_COUNTS, PMAX_LIMITS
+from contify.templates import format_key
+
+# Rough size of an English token in characters
+CHARS_PER_TOKEN = 3.5
+
+# Models overshoot character limits and add labels and blank lines; a reply cut
+# short by the budget loses its call to action, so free-form copy gets double
+PROSE_SLACK = 2.0
+PMAX_SLACK = 1.5
+
+OVERHEAD_TOKENS = 32
+MIN_TOKENS = 96
+# The old flat allowance, still the ceiling
+MAX_TOKENS = 800
+
+# JSON keys, quotes and escapes around each variation of a combined reply
+COMBINED_OVERHEAD_TOKENS = 24
+
+# Matches the prompt builder's default
+DEFAULT_CHAR_LIMIT = 300
+
+# Only explicit notes: blank lines and "Variation" can be part of the copy itself.
+# Streamed replies are closed once complete anyway (see contify.incremental)
+STOP_SEQUENCES = ["\nNote:", "\n*Note"]
+
+
+def _char_limit(char_limit) -> int:
+    try:
+        return int(char_limit)
+    except (TypeError, ValueError):
+        return DEFAULT_CHAR_LIMIT
+
+
+def completion_budget(content_type: str, char_limit=None) -> int:
+    """max_completion_tokens for one variation"""
+    if format_key(content_type) == "PMAX":
+        chars = sum(PMAX_LIMITS[section] * PMAX_COUNTS[section] for section in PMAX_LIMITS)
+        tokens = chars * PMAX_SLACK / CHARS_PER_TOKEN
+    else:
+        tokens = _char_limit(char_limit) * PROSE_SLACK / CHARS_PER_TOKEN
+    return int(min(MAX_TOKENS, max(MIN_TOKENS, tokens + OVERHEAD_TOKENS)))
+
+
+def combined_budget(content_type: str, char_limit, count: int) -> int:
+    """max_completion_tokens for one JSON reply holding count variations"""
+    return count * (completion_budget(content_type, char_limit) + COMBINED_OVERHEAD_TOKENS)
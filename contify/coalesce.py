@@ -0,0 +1,91 @@
+"""In-flight request coalescing.
+
+When several sessions or batch workers ask for the same generation at the
+same moment, only the first caller (the leader) does the work; the others
+wait on the leader's future and get the same result. Nothing is kept once the
+call finishes, so this complements ``ResponseCache`` rather than replacing it:
+the cache covers repeats over time, coalescing covers repeats that overlap.
+
+Futures are ``concurrent.futures.Future`` objects, so threaded callers and
+coroutines on the shared event loop can wait on each other's calls.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def request_key(*parts) -> str:
+    """Key for a generation request; surrounding and repeated whitespace is ignored"""
+    payload = json.dumps(_normalize(parts), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RequestCoalescer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _join(self, key: str) -> tuple:
+        """(future, is_leader) for key, registering a new in-flight call if there is none"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _settle(self, key: str, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self, key: str, fn) -> tuple:
+        """Return (result, coalesced): fn() for the first caller, its result for overlapping ones"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result, False
+
+    async def run_async(self, key: str, fn) -> tuple:
+        """run() for an `fn()` returning an awaitable; waits without blocking the event loop"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result, False
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats, in_flight=len(self._in_flight))
+        calls = stats["leaders"] + stats["coalesced"]
+        stats["coalesced_rate"] = round(stats["coalesced"] / calls, 4) if calls else 0.0
+        return stats
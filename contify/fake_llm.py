@@ -0,0 +1,207 @@
+"""In-process stand-in for the Groq client, for benchmarks and offline runs.
+
+``FakeGroq`` answers ``chat.completions.create`` with canned copy for the
+content type named in the prompt, in both streaming and non-streaming form,
+and can simulate network latency and generation speed. ``FakeAsyncGroq`` does
+the same for the async path. Replies honour ``max_completion_tokens`` and
+``stop``; ``ramble`` appends that many extra lines and a note after the copy,
+the way chatty models do, so budgets and early stream termination show up in
+benchmarks.
+"""
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+# Typical raw model output for each content type, labels and all
+SAMPLE_OUTPUTS = {
+    "PMAX": """Headlines:
+New Festive Kurta Sets
+Silk That Moves With You
+Handcrafted For Diwali
+Shop The Edit Today
+Your Festive Look Sorted
+Comfort Meets Occasion
+Made For Long Evenings
+Chanderi Done Right
+Light Fabric Big Moments
+Fresh Drops This Week
+Find Your Festive Fit
+Soft Silk Sharp Lines
+Dress Up Without Effort
+Ready For Every Pooja
+Limited Pieces Available
+
+Descriptions:
+Lightweight silk kurta sets cut for comfort through every festive gathering this season.
+Handwoven chanderi with fine detailing, made to pair with your favourite jewellery.
+From morning pooja to late dinners, one set that keeps up with the whole day.
+Thoughtful tailoring and breathable fabric so you can focus on the people around you.
+Order today and get your festive wardrobe ready before the rush begins.
+
+Long Headlines:
+Festive Kurta Sets In Soft Silk, Tailored For Long Celebrations With Family And Friends
+Handcrafted Chanderi Pieces That Bring Quiet Detail To Every Festive Evening
+Your Diwali Wardrobe, Sorted With Breathable Sets Made For All-Day Comfort
+Light Fabrics, Rich Colours And Easy Silhouettes For Every Festive Occasion
+Shop The New Festive Edit Before Your Favourite Sizes Are Gone""",
+    "Email Subject Lines": """Variation 1
+Subject: **Your festive wardrobe just got an upgrade**
+Soft silk kurta sets made for long evenings with family, cut to move easily from pooja to dinner.
+Shop Now""",
+    "WhatsApp Broadcast": """Hey gorgeous, the festive edit is here
+Soft silk kurta sets that feel as good as they look.
+Cut for comfort so you can enjoy every moment of the evening.
+Pair them with your favourite jewellery for an easy festive look.
+Shop Now""",
+    "Long Content": """Headline: Fresh styles just in for the festive season
+Our new kurta sets are cut from soft silk with fine hand detailing on every neckline.
+They are made for long celebrations, staying light and comfortable from morning to night.
+Get Yours""",
+    "Concise Content": """Line 1: Festive ready in soft silk
+Line 2: Breathable kurta sets with hand detailing, made for long celebrations.
+Line 3: Shop Now"""
+}
+
+FORMAT_MARKERS = {
+    "CREATE GOOGLE ADS": "PMAX",
+    "CREATE EMAIL": "Email Subject Lines",
+    "CREATE WHATSAPP": "WhatsApp Broadcast",
+    "CREATE STORY": "Long Content",
+    "CREATE CONCISE": "Concise Content"
+}
+
+
+def detect_content_type(messages: list) -> str:
+    prompt = messages[-1]["content"] if messages else ""
+    for marker, content_type in FORMAT_MARKERS.items():
+        if marker in prompt:
+            return content_type
+    return None
+
+
+def ramble_text(lines: int) -> str:
+    """Copy-like lines past what was asked for, then a note"""
+    if not lines:
+        return ""
+    extra = "".join(f"\nOne more idea {n}, soft silk kurta sets for every festive evening" for n in range(1, lines + 1))
+    return extra + "\nNote: Feel free to mix and match these lines."
+
+
+def canned_reply(messages: list, response_format: dict = None, outputs: dict = None, ramble: int = 0) -> str:
+    """Canned text for a request, wrapped as JSON when several variations were asked for"""
+    text = (outputs or SAMPLE_OUTPUTS).get(detect_content_type(messages), "OK")
+    if (response_format or {}).get("type") != "json_object":
+        return text + ramble_text(ramble)
+    prompt = messages[-1]["content"] if messages else ""
+    numbers = [int(n) for n in re.findall(r"=== VARIATION (\d+) ===", prompt)] or [1]
+    return json.dumps({"variations": [{"variation": n, "content": text} for n in numbers]})
+
+
+def tokenize(text: str) -> list:
+    """Split text into word-sized pieces that re-join to the original string"""
+    pieces = text.split(" ")
+    return [piece + " " for piece in pieces[:-1]] + pieces[-1:]
+
+
+def limit_reply(text: str, max_completion_tokens: int = None, stop=None) -> tuple:
+    """(tokens, finish_reason) for text cut at the first stop sequence and at max_completion_tokens"""
+    for sequence in [stop] if isinstance(stop, str) else stop or []:
+        if sequence in text:
+            text = text[:text.index(sequence)]
+    tokens = tokenize(text)
+    if max_completion_tokens and len(tokens) > max_completion_tokens:
+        return tokens[:max_completion_tokens], "length"
+    return tokens, "stop"
+
+
+class FakeCompletions:
+    def __init__(self, latency: float = 0.0, tokens_per_sec: float = 0.0, outputs: dict = None, ramble: int = 0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.outputs = outputs or SAMPLE_OUTPUTS
+        self.ramble = ramble
+        self.calls = 0
+
+    def create(self, model: str, messages: list, stream: bool = False, response_format: dict = None, **params):
+        self.calls += 1
+        tokens, finish_reason = limit_reply(canned_reply(messages, response_format, self.outputs, self.ramble),
+                                            params.get("max_completion_tokens"), params.get("stop"))
+        text = "".join(tokens)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(m["content"]) for m in messages) // 4,
+            completion_tokens=len(tokens),
+            total_tokens=sum(len(m["content"]) for m in messages) // 4 + len(tokens)
+        )
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            return self._stream(model, tokens, usage, finish_reason)
+
+        if self.tokens_per_sec:
+            time.sleep(len(tokens) / self.tokens_per_sec)
+        message = SimpleNamespace(role="assistant", content=text)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+            usage=usage
+        )
+
+    def _stream(self, model: str, tokens: list, usage, finish_reason: str = "stop", sleep: bool = True):
+        delay = 1.0 / self.tokens_per_sec if self.tokens_per_sec and sleep else 0.0
+        for token in tokens:
+            if delay:
+                time.sleep(delay)
+            delta = SimpleNamespace(content=token)
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)],
+                                  x_groq=None)
+        final = SimpleNamespace(content=None)
+        yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=final, finish_reason=finish_reason)],
+                              x_groq=SimpleNamespace(usage=usage))
+
+
+class FakeGroq:
+    """Drop-in for ``groq.Groq`` when passed as ``GroqContentGenerator(client=...)``"""
+
+    def __init__(self, latency: float = 0.0, tokens_per_sec: float = 0.0, outputs: dict = None, ramble: int = 0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(latency, tokens_per_sec, outputs, ramble))
+
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(self, model: str, messages: list, stream: bool = False, response_format: dict = None, **params):
+        self.calls += 1
+        tokens, finish_reason = limit_reply(canned_reply(messages, response_format, self.outputs, self.ramble),
+                                            params.get("max_completion_tokens"), params.get("stop"))
+        text = "".join(tokens)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(m["content"]) for m in messages) // 4,
+            completion_tokens=len(tokens),
+            total_tokens=sum(len(m["content"]) for m in messages) // 4 + len(tokens)
+        )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if stream:
+            return self._stream_async(model, tokens, usage, finish_reason)
+
+        if self.tokens_per_sec:
+            await asyncio.sleep(len(tokens) / self.tokens_per_sec)
+        message = SimpleNamespace(role="assistant", content=text)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason=finish_reason)],
+            usage=usage
+        )
+
+    async def _stream_async(self, model: str, tokens: list, usage, finish_reason: str = "stop"):
+        for chunk in self._stream(model, tokens, usage, finish_reason, sleep=False):
+            if self.tokens_per_sec and chunk.choices[0].delta.content is not None:
+                await asyncio.sleep(1.0 / self.tokens_per_sec)
+            yield chunk
+
+
+class FakeAsyncGroq:
+    """Drop-in for ``groq.AsyncGroq`` when passed as ``GroqContentGenerator(async_client=...)``"""
+
+    def __init__(self, latency: float = 0.0, tokens_per_sec: float = 0.0, outputs: dict = None, ramble: int = 0):
+        self.chat = SimpleNamespace(completions=FakeAsyncCompletions(latency, tokens_per_sec, outputs, ramble))
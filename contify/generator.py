@@ -0,0 +1,1264 @@
+import os
+import json
+import asyncio
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from groq import Groq
+from dotenv import load_dotenv
+from contify.prompt_builder import ImprovedPromptBuilder, stable_seed
+from contify.async_runtime import shared_runtime
+from contify.brands import BrandStore
+from contify.budget import STOP_SEQUENCES, combined_budget, completion_budget
+from contify.cache import make_cache_key
+from contify.coalesce import RequestCoalescer, request_key
+from contify.incremental import StreamValidator
+from contify.rate_limit import RateLimiter, estimate_prompt_tokens, estimate_tokens
+from contify.router import AUTO_MODEL, ModelRouter
+from contify.streaming import StreamCollector
+from contify.postprocess import BODY, CTA, ParsedOutput, parse_output
+from contify.pmax import fit_section
+from contify.similarity import SimilarityIndex, simhash
+from contify.telemetry import Telemetry, span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How long a successful API call vouches for the connection
+HEALTH_TTL_SECONDS = int(os.getenv("GROQ_HEALTH_TTL", "300"))
+
+VARIATION_COUNT = 3
+
+# Rounds of regenerating near-duplicate variations before keeping them as they are
+DEDUPE_ATTEMPTS = 2
+
+# Fresh prompts asked for after a reply is rejected mid-stream (banned words, limits, refusals)
+INVALID_RETRIES = 1
+
+# Threads running model calls that are raced against the latency budget
+BACKGROUND_WORKERS = 32
+
+# Kept free of per-request details so it, and the rules that open every prompt,
+# form a stable prefix that provider-side prompt caching can reuse
+SYSTEM_PROMPT = "You are a professional fashion copywriter."
+
+# Cheapest possible request, used to check the API is reachable
+PROBE_PARAMS = {
+    "model": "llama-3.1-8b-instant",
+    "messages": [{"role": "user", "content": "Test"}],
+    "max_completion_tokens": 5
+}
+
+class GroqContentGenerator:
+    """UI-free generation core.
+
+    Anything a front end wants to show is reported through optional callbacks:
+    ``on_progress(fraction, text)``, ``on_stream(variation_number, text_so_far)``,
+    ``on_variation(variation_number, content)``, ``on_metrics(variation_number, metrics)``
+    and ``on_error(message)``. ``on_stream`` updates are throttled by ``StreamCollector``.
+    Callbacks passed to ``generate_variations`` may be invoked from worker threads.
+    ``generate_variations_pooled`` runs the async path instead, on one event loop thread and
+    HTTP connection pool shared by the whole process (see ``contify.async_runtime``). The sync
+    and async paths share the same steps (``_variation_steps``, ``_combined_steps``); on the
+    async path those steps, with their cache, brand store and telemetry I/O, run on worker threads.
+    With ``dedupe=True``, variations that nearly repeat another variation (or the session's
+    ``HistoryStore`` entries) are regenerated with a fresh prompt, up to ``DEDUPE_ATTEMPTS`` times.
+    
+    With ``latency_budget`` (seconds) set, each variation's model call is raced against the
+    budget while its fallback copy is built; past the deadline the fallback is returned and
+    the call finishes in the background, caching its result for the next identical request.
+    
+    Passing ``model=AUTO_MODEL`` lets ``router`` pick the model per variation from live latency,
+    error rate and rate-limit headroom, failing over to the next model before falling back to
+    template copy. The chosen model and the routing decision are reported in the variation's
+    ``model_used`` and ``routing`` fields.
+    
+    With a ``ResponseCache`` attached, prompts are seeded from the request inputs
+    so repeated requests hit the cache unless ``use_cache=False`` is passed. Regenerations of
+    near-duplicate copy never read or write the cache.
+    
+    Every variation's metrics carry ``stages_ms`` (prompt build, queue wait, TTFT, LLM,
+    post-processing, fallback) and the token usage the API reported; ``telemetry``
+    aggregates them for Prometheus and JSONL traces (see ``contify.telemetry``).
+    
+    Completion budgets follow the content type and ``char_limit`` instead of a flat 800 tokens
+    (see ``contify.budget``). Replies are checked line by line by a ``StreamValidator``: streams
+    are closed once the format's lines are in, and a reply with banned words, overrunning PMAX
+    limits or a refusal is cut off and asked for again with a fresh prompt, up to
+    ``INVALID_RETRIES`` times; a reply still invalid after that is replaced by the fallback copy.
+    ``finish_reason``, ``rejected`` and ``invalid`` in the metrics say what happened.
+    
+    With a ``BrandStore`` attached, requests whose data carries a ``brand_id`` are built by that
+    brand's cached, precompiled prompt builder (its voice, banned words, CTAs and greetings).
+    """
+    
+    def __init__(self, api_key: str = None, on_error=None, cache=None, seed: int = None,
+                 rate_limiter: RateLimiter = None, client=None, base_url: str = None, async_client=None,
+                 latency_budget: float = None, router: ModelRouter = None, telemetry: Telemetry = None,
+                 brands: BrandStore = None):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        if client is None and (not self.api_key or not self.api_key.startswith("gsk_")):
+            raise ValueError("Invalid GROQ_API_KEY. Please check your .env file.")
+        
+        # Retries are handled by the rate limiter, which also honours retry-after.
+        # Any object with the Groq chat.completions interface can stand in (see contify.fake_llm),
+        # and base_url can point the real client at contify.mock_server
+        self.client = client or Groq(api_key=self.api_key, base_url=base_url, max_retries=0)
+        self.base_url = base_url
+        # The async client is created on first async use, on the shared pooled runtime.
+        # A stand-in sync client without an async counterpart disables the async path
+        self.async_client = async_client
+        self._async_supported = async_client is not None or client is None
+        self.rate_limiter = rate_limiter or RateLimiter.from_env()
+        # Fed by every call, whichever model was asked for, so automatic routing starts informed
+        self.router = router or ModelRouter(rate_limiter=self.rate_limiter)
+        if self.router.rate_limiter is None:
+            self.router.rate_limiter = self.rate_limiter
+        self.prompt_builder = ImprovedPromptBuilder(seed)
+        self.brands = brands
+        self.on_error = on_error or logger.warning
+        self.cache = cache
+        # Shares in-flight generations between concurrent callers with identical requests
+        self.coalescer = RequestCoalescer()
+        self.telemetry = telemetry or Telemetry.from_env()
+        
+        self.latency_budget = latency_budget
+        self.deadline_stats = {"fallbacks": 0, "late_results": 0}
+        self._background = None
+        self._late_tasks = set()
+        self._deadline_lock = threading.Lock()
+        
+        # Connection health, shared by every session using this generator
+        self.health_ttl = HEALTH_TTL_SECONDS
+        self.healthy = False
+        self.last_healthy_at = None
+        self._health_lock = threading.Lock()
+    
+    def builder_for(self, data: dict) -> ImprovedPromptBuilder:
+        """The brand's prompt builder when data names a stored brand profile, else the default one"""
+        if self.brands is not None and data.get("brand_id"):
+            builder = self.brands.builder(data["brand_id"])
+            if builder is not None:
+                return builder
+        return self.prompt_builder
+    
+    def test_connection(self, on_error=None):
+        try:
+            self._create(dict(PROBE_PARAMS))
+            self._mark_healthy()
+            return True
+        except Exception as e:
+            self._mark_unhealthy()
+            (on_error or self.on_error)(f"Connection failed: {self._handle_error(e)}")
+            return False
+    
+    def ensure_connection(self, on_error=None) -> bool:
+        """Probe the API only when the last check failed or has expired"""
+        if self._recently_healthy():
+            return True
+        return self.test_connection(on_error)
+    
+    async def test_connection_async(self, on_error=None):
+        try:
+            await self._create_async(dict(PROBE_PARAMS))
+            self._mark_healthy()
+            return True
+        except Exception as e:
+            self._mark_unhealthy()
+            (on_error or self.on_error)(f"Connection failed: {self._handle_error(e)}")
+            return False
+    
+    async def ensure_connection_async(self, on_error=None) -> bool:
+        if self._recently_healthy():
+            return True
+        return await self.test_connection_async(on_error)
+    
+    def _recently_healthy(self) -> bool:
+        with self._health_lock:
+            return self.healthy and time.time() - self.last_healthy_at < self.health_ttl
+    
+    def health_status(self) -> dict:
+        with self._health_lock:
+            age = time.time() - self.last_healthy_at if self.last_healthy_at else None
+            return {
+                "healthy": self.healthy and age is not None and age < self.health_ttl,
+                "last_confirmed": time.strftime("%H:%M:%S", time.localtime(self.last_healthy_at)) if self.last_healthy_at else None,
+                "seconds_since_confirmed": round(age, 1) if age is not None else None
+            }
+    
+    def _create(self, params: dict, timing: dict = None):
+        """chat.completions.create behind the client-side rate limiter and retry policy.
+        
+        ``timing``, if given, gets ``sent_at`` (perf_counter when the answered attempt was sent),
+        ``queue_wait`` (seconds spent on rate limiting and retries before that) and
+        ``reserved_tokens``; a streamed reply's usage is settled by ``_record_stream_usage``.
+        """
+        model = params["model"]
+        estimated = estimate_tokens(params["messages"], params.get("max_completion_tokens", 800))
+        send = self._timed_send(lambda: self.client.chat.completions.create(**params), timing)
+        completion = self.rate_limiter.call(model, estimated, send)
+        if timing is not None:
+            timing["reserved_tokens"] = estimated
+        if not params.get("stream"):
+            usage = getattr(completion, "usage", None)
+            self.rate_limiter.record_usage(model, estimated, getattr(usage, "total_tokens", None))
+        return completion
+    
+    async def _create_async(self, params: dict, timing: dict = None):
+        """_create on the async client; must run on the shared runtime's loop"""
+        model = params["model"]
+        estimated = estimate_tokens(params["messages"], params.get("max_completion_tokens", 800))
+        client = self._get_async_client()
+        send = self._timed_send(lambda: client.chat.completions.create(**params), timing)
+        completion = await self.rate_limiter.call_async(model, estimated, send)
+        if timing is not None:
+            timing["reserved_tokens"] = estimated
+        if not params.get("stream"):
+            usage = getattr(completion, "usage", None)
+            self.rate_limiter.record_usage(model, estimated, getattr(usage, "total_tokens", None))
+        return completion
+    
+    def _record_stream_usage(self, params: dict, timing: dict, metrics: dict):
+        """Settle a streamed reply's reservation; a stream closed early counts its chunks as tokens"""
+        prompt_tokens = metrics.get("prompt_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = estimate_prompt_tokens(params["messages"])
+        self.rate_limiter.record_usage(params["model"], timing["reserved_tokens"],
+                                       prompt_tokens + metrics["completion_tokens"])
+    
+    def _timed_send(self, send, timing: dict):
+        if timing is None:
+            return send
+        queued_at = time.perf_counter()
+        
+        def timed():
+            timing["sent_at"] = time.perf_counter()
+            timing["queue_wait"] = timing["sent_at"] - queued_at
+            return send()
+        return timed
+    
+    def _get_async_client(self):
+        if self.async_client is None:
+            self.async_client = shared_runtime().groq_client(self.api_key, self.base_url)
+        return self.async_client
+    
+    def _completion_metrics(self, completion, started_at: float) -> dict:
+        total = time.perf_counter() - started_at
+        usage = getattr(completion, "usage", None)
+        tokens = getattr(usage, "completion_tokens", None)
+        return {
+            "ttft_ms": None,
+            "total_ms": round(total * 1000, 1),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": tokens,
+            "tokens_per_sec": round(tokens / total, 1) if tokens and total > 0 else None,
+            "finish_reason": completion.choices[0].finish_reason if completion.choices else None
+        }
+    
+    def _mark_healthy(self):
+        with self._health_lock:
+            self.healthy = True
+            self.last_healthy_at = time.time()
+    
+    def _mark_unhealthy(self):
+        with self._health_lock:
+            self.healthy = False
+    
+    def generate_single_variation(self, data: dict, variation_number: int, content_type: str, 
+                                model: str, streaming: bool = False, on_stream=None, on_error=None,
+                                use_cache: bool = True, on_metrics=None, attempt: int = 0):
+        """Generate one variation; identical requests already in flight are shared, not re-sent.
+        
+        A non-zero ``attempt`` reseeds the prompt, for a fresh take on the same variation.
+        """
+        key = self._request_key(data, use_cache, "variation", model, content_type, variation_number, attempt)
+        generate = self._generate_within_budget if self.latency_budget else self._generate_single_variation
+        content, coalesced = self.coalescer.run(key, lambda: generate(
+            data, variation_number, content_type, model, streaming, on_stream, on_error, use_cache, on_metrics,
+            attempt
+        ))
+        if coalesced:
+            self._report_coalesced(content, variation_number, content_type, model, streaming, on_stream, on_metrics)
+        return content
+    
+    def _generate_single_variation(self, data: dict, variation_number: int, content_type: str,
+                                   model: str, streaming: bool, on_stream, on_error, use_cache: bool, on_metrics,
+                                   attempt: int):
+        return self._drive(self._variation_steps(data, variation_number, content_type, model, streaming, on_stream,
+                                                 on_error, use_cache, on_metrics, attempt),
+                           variation_number, on_stream)
+    
+    def _variation_steps(self, data: dict, variation_number: int, content_type: str, model: str, streaming: bool,
+                         on_stream, on_error, use_cache: bool, on_metrics, attempt: int):
+        """Everything but the model calls of one variation, shared by the sync and async paths.
+        
+        A generator: it yields (params, timing, validator) for each model call, is sent back
+        (text, metrics) or the exception the call raised, and returns the cleaned content.
+        """
+        def report(metrics: dict):
+            self.telemetry.observe("variation", metrics, model=model, content_type=content_type,
+                                   variation=variation_number, attempt=attempt)
+            if on_metrics:
+                on_metrics(variation_number, metrics)
+        
+        # A regeneration is asked for because the copy repeats; a cached reply would repeat it again
+        caching = self.cache is not None and use_cache and not attempt
+        error = None
+        stages = {}
+        try:
+            with span(stages, "prompt_build"):
+                candidates = self._variation_candidates(data, variation_number, content_type, model, streaming,
+                                                        caching, attempt)
+            cached = self._cached_variation(candidates, variation_number, streaming, on_stream, report, data,
+                                            content_type, stages)
+            if cached:
+                return cached
+            
+            # With automatic routing there is more than one candidate: fail over before falling back.
+            # A reply the validator rejects is asked for again, with a fresh prompt, on the same model
+            for params, cache_key, routing in candidates:
+                rejected = []
+                for retry in range(INVALID_RETRIES + 1):
+                    timing = {}
+                    validator = StreamValidator(content_type, self.builder_for(data).banned_words)
+                    reply = yield params, timing, validator
+                    if isinstance(reply, Exception):
+                        error = reply
+                        self.router.record(params["model"], error=True)
+                        self._llm_stages(stages, timing)
+                        break
+                    text, metrics = reply
+                    if streaming:
+                        self._record_stream_usage(params, timing, metrics)
+                    else:
+                        validator.feed(text or "")
+                        validator.close()
+                    self.router.record(params["model"], metrics["total_ms"] / 1000)
+                    self._llm_stages(stages, timing, metrics)
+                    if validator.invalid and retry < INVALID_RETRIES:
+                        rejected.append(validator.invalid)
+                        with span(stages, "prompt_build"):
+                            params, cache_key = self._retry_request(params, data, variation_number, content_type,
+                                                                    streaming, caching, attempt, retry + 1)
+                        continue
+                    metrics = self._routed(self._validated(metrics, validator, rejected), params, routing)
+                    if validator.invalid:
+                        return self._replace_invalid(metrics, report, data, content_type, variation_number, stages)
+                    return self._finish_variation(text, metrics, report, cache_key, data, content_type, stages)
+        
+        except Exception as e:
+            error = e
+        return self._variation_failed(error, data, content_type, variation_number, on_error, report, stages)
+    
+    def _drive(self, steps, variation_number: int = None, on_stream=None):
+        """Run shared steps (see _variation_steps) to their result, making the model calls they ask for"""
+        call, result = self._advance(steps)
+        while call is not None:
+            call, result = self._advance(steps, self._call_model(*call, variation_number, on_stream))
+        return result
+    
+    async def _drive_async(self, steps, variation_number: int = None, on_stream=None):
+        """_drive on the event loop: model calls are awaited, and the steps between them run on a worker
+        thread so their cache, brand store and telemetry I/O never stalls other sessions' streams"""
+        call, result = await asyncio.to_thread(self._advance, steps)
+        while call is not None:
+            reply = await self._call_model_async(*call, variation_number, on_stream)
+            call, result = await asyncio.to_thread(self._advance, steps, reply)
+        return result
+    
+    @staticmethod
+    def _advance(steps, reply=None) -> tuple:
+        """Run steps to their next model call: (call, None), or (None, result) once they return"""
+        try:
+            return steps.send(reply), None
+        except StopIteration as done:
+            return None, done.value
+    
+    def _call_model(self, params: dict, timing: dict, validator, variation_number: int, on_stream):
+        """One model call for _drive: (text, metrics), or the exception it raised"""
+        try:
+            completion = self._create(params, timing)
+            if params.get("stream"):
+                collector = self._stream_collector(variation_number, on_stream, timing["sent_at"], validator)
+                return collector.consume(completion), collector.stats()
+            return completion.choices[0].message.content, self._completion_metrics(completion, timing["sent_at"])
+        except Exception as e:
+            return e
+    
+    async def _call_model_async(self, params: dict, timing: dict, validator, variation_number: int, on_stream):
+        try:
+            completion = await self._create_async(params, timing)
+            if params.get("stream"):
+                collector = self._stream_collector(variation_number, on_stream, timing["sent_at"], validator)
+                return await collector.consume_async(completion), collector.stats()
+            return completion.choices[0].message.content, self._completion_metrics(completion, timing["sent_at"])
+        except Exception as e:
+            return e
+    
+    @staticmethod
+    def _on_loop(callback):
+        """callback, handed to the running event loop when called from a _drive_async worker thread"""
+        if callback is None:
+            return None
+        loop = asyncio.get_running_loop()
+        return lambda *args: loop.call_soon_threadsafe(callback, *args)
+    
+    async def generate_single_variation_async(self, data: dict, variation_number: int, content_type: str,
+                                              model: str, streaming: bool = False, on_stream=None, on_error=None,
+                                              use_cache: bool = True, on_metrics=None, attempt: int = 0):
+        """generate_single_variation on the async client"""
+        key = await asyncio.to_thread(self._request_key, data, use_cache, "variation", model, content_type,
+                                      variation_number, attempt)
+        generate = self._generate_within_budget_async if self.latency_budget else self._generate_single_variation_async
+        content, coalesced = await self.coalescer.run_async(key, lambda: generate(
+            data, variation_number, content_type, model, streaming, on_stream, on_error, use_cache, on_metrics,
+            attempt
+        ))
+        if coalesced:
+            await asyncio.to_thread(self._report_coalesced, content, variation_number, content_type, model, streaming,
+                                    self._on_loop(on_stream), self._on_loop(on_metrics))
+        return content
+    
+    async def _generate_single_variation_async(self, data: dict, variation_number: int, content_type: str,
+                                               model: str, streaming: bool, on_stream, on_error, use_cache: bool,
+                                               on_metrics, attempt: int):
+        steps = self._variation_steps(data, variation_number, content_type, model, streaming, self._on_loop(on_stream),
+                                      self._on_loop(on_error), use_cache, self._on_loop(on_metrics), attempt)
+        return await self._drive_async(steps, variation_number, on_stream)
+    
+    def _generate_within_budget(self, data: dict, variation_number: int, content_type: str, model: str,
+                                streaming: bool, on_stream, on_error, use_cache: bool, on_metrics, attempt: int):
+        """_generate_single_variation, or the fallback copy if it misses the latency budget"""
+        started_at = time.perf_counter()
+        expired = threading.Event()
+        future = self._background_pool().submit(
+            self._generate_single_variation, data, variation_number, content_type, model, streaming,
+            self._until(expired, on_stream), self._until(expired, on_error), use_cache,
+            self._until(expired, on_metrics), attempt
+        )
+        # Built while the model call is in flight, so the deadline path costs nothing extra
+        stages = {}
+        fallback = self._fallback_copy(data, content_type, variation_number, stages)
+        try:
+            return future.result(timeout=self._remaining_budget(started_at))
+        except FutureTimeout:
+            expired.set()
+            future.add_done_callback(lambda _: self._count_deadline("late_results"))
+            return self._deadline_fallback(fallback, variation_number, content_type, model, started_at, stages,
+                                           streaming, on_stream, on_metrics)
+    
+    async def _generate_within_budget_async(self, data: dict, variation_number: int, content_type: str, model: str,
+                                            streaming: bool, on_stream, on_error, use_cache: bool, on_metrics,
+                                            attempt: int):
+        """_generate_within_budget on the event loop; a late call keeps running as a task"""
+        started_at = time.perf_counter()
+        expired = threading.Event()
+        task = asyncio.ensure_future(self._generate_single_variation_async(
+            data, variation_number, content_type, model, streaming, self._until(expired, on_stream),
+            self._until(expired, on_error), use_cache, self._until(expired, on_metrics), attempt
+        ))
+        stages = {}
+        fallback = await asyncio.to_thread(self._fallback_copy, data, content_type, variation_number, stages)
+        done, _ = await asyncio.wait({task}, timeout=self._remaining_budget(started_at))
+        if done:
+            return task.result()
+        expired.set()
+        # Hold a reference so the task is not garbage collected before it finishes
+        self._late_tasks.add(task)
+        task.add_done_callback(self._late_tasks.discard)
+        task.add_done_callback(lambda _: self._count_deadline("late_results"))
+        return await asyncio.to_thread(self._deadline_fallback, fallback, variation_number, content_type, model,
+                                       started_at, stages, streaming, self._on_loop(on_stream),
+                                       self._on_loop(on_metrics))
+    
+    def _background_pool(self) -> ThreadPoolExecutor:
+        with self._deadline_lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="contify-llm")
+            return self._background
+    
+    def _remaining_budget(self, started_at: float) -> float:
+        return max(0.0, self.latency_budget - (time.perf_counter() - started_at))
+    
+    def _until(self, expired: threading.Event, callback):
+        """callback, silenced once the deadline has passed so a late call cannot overwrite the fallback"""
+        if callback is None:
+            return None
+        
+        def gated(*args):
+            if not expired.is_set():
+                return callback(*args)
+        return gated
+    
+    def _count_deadline(self, stat: str):
+        with self._deadline_lock:
+            self.deadline_stats[stat] += 1
+    
+    def _deadline_fallback(self, fallback: str, variation_number: int, content_type: str, model: str,
+                           started_at: float, stages: dict, streaming: bool, on_stream, on_metrics) -> str:
+        self._count_deadline("fallbacks")
+        if streaming and on_stream:
+            on_stream(variation_number, fallback)
+        metrics = {"fallback": True, "deadline_ms": round(self.latency_budget * 1000),
+                   "total_ms": round((time.perf_counter() - started_at) * 1000, 1), "stages_ms": stages}
+        self.telemetry.observe("variation", metrics, model=model, content_type=content_type, variation=variation_number)
+        if on_metrics:
+            on_metrics(variation_number, metrics)
+        return fallback
+    
+    def _request_key(self, data: dict, use_cache: bool, *parts) -> str:
+        """Coalescing key: callers share a generation only with the same inputs, cache use and brand profile"""
+        profile = self.builder_for(data).profile
+        return request_key(*parts, data, use_cache, profile.get("id"), profile.get("version"))
+    
+    def _report_coalesced(self, content: str, variation_number: int, content_type: str, model: str, streaming: bool,
+                          on_stream, on_metrics):
+        if streaming and on_stream:
+            on_stream(variation_number, content)
+        self.telemetry.observe("variation", {"coalesced": True}, model=model, content_type=content_type,
+                               variation=variation_number)
+        if on_metrics:
+            on_metrics(variation_number, {"coalesced": True})
+    
+    def _variation_request(self, data: dict, variation_number: int, content_type: str, model: str,
+                           streaming: bool, caching: bool, attempt: int = 0, retry: int = 0) -> tuple:
+        """(params, cache_key) for one variation; cache_key is None when not caching"""
+        # A seeded builder is already reproducible; otherwise seed from the inputs so cache keys repeat.
+        # Retries get their own seed so they draw different prompt elements (and miss the cache).
+        # Regenerations are never cached, so an unseeded builder draws fresh elements for them
+        builder = self.builder_for(data)
+        seed = None
+        if retry:
+            seed = stable_seed(builder.seed, data, variation_number, content_type, attempt, "retry", retry)
+        elif attempt:
+            if builder.seed is not None:
+                seed = stable_seed(builder.seed, data, variation_number, content_type, attempt)
+        elif caching and builder.seed is None:
+            seed = stable_seed(data, variation_number, content_type)
+        prompt = builder.build_focused_prompt(data, variation_number, content_type, seed)
+        
+        # Simple parameter variation
+        temperature = 0.7 + (variation_number * 0.1)
+        top_p = 0.85 + (variation_number * 0.05)
+        
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": temperature,
+            "max_completion_tokens": completion_budget(content_type, data.get("char_limit")),
+            "top_p": top_p,
+            "stop": STOP_SEQUENCES,
+            "stream": streaming
+        }
+        cache_key = make_cache_key(model, params["messages"], temperature, top_p) if caching else None
+        return params, cache_key
+    
+    def _variation_candidates(self, data: dict, variation_number: int, content_type: str, model: str,
+                              streaming: bool, caching: bool, attempt: int) -> list:
+        """[(params, cache_key, routing)] for each model to try, in order; routing is None unless automatic"""
+        if model != AUTO_MODEL:
+            return [self._variation_request(data, variation_number, content_type, model, streaming, caching, attempt)
+                    + (None,)]
+        
+        route = self.router.route()
+        params, _ = self._variation_request(data, variation_number, content_type, route[0][0], streaming, caching,
+                                            attempt)
+        candidates = []
+        for position, (routed, _) in enumerate(route):
+            cache_key = make_cache_key(routed, params["messages"], params["temperature"], params["top_p"]) if caching else None
+            candidates.append((dict(params, model=routed), cache_key, self._routing(route, position)))
+        return candidates
+    
+    def _routing(self, route: list, position: int) -> dict:
+        """Routing metadata for trying route[position]"""
+        return {
+            "mode": AUTO_MODEL,
+            "target_ms": round(self.router.target_latency * 1000),
+            "estimates_ms": {model: round(estimate * 1000, 1) for model, estimate in route},
+            "failover_from": [model for model, _ in route[:position]]
+        }
+    
+    def _cached_variation(self, candidates: list, variation_number: int, streaming: bool, on_stream, report,
+                          data: dict, content_type: str, stages: dict):
+        """Cleaned cached content from the first candidate with a cache entry, else None"""
+        for params, cache_key, routing in candidates:
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached:
+                if streaming and on_stream:
+                    on_stream(variation_number, cached)
+                with span(stages, "postprocess"):
+                    content = self._clean_content(cached, data, content_type)
+                metrics = {"cached": True, "stages_ms": stages}
+                report(self._routed(metrics, params, {**routing, "failover_from": []} if routing else None))
+                return content
+        return None
+    
+    def _routed(self, metrics: dict, params: dict, routing) -> dict:
+        if routing is None:
+            return metrics
+        return dict(metrics, model=params["model"], routing=routing)
+    
+    def _stream_collector(self, variation_number: int, on_stream, started_at: float,
+                          validator: StreamValidator) -> StreamCollector:
+        return StreamCollector(
+            (lambda text: on_stream(variation_number, text)) if on_stream else None,
+            started_at=started_at, validator=validator
+        )
+    
+    def _retry_request(self, params: dict, data: dict, variation_number: int, content_type: str, streaming: bool,
+                       caching: bool, attempt: int, retry: int) -> tuple:
+        """(params, cache_key) for asking the same model again after a rejected reply"""
+        retried, cache_key = self._variation_request(data, variation_number, content_type, params["model"],
+                                                     streaming, caching, attempt, retry)
+        return dict(params, messages=retried["messages"]), cache_key
+    
+    def _validated(self, metrics: dict, validator: StreamValidator, rejected: list) -> dict:
+        """metrics plus what the validator found: earlier rejected replies, and whether this one failed too"""
+        if rejected:
+            metrics = dict(metrics, rejected=rejected)
+        if validator.invalid:
+            metrics = dict(metrics, invalid=validator.invalid)
+        if validator.overlong:
+            metrics = dict(metrics, overlong=validator.overlong)
+        return metrics
+    
+    def _fallback_copy(self, data: dict, content_type: str, variation_number: int, stages: dict) -> str:
+        with span(stages, "fallback"):
+            return self.builder_for(data).create_fallback_content(data, content_type, variation_number)
+    
+    def _replace_invalid(self, metrics: dict, report, data: dict, content_type: str, variation_number: int,
+                         stages: dict) -> str:
+        """Fallback copy for a reply still invalid after its retries; the reply is neither shown nor cached"""
+        content = self._fallback_copy(data, content_type, variation_number, stages)
+        report(dict(metrics, fallback=True, stages_ms=stages))
+        self._mark_healthy()
+        return content
+    
+    def _finish_variation(self, text: str, metrics: dict, report, cache_key, data: dict, content_type: str,
+                          stages: dict) -> str:
+        with span(stages, "postprocess"):
+            content = self._clean_content(text, data, content_type)
+        report(dict(metrics, stages_ms=stages))
+        self._mark_healthy()
+        if cache_key:
+            self.cache.set(cache_key, text)
+        return content
+    
+    def _llm_stages(self, stages: dict, timing: dict, metrics: dict = None):
+        """Add a model call's queue wait to stages and, if it was answered, its TTFT and LLM time"""
+        if "queue_wait" in timing:
+            stages["queue_wait"] = round(stages.get("queue_wait", 0.0) + timing["queue_wait"] * 1000, 2)
+        if metrics is None:
+            return
+        if metrics.get("ttft_ms") is not None:
+            stages["ttft"] = metrics["ttft_ms"]
+        # Rejected replies count towards the model time
+        stages["llm"] = round(stages.get("llm", 0.0) + metrics["total_ms"], 2)
+    
+    def _variation_failed(self, error: Exception, data: dict, content_type: str, variation_number: int, on_error,
+                          report, stages: dict) -> str:
+        self._mark_unhealthy()
+        (on_error or self.on_error)(f"Generation error: {self._handle_error(error)}")
+        content = self._fallback_copy(data, content_type, variation_number, stages)
+        report({"failed": True, "stages_ms": stages})
+        return content
+    
+    def generate_variations(self, data: dict, content_type: str, model: str, streaming: bool = False,
+                            concurrent: bool = False, on_progress=None, on_stream=None,
+                            on_variation=None, on_error=None, use_cache: bool = True, on_metrics=None,
+                            single_call: bool = False, dedupe: bool = False, history=None, session_id: str = None):
+        started_at = time.perf_counter()
+        if not self.ensure_connection(on_error):
+            return []
+        
+        def progress(fraction: float, text: str):
+            if on_progress:
+                on_progress(fraction, text)
+        
+        metrics = {}
+        
+        def collect_metrics(variation_number: int, values: dict):
+            metrics[variation_number] = values
+            if on_metrics:
+                on_metrics(variation_number, values)
+        
+        def generate(variation_number: int, attempt: int = 0) -> str:
+            return self.generate_single_variation(
+                data, variation_number, content_type, model, streaming, on_stream, on_error, use_cache,
+                collect_metrics, attempt
+            )
+        
+        progress(0, "Starting generation...")
+        responses = {}
+        pending = list(range(1, VARIATION_COUNT + 1))
+        
+        if single_call:
+            progress(0, f"Generating {VARIATION_COUNT} variations in one request...")
+            responses = self.generate_combined(data, pending, content_type, model, use_cache, collect_metrics)
+            for variation_number in sorted(responses):
+                if on_variation:
+                    on_variation(variation_number, responses[variation_number])
+            # Anything missing or malformed falls back to its own request below
+            pending = [n for n in pending if n not in responses]
+            progress(len(responses) / VARIATION_COUNT, f"{len(responses)}/{VARIATION_COUNT} variations ready")
+        
+        if concurrent and pending:
+            progress(len(responses) / VARIATION_COUNT, f"Generating {len(pending)} variations in parallel...")
+            with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+                futures = {executor.submit(generate, n): n for n in pending}
+                for future in as_completed(futures):
+                    variation_number = futures[future]
+                    responses[variation_number] = future.result()
+                    if on_variation:
+                        on_variation(variation_number, responses[variation_number])
+                    progress(len(responses) / VARIATION_COUNT,
+                             f"Variation {variation_number} ready ({len(responses)}/{VARIATION_COUNT})")
+        else:
+            for variation_number in pending:
+                progress(len(responses) / VARIATION_COUNT, f"Generating variation {variation_number}/{VARIATION_COUNT}...")
+                responses[variation_number] = generate(variation_number)
+                if on_variation:
+                    on_variation(variation_number, responses[variation_number])
+        
+        duplicates = self._regenerable_duplicates(responses, metrics, history, session_id) if dedupe else []
+        attempt = 0
+        while duplicates and attempt < DEDUPE_ATTEMPTS:
+            attempt += 1
+            progress((VARIATION_COUNT - len(duplicates)) / VARIATION_COUNT,
+                     f"Regenerating {len(duplicates)} near-duplicate variation(s)...")
+            if concurrent and len(duplicates) > 1:
+                with ThreadPoolExecutor(max_workers=len(duplicates)) as executor:
+                    regenerated = dict(zip(duplicates, executor.map(lambda n: generate(n, attempt), duplicates)))
+            else:
+                regenerated = {n: generate(n, attempt) for n in duplicates}
+            self._apply_regenerated(regenerated, attempt, responses, metrics, on_variation)
+            duplicates = self._regenerable_duplicates(responses, metrics, history, session_id)
+        self._mark_duplicates(duplicates, metrics)
+        
+        progress(1.0, "Generation complete!")
+        return self._generation_records(responses, metrics, model, content_type, started_at, single_call, attempt)
+    
+    async def generate_variations_async(self, data: dict, content_type: str, model: str, streaming: bool = False,
+                                        concurrent: bool = False, on_progress=None, on_stream=None,
+                                        on_variation=None, on_error=None, use_cache: bool = True, on_metrics=None,
+                                        single_call: bool = False, dedupe: bool = False, history=None,
+                                        session_id: str = None):
+        """generate_variations with variations as tasks on the shared event loop instead of threads.
+        
+        Callbacks run on the event loop thread.
+        """
+        started_at = time.perf_counter()
+        if not await self.ensure_connection_async(on_error):
+            return []
+        
+        def progress(fraction: float, text: str):
+            if on_progress:
+                on_progress(fraction, text)
+        
+        metrics = {}
+        
+        def collect_metrics(variation_number: int, values: dict):
+            metrics[variation_number] = values
+            if on_metrics:
+                on_metrics(variation_number, values)
+        
+        responses = {}
+        
+        async def generate(variation_number: int):
+            responses[variation_number] = await self.generate_single_variation_async(
+                data, variation_number, content_type, model, streaming, on_stream, on_error, use_cache,
+                collect_metrics
+            )
+            if on_variation:
+                on_variation(variation_number, responses[variation_number])
+            return variation_number
+        
+        progress(0, "Starting generation...")
+        pending = list(range(1, VARIATION_COUNT + 1))
+        
+        if single_call:
+            progress(0, f"Generating {VARIATION_COUNT} variations in one request...")
+            responses.update(await self.generate_combined_async(data, pending, content_type, model, use_cache,
+                                                                collect_metrics))
+            for variation_number in sorted(responses):
+                if on_variation:
+                    on_variation(variation_number, responses[variation_number])
+            pending = [n for n in pending if n not in responses]
+            progress(len(responses) / VARIATION_COUNT, f"{len(responses)}/{VARIATION_COUNT} variations ready")
+        
+        if concurrent and pending:
+            progress(len(responses) / VARIATION_COUNT, f"Generating {len(pending)} variations in parallel...")
+            for task in asyncio.as_completed([generate(n) for n in pending]):
+                variation_number = await task
+                progress(len(responses) / VARIATION_COUNT,
+                         f"Variation {variation_number} ready ({len(responses)}/{VARIATION_COUNT})")
+        else:
+            for variation_number in pending:
+                progress(len(responses) / VARIATION_COUNT, f"Generating variation {variation_number}/{VARIATION_COUNT}...")
+                await generate(variation_number)
+        
+        async def regenerate(variation_number: int, attempt: int) -> str:
+            return await self.generate_single_variation_async(
+                data, variation_number, content_type, model, streaming, on_stream, on_error, use_cache,
+                collect_metrics, attempt
+            )
+        
+        duplicates = self._regenerable_duplicates(responses, metrics, history, session_id) if dedupe else []
+        attempt = 0
+        while duplicates and attempt < DEDUPE_ATTEMPTS:
+            attempt += 1
+            progress((VARIATION_COUNT - len(duplicates)) / VARIATION_COUNT,
+                     f"Regenerating {len(duplicates)} near-duplicate variation(s)...")
+            if concurrent:
+                contents = await asyncio.gather(*(regenerate(n, attempt) for n in duplicates))
+            else:
+                contents = [await regenerate(n, attempt) for n in duplicates]
+            self._apply_regenerated(dict(zip(duplicates, contents)), attempt, responses, metrics, on_variation)
+            duplicates = self._regenerable_duplicates(responses, metrics, history, session_id)
+        self._mark_duplicates(duplicates, metrics)
+        
+        progress(1.0, "Generation complete!")
+        return await asyncio.to_thread(self._generation_records, responses, metrics, model, content_type, started_at,
+                                       single_call, attempt)
+    
+    def generate_variations_pooled(self, *args, **kwargs) -> list:
+        """Run generate_variations_async on the process-wide runtime and wait for the result.
+        
+        All callers share one event loop thread and one HTTP connection pool. Falls back to
+        the threaded generate_variations when only a sync stand-in client was injected.
+        """
+        if not self._async_supported:
+            return self.generate_variations(*args, **kwargs)
+        return shared_runtime().run(self.generate_variations_async(*args, **kwargs))
+    
+    def near_duplicates(self, contents: dict, index: SimilarityIndex = None, history=None,
+                        session_id: str = None) -> list:
+        """Variation numbers whose copy nearly repeats an earlier variation, the index or the history.
+        
+        The first variation of each near-identical group is kept; ``history`` is a ``HistoryStore``,
+        checked for ``session_id`` only when one is given.
+        """
+        seen = SimilarityIndex()
+        duplicates = []
+        for variation_number in sorted(contents):
+            fingerprint = simhash(contents[variation_number])
+            if (seen.query(fingerprint) or (index is not None and index.query(fingerprint))
+                    or (history is not None and history.matches(fingerprint, session_id))):
+                duplicates.append(variation_number)
+            else:
+                seen.add(variation_number, fingerprint)
+        return duplicates
+    
+    def _regenerable_duplicates(self, responses: dict, metrics: dict, history, session_id: str) -> list:
+        """Near-duplicate model output worth asking for again.
+        
+        A cache hit is this session's own earlier copy served again, so it matching the
+        history is expected; only a near-identical sibling variation counts against it.
+        """
+        siblings = set(self.near_duplicates(responses))
+        return [n for n in self.near_duplicates(responses, history=history, session_id=session_id)
+                if self.from_model(metrics.get(n)) and (n in siblings or not metrics[n].get("cached"))]
+    
+    @staticmethod
+    def from_model(metrics: dict) -> bool:
+        """Whether a variation's metrics describe model output rather than fallback copy.
+        
+        Failed calls report ``failed`` and deadline fallbacks report ``fallback``; asking
+        again for either would most likely fail or time out again.
+        """
+        return metrics is not None and not metrics.get("fallback") and not metrics.get("failed")
+    
+    def _apply_regenerated(self, regenerated: dict, attempt: int, responses: dict, metrics: dict, on_variation):
+        for variation_number, content in regenerated.items():
+            responses[variation_number] = content
+            metrics[variation_number] = dict(metrics.get(variation_number, {}), regenerated=attempt)
+            if on_variation:
+                on_variation(variation_number, content)
+    
+    def _mark_duplicates(self, duplicates: list, metrics: dict):
+        for variation_number in duplicates:
+            metrics[variation_number] = dict(metrics[variation_number], near_duplicate=True)
+    
+    def _generation_records(self, responses: dict, metrics: dict, model: str, content_type: str, started_at: float,
+                            single_call: bool, dedupe_rounds: int) -> list:
+        records = self._variation_records(responses, metrics, model)
+        self.telemetry.observe_generation(time.perf_counter() - started_at, records, model=model,
+                                          content_type=content_type, single_call=single_call,
+                                          dedupe_rounds=dedupe_rounds)
+        return records
+    
+    def _variation_records(self, responses: dict, metrics: dict, model: str) -> list:
+        variations = []
+        for variation_number in sorted(responses):
+            response = responses[variation_number]
+            if response:
+                values = metrics.get(variation_number, {})
+                record = self.variation_record(variation_number, response, values.get("model", model),
+                                               values.get("routing"))
+                record["metrics"] = values
+                variations.append(record)
+        return variations
+    
+    def generate_combined(self, data: dict, variation_numbers: list, content_type: str, model: str,
+                          use_cache: bool = True, on_metrics=None) -> dict:
+        """Request several variations in one JSON completion.
+        
+        Returns {variation_number: content} for the variations that came back valid;
+        callers generate the rest individually.
+        """
+        key = self._request_key(data, use_cache, "combined", model, content_type, list(variation_numbers))
+        results, coalesced = self.coalescer.run(key, lambda: self._generate_combined(
+            data, variation_numbers, content_type, model, use_cache, on_metrics
+        ))
+        if coalesced and on_metrics:
+            for variation_number in results:
+                on_metrics(variation_number, {"coalesced": True, "combined": True})
+        return dict(results)
+    
+    def _generate_combined(self, data: dict, variation_numbers: list, content_type: str, model: str,
+                           use_cache: bool, on_metrics) -> dict:
+        return self._drive(self._combined_steps(data, variation_numbers, content_type, model, use_cache, on_metrics))
+    
+    def _combined_steps(self, data: dict, variation_numbers: list, content_type: str, model: str, use_cache: bool,
+                        on_metrics):
+        """Everything but the model call of a combined request; driven like _variation_steps"""
+        stages = {}
+        with span(stages, "prompt_build"):
+            params, cache_key, routing = self._combined_request(data, variation_numbers, content_type, model,
+                                                                use_cache)
+        raw = self.cache.get(cache_key) if cache_key else None
+        metrics = self._routed({"cached": True}, params, routing)
+        
+        if raw is None:
+            timing = {}
+            reply = yield params, timing, None
+            if isinstance(reply, Exception):
+                self._llm_stages(stages, timing)
+                self._combined_failed(reply, params["model"], content_type, stages)
+                return {}
+            raw, metrics = reply
+            metrics = self._routed(metrics, params, routing)
+            self._llm_stages(stages, timing, metrics)
+            self._mark_healthy()
+        
+        return self._combined_results(raw, metrics, cache_key, data, variation_numbers, content_type, on_metrics,
+                                      stages, params["model"])
+    
+    async def generate_combined_async(self, data: dict, variation_numbers: list, content_type: str, model: str,
+                                      use_cache: bool = True, on_metrics=None) -> dict:
+        """generate_combined on the async client"""
+        key = await asyncio.to_thread(self._request_key, data, use_cache, "combined", model, content_type,
+                                      list(variation_numbers))
+        results, coalesced = await self.coalescer.run_async(key, lambda: self._generate_combined_async(
+            data, variation_numbers, content_type, model, use_cache, on_metrics
+        ))
+        if coalesced and on_metrics:
+            for variation_number in results:
+                on_metrics(variation_number, {"coalesced": True, "combined": True})
+        return dict(results)
+    
+    async def _generate_combined_async(self, data: dict, variation_numbers: list, content_type: str, model: str,
+                                       use_cache: bool, on_metrics) -> dict:
+        return await self._drive_async(self._combined_steps(data, variation_numbers, content_type, model, use_cache,
+                                                            self._on_loop(on_metrics)))
+    
+    def _combined_request(self, data: dict, variation_numbers: list, content_type: str, model: str,
+                          use_cache: bool) -> tuple:
+        """(params, cache_key, routing); an automatic model goes to the router's first choice"""
+        caching = self.cache is not None and use_cache
+        routing = None
+        if model == AUTO_MODEL:
+            route = self.router.route()
+            model = route[0][0]
+            routing = self._routing(route, 0)
+        seed = None
+        builder = self.builder_for(data)
+        if caching and builder.seed is None:
+            seed = stable_seed(data, list(variation_numbers), content_type)
+        prompt = builder.build_multi_variation_prompt(data, variation_numbers, content_type, seed)["prompt"]
+        
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": f"You are a professional fashion copywriter creating {len(variation_numbers)} variations. Reply with JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.9,
+            "max_completion_tokens": combined_budget(content_type, data.get("char_limit"), len(variation_numbers)),
+            "top_p": 0.95,
+            "response_format": {"type": "json_object"}
+        }
+        cache_key = make_cache_key(model, params["messages"], params["temperature"], params["top_p"]) if caching else None
+        return params, cache_key, routing
+    
+    def _combined_failed(self, error: Exception, model: str, content_type: str, stages: dict):
+        self._mark_unhealthy()
+        self.router.record(model, error=True)
+        self.telemetry.observe("combined", {"failed": True, "stages_ms": stages}, model=model,
+                               content_type=content_type)
+        logger.warning("Combined generation failed, using one request per variation: %s", self._handle_error(error))
+    
+    def _combined_results(self, raw: str, metrics: dict, cache_key, data: dict, variation_numbers: list,
+                          content_type: str, on_metrics, stages: dict, model: str) -> dict:
+        results = {}
+        with span(stages, "postprocess"):
+            for variation_number, content in self._split_combined(raw, variation_numbers).items():
+                if self._valid_variation(content, content_type):
+                    results[variation_number] = self._clean_content(content, data, content_type)
+        metrics = dict(metrics, stages_ms=stages)
+        # One call for the whole set, so it is observed once
+        self.telemetry.observe("combined", metrics, model=model, content_type=content_type, variations=len(results))
+        if on_metrics:
+            for variation_number in results:
+                on_metrics(variation_number, dict(metrics, combined=True))
+        
+        if cache_key and len(results) == len(variation_numbers) and not metrics.get("cached"):
+            self.cache.set(cache_key, raw)
+        return results
+    
+    def _split_combined(self, raw: str, variation_numbers: list) -> dict:
+        """Map the JSON reply back to {variation_number: content}"""
+        text = (raw or "").strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.find("{"):] if "{" in text else text
+        try:
+            payload = json.loads(text)
+        except json.JSONDecodeError:
+            return {}
+        
+        items = payload.get("variations", []) if isinstance(payload, dict) else payload
+        if not isinstance(items, list):
+            return {}
+        
+        contents = {}
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                continue
+            variation_number = item.get("variation")
+            if variation_number not in variation_numbers and position < len(variation_numbers):
+                variation_number = variation_numbers[position]
+            if variation_number in variation_numbers and variation_number not in contents:
+                contents[variation_number] = item.get("content")
+        return contents
+    
+    def _valid_variation(self, content, content_type: str) -> bool:
+        if not isinstance(content, str) or not content.strip():
+            return False
+        if content_type == "PMAX":
+            lower = content.lower()
+            return "headlines" in lower and "descriptions" in lower
+        return len([line for line in content.split('\n') if line.strip()]) >= 2
+    
+    def _clean_content(self, content: str, data: dict, content_type: str) -> str:
+        if not content:
+            return self.builder_for(data).create_fallback_content(data, content_type, 1)
+        
+        # Tokenize once: labels dropped, PMAX sections and line roles recorded
+        parsed = parse_output(content)
+        
+        # Handle PMAX format specifically
+        if content_type == "PMAX":
+            return self._format_pmax_content(parsed, data)
+        
+        # Handle Email format (subject + body + cta)
+        if content_type == "Email Subject Lines":
+            return self._format_email_content(parsed, data)
+        
+        # WhatsApp format (5 lines for storytelling)
+        if content_type == "WhatsApp Broadcast":
+            return self._format_whatsapp_content(parsed, data)
+        
+        # Concise Content (3 lines: headline + 1 description + cta)
+        if content_type == "Concise Content":
+            return self._format_concise_content(parsed, data)
+        
+        # Long Content (4 lines: headline + 2 description + cta)  
+        if content_type == "Long Content":
+            return self._format_long_content(parsed, data)
+        
+        # Standard format fallback
+        filtered_lines = [line.text for line in parsed.lines if line.length > 3][:3]
+        while len(filtered_lines) < 3:
+            filtered_lines.append("Shop Now")
+        
+        return '\n\n'.join(filtered_lines)
+    
+    def _format_email_content(self, parsed: ParsedOutput, data: dict) -> str:
+        """Format email: subject + body + cta (3 lines)"""
+        subject_line = ""
+        body_line = ""
+        cta_line = ""
+        
+        for line in parsed.substantial:
+            if not subject_line:
+                subject_line = line.text.replace('**', '').strip()
+            elif not body_line and line.text != subject_line and line.length > 20:
+                body_line = line.text
+            elif not cta_line and line.role == CTA and line.text != subject_line and line.text != body_line:
+                cta_line = line.text
+                break
+        
+        # Fallbacks
+        if not subject_line:
+            subject_line = f"New {data.get('product', 'Collection')} Perfect for {data.get('festival', 'You')}"
+        if not body_line:
+            body_line = f"Stunning {data.get('fabric', 'premium')} pieces designed for memorable moments."
+        if not cta_line:
+            cta_line = "Shop Now"
+        
+        return f"**{subject_line}**\n{body_line}\n{cta_line}"
+    
+    def _format_whatsapp_content(self, parsed: ParsedOutput, data: dict) -> str:
+        """Format WhatsApp: headline + 3 story lines + cta (5 lines)"""
+        filtered_lines = parsed.substantial
+        
+        if len(filtered_lines) >= 5:
+            return '\n'.join(line.text for line in filtered_lines[:5])
+        
+        # Build from available lines
+        headline = filtered_lines[0].text if filtered_lines else f"Style Speaks Softly"
+        story_lines = [line.text for line in filtered_lines[1:4]] if len(filtered_lines) > 3 else []
+        cta = filtered_lines[-1].text if filtered_lines and filtered_lines[-1].words <= 4 else "Shop Now"
+        
+        # Fill missing story lines
+        default_stories = [
+            f"New {data.get('product', 'collection')} arrives where style meets comfort.",
+            f"Designed for seamless transitions from day to {data.get('festival', 'evening')}.",
+            f"These pieces effortlessly adapt to your unique style story."
+        ]
+        
+        while len(story_lines) < 3:
+            story_lines.append(default_stories[len(story_lines)])
+        
+        return f"{headline}\n{story_lines[0]}\n{story_lines[1]}\n{story_lines[2]}\n{cta}"
+    
+    def _format_concise_content(self, parsed: ParsedOutput, data: dict) -> str:
+        """Format Concise: headline + 1 description + cta (3 lines)"""
+        filtered_lines = parsed.substantial
+        
+        headline = filtered_lines[0].text if filtered_lines else f"New {data.get('product', 'Collection')}"
+        description = ""
+        cta = "Shop Now"
+        
+        # Find description and CTA
+        for line in filtered_lines[1:]:
+            if line.role == BODY and not description:
+                description = line.text
+            elif line.role == CTA and line.text != headline:
+                cta = line.text
+                break
+        
+        if not description:
+            description = f"Premium {data.get('fabric', 'quality')} pieces for your {data.get('festival', 'style')} wardrobe."
+        
+        return f"{headline}\n{description}\n{cta}"
+    
+    def _format_long_content(self, parsed: ParsedOutput, data: dict) -> str:
+        """Format Long: headline + 2 descriptions + cta (4 lines)"""
+        filtered_lines = parsed.substantial
+        
+        headline = filtered_lines[0].text if filtered_lines else f"New {data.get('product', 'Collection')}"
+        descriptions = []
+        cta = "Shop Now"
+        
+        # Extract descriptions and CTA
+        for line in filtered_lines[1:]:
+            if line.role == BODY and len(descriptions) < 2:
+                descriptions.append(line.text)
+            elif line.role == CTA and line.text != headline:
+                cta = line.text
+                break
+        
+        # Fill missing descriptions
+        default_descriptions = [
+            f"Premium {data.get('fabric', 'quality')} pieces crafted for discerning taste.",
+            f"Perfect for your {data.get('festival', 'special')} wardrobe and beyond."
+        ]
+        
+        while len(descriptions) < 2:
+            descriptions.append(default_descriptions[len(descriptions)])
+        
+        return f"{headline}\n{descriptions[0]}\n{descriptions[1]}\n{cta}"
+    
+    def _format_pmax_content(self, parsed: ParsedOutput, data: dict) -> str:
+        """PMAX formatting from the parsed sections, with character limits applied"""
+        sections = parsed.sections
+        
+        # Fill missing content with templates
+        product = data.get('product', 'Collection')
+        brand = data.get('brand', 'Premium')
+        fabric = data.get('fabric', 'Quality')
+        festival = data.get('festival', 'Special')
+        
+        # Fill headlines (need 15)
+        headline_templates = [
+            f"New {product}", f"{brand} Style", f"Premium {fabric}", 
+            f"Perfect for {festival}", "Quality First", "Shop Now", "Get Yours",
+            "Trending Style", "Must Have", "Best Choice", "Modern Look",
+            "Classic Style", "Fresh Design", "Top Quality", "Great Value"
+        ]
+        
+        # Fill descriptions (need 5)
+        desc_templates = [
+            f"Premium {fabric} {product} for {festival} celebrations",
+            f"{brand} quality craftsmanship in every piece",
+            f"Perfect {product} designed for your special moments",
+            f"Handpicked {fabric} pieces for discerning taste",
+            f"New {product} collection now available"
+        ]
+        
+        # Fill long headlines (need 5)
+        long_templates = [
+            f"{brand} Premium {product} - Quality {fabric} Collection",
+            f"Perfect {fabric} {product} for {festival} Celebrations", 
+            f"New {product} Collection - Handcrafted {fabric} Pieces",
+            f"{brand} {fabric} {product} - Modern Style Statement",
+            f"Premium {product} in {fabric} - Shop the Collection"
+        ]
+        
+        # Truncate at word boundaries, drop duplicates, top up from the templates
+        headlines = fit_section('headlines', [line.text for line in sections['headlines']], headline_templates)
+        descriptions = fit_section('descriptions', [line.text for line in sections['descriptions']], desc_templates)
+        long_headlines = fit_section('long_headlines', [line.text for line in sections['long_headlines']], long_templates)
+        
+        # Build final result
+        result = "Headlines:\n" + '\n'.join(headlines)
+        result += "\n\nDescriptions:\n" + '\n'.join(descriptions)
+        result += "\n\nLong Headlines:\n" + '\n'.join(long_headlines)
+        
+        return result
+    
+    def _handle_error(self, error: Exception) -> str:
+        error_str = str(error).lower()
+        if "authentication" in error_str:
+            return "Invalid API key"
+        elif "rate limit" in error_str:
+            return "Rate limit exceeded - wait a moment"
+        elif "quota" in error_str:
+            return "API quota exceeded"
+        else:
+            return "API error - please try again"
+    
+    def variation_record(self, variation_number: int, content: str, model: str, routing: dict = None) -> dict:
+        record = {
+            "variation": variation_number,
+            "style": self._get_style_name(variation_number),
+            "content": content,
+            "char_count": len(content),
+            "word_count": len(content.split()),
+            "model_used": model
+        }
+        if routing:
+            record["routing"] = routing
+        record["generation_time"] = time.strftime("%H:%M:%S")
+        return record
+    
+    def _get_style_name(self, variation: int) -> str:
+        styles = {1: "Direct & Clear", 2: "Personal & Warm", 3: "Aspirational & Bold"}
+        return styles.get(variation, f"Style {variation}")
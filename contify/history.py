@@ -0,0 +1,123 @@
+"""Bounded generation history shared by every session.
+
+Each session keeps a ring buffer of content digests (the last ``per_session``
+generations). The text behind a digest is stored once for the whole process,
+zlib-compressed and reference-counted, and is only decompressed when someone
+asks for it. Sessions beyond ``max_sessions`` are evicted least recently used
+first, taking their references with them. ``per_session=0`` turns the history
+off: nothing is stored and nothing matches.
+
+Every stored text is also fingerprinted into a ``SimilarityIndex``, so
+near-duplicate checks against the history only look at a few candidates
+instead of every stored text.
+"""
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict, deque
+
+from contify.similarity import NEAR_DUPLICATE_DISTANCE, SimilarityIndex, simhash
+
+
+def content_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("compressed", "refs")
+
+    def __init__(self, compressed: bytes):
+        self.compressed = compressed
+        self.refs = 0
+
+
+class HistoryStore:
+    def __init__(self, per_session: int = 10, max_sessions: int = 1000,
+                 max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        if per_session < 0:
+            raise ValueError("per_session must be 0 (history off) or more")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.per_session = per_session
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> deque of digests, least recently used first
+        self._entries = {}  # digest -> _Entry, shared by every session
+        self._index = SimilarityIndex(max_distance)
+        self._lock = threading.Lock()
+        self.stats = {"added": 0, "shared": 0, "session_evictions": 0, "checks": 0, "near_duplicates": 0}
+
+    def add(self, session_id: str, text: str) -> str:
+        """Record text in the session's history and return its digest"""
+        digest = content_digest(text)
+        if not self.per_session:
+            return digest
+        fingerprint = simhash(text)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                entry = self._entries[digest] = _Entry(zlib.compress(text.encode("utf-8")))
+                self._index.add(digest, fingerprint)
+            else:
+                self.stats["shared"] += 1
+            entry.refs += 1
+            self.stats["added"] += 1
+
+            ring = self._session(session_id)
+            if len(ring) == ring.maxlen:
+                self._release(ring[0])
+            ring.append(digest)
+        return digest
+
+    def _session(self, session_id: str) -> deque:
+        ring = self._sessions.get(session_id)
+        if ring is None:
+            ring = self._sessions[session_id] = deque(maxlen=self.per_session)
+            while len(self._sessions) > self.max_sessions:
+                _, evicted = self._sessions.popitem(last=False)
+                for digest in evicted:
+                    self._release(digest)
+                self.stats["session_evictions"] += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        return ring
+
+    def _release(self, digest: str):
+        entry = self._entries[digest]
+        entry.refs -= 1
+        if entry.refs:
+            return
+        del self._entries[digest]
+        self._index.remove(digest)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            for digest in self._sessions.pop(session_id, ()):
+                self._release(digest)
+
+    def texts(self, session_id: str) -> list:
+        """The session's stored texts, oldest first"""
+        with self._lock:
+            compressed = [self._entries[digest].compressed for digest in self._sessions.get(session_id, ())]
+        return [zlib.decompress(blob).decode("utf-8") for blob in compressed]
+
+    def near_duplicates(self, text: str, session_id: str = None) -> list:
+        """Digests of stored texts that nearly match text; only this session's if session_id is given"""
+        return self.matches(simhash(text), session_id)
+
+    def matches(self, fingerprint: int, session_id: str = None) -> list:
+        """near_duplicates for an already computed fingerprint"""
+        with self._lock:
+            self.stats["checks"] += 1
+            keys = None if session_id is None else self._sessions.get(session_id, ())
+            matches = self._index.query(fingerprint, keys)
+            if matches:
+                self.stats["near_duplicates"] += 1
+        return matches
+
+    def is_near_duplicate(self, text: str, session_id: str = None) -> bool:
+        return bool(self.near_duplicates(text, session_id))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return dict(self.stats, sessions=len(self._sessions), texts=len(self._entries),
+                        stored_bytes=sum(len(entry.compressed) for entry in self._entries.values()))
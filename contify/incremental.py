@@ -0,0 +1,176 @@
+"""Line-by-line validation of streamed model output.
+
+``StreamValidator`` is fed the text as it streams in and parses each line as
+soon as it is finished, with the same ``parse_line`` step ``parse_output``
+uses, so nothing is re-read. It tracks the PMAX sections and the
+headline/body/CTA lines the ``_format_*`` handlers will keep, and stops the
+stream once the reply is
+
+    complete  every line the handler keeps has arrived; the rest would be dropped
+    invalid   a kept line holds a banned word, PMAX lines keep overrunning their
+              30/90/120 character limits, the reply ignores the PMAX sections,
+              or the model refused
+
+Invalid replies are cut off and asked for again with a fresh prompt rather
+than read to the end and cleaned up. Only lines the handler keeps are checked:
+extra body lines and anything after the call to action are dropped anyway.
+"""
+from contify.pmax import PMAX_COUNTS, PMAX_LIMITS, find_banned_words
+from contify.postprocess import BODY, CTA, PMAX_SECTIONS, parse_line
+from contify.templates import format_key
+
+# Body lines the Concise and Long handlers keep between the headline and the call to action
+BODY_LINES = {
+    "Long Content": 2,
+    "Concise Content": 1
+}
+# The Email handler takes the first longer line after the subject as its body
+EMAIL_BODY_MIN_LENGTH = 20
+# WhatsApp keeps the first five substantial lines, whatever their role
+WHATSAPP_LINES = 5
+
+# fit_section truncates the odd long asset; more than this many means the limits were ignored
+MAX_OVERLONG = 3
+
+# Lines of copy before any PMAX section header that mean the format was ignored
+MAX_UNSECTIONED = 3
+
+# Opening words of a refusal, casefolded
+REFUSALS = ("i'm sorry", "i am sorry", "i can't", "i cannot", "as an ai")
+
+
+class StreamValidator:
+    def __init__(self, content_type: str, banned_words: list = None):
+        self.format = format_key(content_type)
+        self.banned_words = [word.casefold() for word in banned_words or []]
+        self.complete = False
+        self.invalid = None  # the reason, once the reply is invalid
+        self.cut = None  # characters of text worth keeping, once complete
+        self.overlong = 0
+        self._pending = ""
+        self._consumed = 0
+        self._section = None
+        self._unsectioned = 0
+        self._sections = {name: 0 for name in PMAX_SECTIONS}
+        self._lines = 0  # substantial lines seen, to spot a refusal up front
+        self._headline = None
+        self._held = []  # WhatsApp lines 2-4, checked once it is known whether the handler keeps them
+        self._email_body = None
+        self._bodies = 0
+        self._ctas = 0
+
+    @property
+    def done(self) -> bool:
+        return self.complete or self.invalid is not None
+
+    def feed(self, text: str) -> bool:
+        """Add streamed text; True once the reply is complete or invalid"""
+        if self.done:
+            return True
+        self._pending += text
+        if "\n" not in text:
+            return False
+        *finished, self._pending = self._pending.split("\n")
+        for raw in finished:
+            self._check(raw, self._consumed + len(raw))
+            self._consumed += len(raw) + 1
+            if self.done:
+                break
+        return self.done
+
+    def close(self) -> bool:
+        """Check the last, unterminated line once the stream has ended"""
+        if not self.done and self._pending:
+            self._check(self._pending, self._consumed + len(self._pending))
+            self._consumed += len(self._pending)
+            self._pending = ""
+        if not self.done and self._held:
+            # A WhatsApp reply that ended short: the handler keeps lines 2-4 only when there are
+            # four of them, and otherwise just a short last line as the call to action
+            self._check_banned(self._held if self._lines > 3 else
+                               [line for line in self._held[-1:] if line.words <= 4])
+            self._held = []
+        return self.done
+
+    def _check(self, raw: str, end: int):
+        """Check one finished line; end is its offset in the whole text, before the newline"""
+        line, self._section = parse_line(raw, self._section)
+        if line is None:
+            return
+        if self._lines == 0 and line.length > 5 and line.text.casefold().startswith(REFUSALS):
+            self.invalid = "refusal"
+            return
+        if self.format == "PMAX":
+            kept = self._pmax_line(line)
+        else:
+            kept = self._copy_line(line)
+        if not kept or self.invalid:
+            return
+        if self.format == "WhatsApp Broadcast" and 1 < self._lines < WHATSAPP_LINES:
+            self._held.append(line)
+            return
+        lines, self._held = self._held + [line], []
+        self._check_banned(lines)
+        if not self.invalid and self._is_complete():
+            self.complete = True
+            self.cut = end
+
+    def _check_banned(self, lines: list):
+        if not self.banned_words:
+            return
+        banned = sorted({word for line in lines for _, word in find_banned_words(line.text.casefold(),
+                                                                                 self.banned_words)})
+        if banned:
+            self.invalid = f"banned words: {', '.join(banned)}"
+
+    def _pmax_line(self, line) -> bool:
+        """Count one PMAX line; True if fit_section will keep it"""
+        if line.section is None:
+            self._unsectioned += 1
+            if self._unsectioned > MAX_UNSECTIONED:
+                self.invalid = "no PMAX sections"
+            return False
+        self._lines += 1
+        if self._sections[line.section] >= PMAX_COUNTS[line.section]:
+            return False
+        self._sections[line.section] += 1
+        if line.length > PMAX_LIMITS[line.section]:
+            self.overlong += 1
+            if self.overlong > MAX_OVERLONG:
+                self.invalid = "character limits ignored"
+        return True
+
+    def _copy_line(self, line) -> bool:
+        """Follow the format handler through one line of free-form copy; True if it will keep the line"""
+        if line.length <= 5:
+            return False
+        self._lines += 1
+        if self._lines == 1:
+            self._headline = line.text.replace("**", "").strip()
+            return True
+        if self.format == "WhatsApp Broadcast":
+            return self._lines <= WHATSAPP_LINES
+        if self.format == "Email Subject Lines":
+            if (self._email_body is None and line.text != self._headline
+                    and line.length > EMAIL_BODY_MIN_LENGTH):
+                self._email_body = line.text
+                return True
+            if line.role == CTA and line.text != self._headline and line.text != self._email_body:
+                self._ctas += 1
+                return True
+            return False
+        if line.role == BODY and self._bodies < BODY_LINES[self.format]:
+            self._bodies += 1
+            return True
+        if line.role == CTA and line.text != self._headline:
+            self._ctas += 1
+            return True
+        return False
+
+    def _is_complete(self) -> bool:
+        if self.format == "PMAX":
+            return all(self._sections[section] >= count for section, count in PMAX_COUNTS.items())
+        if self.format == "WhatsApp Broadcast":
+            return self._lines >= WHATSAPP_LINES
+        # The handlers stop at the first call to action; whatever follows is dropped
+        return self._ctas > 0
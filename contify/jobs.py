@@ -0,0 +1,290 @@
+"""Durable generation jobs: a SQLite queue and a pool of worker processes.
+
+A job is one product's ``generate_variations`` call (product data, content
+type, model and options). Callers submit jobs and poll them; worker processes
+claim queued jobs, save each variation the moment it is ready and then mark
+the job done. Jobs and finished variations live in one SQLite file, so they
+survive Streamlit reruns, browser disconnects and worker restarts. A running
+job whose worker stops sending heartbeats goes back on the queue, and with a
+shared response cache the retry gets the variations that did finish from the
+cache.
+
+Usage:
+    python -m contify.jobs --queue .contify_jobs.sqlite --workers 4 --cache .contify_cache.sqlite \
+        --brands .contify_brands.sqlite
+
+Each worker process has its own client-side rate limiter, so lower
+GROQ_RPM_LIMIT / GROQ_TPM_LIMIT accordingly when running several.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contify.brands import BrandStore
+from contify.cache import ResponseCache
+from contify.generator import GroqContentGenerator
+from contify.telemetry import Telemetry
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Workers refresh a running job this often; a job silent for STALE_SECONDS is requeued
+HEARTBEAT_SECONDS = 5.0
+STALE_SECONDS = 60.0
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 0.5
+
+
+class JobQueue:
+    def __init__(self, path: str, stale_seconds: float = STALE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit: claims open their own IMMEDIATE transaction so two workers never take the same job
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, heartbeat_at REAL, worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_variations ("
+            "job_id TEXT NOT NULL, variation INTEGER NOT NULL, record TEXT NOT NULL, PRIMARY KEY (job_id, variation))"
+        )
+
+    def submit(self, data: dict, content_type: str, model: str, options: dict = None) -> str:
+        """Queue a generation and return its job id"""
+        job_id = uuid.uuid4().hex
+        payload = {"data": data, "content_type": content_type, "model": model, "options": options or {}}
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                             (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), time.time()))
+        return job_id
+
+    def claim(self, worker: str):
+        """Take the oldest queued job for worker; returns {"id", "attempts", **payload} or None"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_stale(now)
+                row = self._db.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                        "WHERE id = ?", (RUNNING, worker, now, now, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return dict(json.loads(row[1]), id=row[0], attempts=row[2] + 1)
+
+    def _requeue_stale(self, now: float):
+        stale = now - self.stale_seconds
+        self._db.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, error = 'Worker stopped responding' "
+            "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?", (FAILED, now, RUNNING, stale, self.max_attempts)
+        )
+        self._db.execute("UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+                         (QUEUED, RUNNING, stale))
+
+    def heartbeat(self, job_id: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def save_variation(self, job_id: str, record: dict):
+        """Store one finished variation right away, so it outlives the worker"""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO job_variations (job_id, variation, record) VALUES (?, ?, ?)",
+                             (job_id, record["variation"], json.dumps(record, ensure_ascii=False)))
+            self._db.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, records: list):
+        """Replace the partial variations with the final records and mark the job done"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM job_variations WHERE job_id = ?", (job_id,))
+                self._db.executemany(
+                    "INSERT INTO job_variations (job_id, variation, record) VALUES (?, ?, ?)",
+                    [(job_id, record["variation"], json.dumps(record, ensure_ascii=False)) for record in records]
+                )
+                self._db.execute("UPDATE jobs SET status = ?, finished_at = ?, error = NULL WHERE id = ?",
+                                 (DONE, time.time(), job_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                             (FAILED, time.time(), error, job_id))
+
+    def get(self, job_id: str):
+        """The job's status, request and variations saved so far, or None if there is no such job"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, payload, created_at, started_at, finished_at, attempts, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            records = self._db.execute(
+                "SELECT record FROM job_variations WHERE job_id = ? ORDER BY variation", (job_id,)
+            ).fetchall()
+        status, payload, created_at, started_at, finished_at, attempts, error = row
+        return dict(json.loads(payload), id=job_id, status=status, created_at=created_at, started_at=started_at,
+                    finished_at=finished_at, attempts=attempts, error=error,
+                    variations=[json.loads(record) for (record,) in records])
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict({QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}, **dict(rows))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def run_job(generator: GroqContentGenerator, queue: JobQueue, job: dict):
+    """Generate one claimed job, saving variations as they finish"""
+    options = job["options"]
+    model = job["model"]
+    errors = []
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(queue, job["id"], stop), daemon=True).start()
+
+    def save(variation_number: int, content: str):
+        queue.save_variation(job["id"], generator.variation_record(variation_number, content, model))
+
+    try:
+        records = generator.generate_variations(
+            job["data"], job["content_type"], model, concurrent=options.get("parallel", True),
+            on_variation=save, on_error=errors.append, use_cache=options.get("use_cache", True),
+            single_call=options.get("single_call", False), dedupe=options.get("dedupe", False)
+        )
+    except Exception as e:
+        queue.fail(job["id"], f"{type(e).__name__}: {e}")
+        return
+    finally:
+        stop.set()
+
+    if records:
+        queue.finish(job["id"], records)
+    else:
+        queue.fail(job["id"], errors[-1] if errors else "Could not reach the Groq API")
+
+
+def _heartbeat(queue: JobQueue, job_id: str, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        queue.heartbeat(job_id)
+
+
+def run_worker(path: str, worker: str = None, cache_path: str = None, stop=None, poll_interval: float = POLL_SECONDS,
+               brands_path: str = None):
+    """Claim and run jobs until stop is set; the entry point of each worker process"""
+    worker = worker or f"{os.uname().nodename}-{os.getpid()}"
+    queue = JobQueue(path)
+    generator = error = None
+    try:
+        # Traces append safely from several processes; a shared Prometheus textfile would not
+        generator = GroqContentGenerator(cache=ResponseCache(cache_path) if cache_path else None,
+                                         telemetry=Telemetry(os.getenv("CONTIFY_TRACE_PATH") or None),
+                                         brands=BrandStore(brands_path) if brands_path else None)
+    except Exception as e:
+        # Keep claiming, so jobs fail with the reason instead of waiting on a worker that is gone
+        logger.exception("Worker %s could not start", worker)
+        error = f"Worker could not start: {type(e).__name__}: {e}"
+    while stop is None or not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        if generator is None:
+            queue.fail(job["id"], error)
+        else:
+            run_job(generator, queue, job)
+    queue.close()
+
+
+class WorkerPool:
+    """Worker processes for one queue file.
+
+    Processes are spawned rather than forked, so they share nothing with the
+    parent (a Streamlit server, say) except the SQLite files.
+    """
+
+    def __init__(self, path: str, processes: int = 2, cache_path: str = None, brands_path: str = None):
+        self.path = path
+        self.processes = processes
+        self.cache_path = cache_path
+        self.brands_path = brands_path
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._workers = []
+
+    def start(self) -> "WorkerPool":
+        for index in range(self.processes):
+            process = self._context.Process(target=run_worker, name=f"contify-worker-{index}", daemon=True,
+                                            args=(self.path, None, self.cache_path, self._stop, POLL_SECONDS,
+                                                  self.brands_path))
+            process.start()
+            self._workers.append(process)
+        return self
+
+    def alive(self) -> int:
+        return sum(process.is_alive() for process in self._workers)
+
+    def stop(self, timeout: float = 10.0):
+        """Let workers finish their current job, then stop them"""
+        self._stop.set()
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run generation job workers")
+    parser.add_argument("--queue", default=".contify_jobs.sqlite", help="SQLite job queue file")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes")
+    parser.add_argument("--cache", help="SQLite response cache shared with the app")
+    parser.add_argument("--brands", help="SQLite brand profile store shared with the app")
+    args = parser.parse_args(argv)
+
+    JobQueue(args.queue).close()
+    pool = WorkerPool(args.queue, args.workers, args.cache, args.brands).start()
+    print(f"{args.workers} workers on {args.queue} (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        while pool.alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Local stand-in for the Groq chat-completions API, for load testing.
+
+Usage:
+    python -m contify.mock_server --port 8765 --latency 0.3 --tokens-per-sec 250 \\
+        --error-rate 0.02 --rate-limit-rate 0.05
+
+Point a client at it with ``GROQ_BASE_URL=http://127.0.0.1:8765`` (or
+``GroqContentGenerator(base_url=...)``). It serves
+``POST /openai/v1/chat/completions`` in streaming (SSE) and non-streaming form,
+answering with the canned copy from ``contify.fake_llm`` for the content type
+named in the prompt (wrapped as JSON for multi-variation requests), and can
+inject latency, 5xx errors and 429s. Replies honour ``max_completion_tokens``
+and ``stop``, ``--ramble-lines`` makes them run on past the copy, and a
+client that closes a stream early stops the generation.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from contify.fake_llm import canned_reply, limit_reply
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+
+class MockSettings:
+    def __init__(self, latency: float = 0.2, tokens_per_sec: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, rpm: int = 0, retry_after: float = 1.0, seed: int = None,
+                 ramble_lines: int = 0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.ramble_lines = ramble_lines
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0, "cancelled": 0}
+
+    def admit(self) -> str:
+        """Decide the fate of one request: 'ok', 'rate_limited' or 'error'"""
+        now = time.monotonic()
+        with self.lock:
+            self.stats["requests"] += 1
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            roll = self.rng.random()
+            if (self.rpm and len(self.recent) >= self.rpm) or roll < self.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return "rate_limited"
+            self.recent.append(now)
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.stats["errors"] += 1
+                return "error"
+            return "ok"
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: MockSettings = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.rstrip("/") != COMPLETIONS_PATH:
+            return self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            return self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+
+        outcome = self.settings.admit()
+        if outcome == "rate_limited":
+            return self._send_json(429, {"error": {
+                "message": f"Rate limit reached for model `{request.get('model')}`. Please try again later.",
+                "type": "tokens", "code": "rate_limit_exceeded"
+            }}, {"retry-after": str(self.settings.retry_after)})
+
+        time.sleep(self.settings.latency)
+        if outcome == "error":
+            return self._send_json(500, {"error": {"message": "Internal server error", "type": "internal_server_error"}})
+
+        messages = request.get("messages", [])
+        reply = canned_reply(messages, request.get("response_format"), ramble=self.settings.ramble_lines)
+        tokens, finish_reason = limit_reply(reply, request.get("max_completion_tokens") or request.get("max_tokens"),
+                                            request.get("stop"))
+        text = "".join(tokens)
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()),
+                "model": request.get("model"), "system_fingerprint": "fp_mock"}
+
+        if request.get("stream"):
+            with self.settings.lock:
+                self.settings.stats["streamed"] += 1
+            return self._stream(base, tokens, usage, finish_reason)
+
+        if self.settings.tokens_per_sec:
+            time.sleep(len(tokens) / self.settings.tokens_per_sec)
+        self._send_json(200, dict(base, object="chat.completion", usage=usage, x_groq={"id": f"req_{uuid.uuid4().hex[:16]}"},
+                                  choices=[{"index": 0, "message": {"role": "assistant", "content": text},
+                                            "logprobs": None, "finish_reason": finish_reason}]))
+
+    def _stream(self, base: dict, tokens: list, usage: dict, finish_reason: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        delay = 1.0 / self.settings.tokens_per_sec if self.settings.tokens_per_sec else 0.0
+
+        chunk = dict(base, object="chat.completion.chunk")
+        try:
+            for index, token in enumerate(tokens):
+                if delay:
+                    time.sleep(delay)
+                delta = {"role": "assistant", "content": token} if index == 0 else {"content": token}
+                self._write_event(dict(chunk, choices=[{"index": 0, "delta": delta, "logprobs": None,
+                                                        "finish_reason": None}]))
+            self._write_event(dict(chunk, choices=[{"index": 0, "delta": {}, "logprobs": None,
+                                                    "finish_reason": finish_reason}],
+                                   x_groq={"id": f"req_{uuid.uuid4().hex[:16]}", "usage": usage}))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client has what it needs and hung up
+            with self.settings.lock:
+                self.settings.stats["cancelled"] += 1
+            self.close_connection = True
+
+    def _write_event(self, payload: dict):
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("BoundMockGroqHandler", (MockGroqHandler,), {"settings": settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(settings: MockSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Run the mock server on a background thread; port 0 picks a free port"""
+    server = make_server(settings, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Generation speed (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Also return 429 above this many requests per minute")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="retry-after header sent with 429s")
+    parser.add_argument("--seed", type=int, help="Seed for error/429 injection")
+    parser.add_argument("--ramble-lines", type=int, default=0,
+                        help="Extra lines (and a note) after the copy, as chatty models write")
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(args.latency, args.tokens_per_sec, args.error_rate, args.rate_limit_rate,
+                        args.rpm, args.retry_after, args.seed, args.ramble_lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock Groq chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    settings = settings_from_args(args)
+    server = make_server(settings, args.host, args.port)
+    print(f"Mock Groq API on http://{args.host}:{args.port} (set GROQ_BASE_URL to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\nServed: {settings.stats}")
+
+
+if __name__ == "__main__":
+    main()
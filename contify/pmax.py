@@ -0,0 +1,206 @@
+"""PMAX asset limits, dedup and compliance checks over whole batches.
+
+``AssetTable`` holds every asset of every asset group (one group per product
+and variation) as parallel columns. ``validate_assets`` makes one pass per
+check over those columns: lengths are measured once, only over-limit rows are
+truncated (at a word boundary), duplicates are found with a single hash set,
+and banned words are flagged by scanning the joined, casefolded text once per
+word. ``compliance_report`` then rolls the flags up per asset group; batch runs
+write it with ``python -m contify.batch ... --compliance-report report.csv``.
+"""
+import bisect
+import csv
+import sys
+from itertools import accumulate
+
+from contify.postprocess import PMAX_SECTIONS, parse_output
+
+PMAX_LIMITS = {'headlines': 30, 'descriptions': 90, 'long_headlines': 120}
+PMAX_COUNTS = {'headlines': 15, 'descriptions': 5, 'long_headlines': 5}
+
+REPORT_FIELDS = ["group", "headlines", "descriptions", "long_headlines", "truncated",
+                 "duplicates", "banned_words", "missing", "compliant"]
+
+
+def truncate_words(text: str, limit: int) -> str:
+    """Cut text to at most limit characters without splitting a word"""
+    if len(text) <= limit:
+        return text
+    space = text.rfind(" ", 0, limit + 1)
+    if space <= 0:
+        # A single word longer than the limit can only be cut
+        return text[:limit]
+    return text[:space].rstrip(" ,;:-")
+
+
+def fit_section(field: str, texts: list, templates: list) -> list:
+    """Truncate and dedup one PMAX section, then top it up to its required count.
+
+    Templates are tried in rotation starting at the number of lines already
+    kept; headlines that still collide become "Style N".
+    """
+    limit = PMAX_LIMITS[field]
+    count = PMAX_COUNTS[field]
+    kept = []
+    seen = set()
+    for text in texts:
+        if len(text) > limit:
+            text = truncate_words(text, limit)
+        key = text.casefold()
+        if text and key not in seen:
+            seen.add(key)
+            kept.append(text)
+            if len(kept) == count:
+                return kept
+
+    while len(kept) < count:
+        template = truncate_words(templates[len(kept) % len(templates)], limit)
+        key = template.casefold()
+        if key in seen:
+            template = f"Style {len(kept) + 1}" if field == 'headlines' else template
+            key = template.casefold()
+        seen.add(key)
+        kept.append(template)
+    return kept
+
+
+def find_banned_words(folded: str, banned_words: list):
+    """Yield (offset, word) for whole-word occurrences in casefolded text"""
+    end_of_text = len(folded)
+    for word in banned_words:
+        word = word.casefold()
+        start = folded.find(word)
+        while start != -1:
+            end = start + len(word)
+            if (start == 0 or not folded[start - 1].isalnum()) and (end == end_of_text or not folded[end].isalnum()):
+                yield start, word
+            start = folded.find(word, end)
+
+
+class AssetTable:
+    """PMAX assets as parallel columns, one row per asset"""
+
+    def __init__(self):
+        self.group = []
+        self.field = []
+        self.text = []
+
+    def __len__(self):
+        return len(self.text)
+
+    def add(self, group: str, content: str):
+        """Add one asset group from PMAX text ("Headlines:" / "Descriptions:" / "Long Headlines:")"""
+        sections = parse_output(content).sections
+        for field in PMAX_SECTIONS:
+            for line in sections[field]:
+                self.group.append(group)
+                self.field.append(field)
+                self.text.append(line.text)
+
+    def extend(self, other: "AssetTable"):
+        self.group += other.group
+        self.field += other.field
+        self.text += other.text
+
+    @classmethod
+    def from_records(cls, records) -> "AssetTable":
+        """Build from batch output records; each product variation is one asset group"""
+        table = cls()
+        for record in records:
+            table.add(f"{record['product_id']}/v{record['variation']}", record['content'])
+        return table
+
+
+def validate_assets(table: AssetTable, banned_words: list) -> dict:
+    """Enforce limits and flag duplicates and banned words; returns result columns by name"""
+    texts = list(table.text)
+    lengths = list(map(len, texts))
+    limits = [PMAX_LIMITS[field] for field in table.field]
+
+    truncated = [False] * len(texts)
+    for i in [i for i, (length, limit) in enumerate(zip(lengths, limits)) if length > limit]:
+        texts[i] = truncate_words(texts[i], limits[i])
+        truncated[i] = True
+
+    # Casefold every asset in one call; rows never contain newlines, so splitting restores them
+    folded_blob = "\n".join(texts).casefold()
+    folded = folded_blob.split("\n")
+
+    # Duplicates only matter within one section of one asset group
+    seen = set()
+    duplicate = []
+    for key in zip(table.group, table.field, folded):
+        duplicate.append(key in seen)
+        seen.add(key)
+
+    banned = [()] * len(texts)
+    if banned_words and texts:
+        starts = list(accumulate((len(text) + 1 for text in folded[:-1]), initial=0))
+        for offset, word in find_banned_words(folded_blob, banned_words):
+            row = bisect.bisect_right(starts, offset) - 1
+            banned[row] += (word,)
+
+    return {"text": texts, "truncated": truncated, "duplicate": duplicate, "banned": banned}
+
+
+def compliance_report(table: AssetTable, results: dict) -> list:
+    """One row per asset group: usable assets per section and what was fixed or flagged"""
+    groups = {}
+    for group, field, truncated, duplicate, banned in zip(table.group, table.field, results["truncated"],
+                                                           results["duplicate"], results["banned"]):
+        row = groups.get(group)
+        if row is None:
+            row = groups[group] = {"group": group, "headlines": 0, "descriptions": 0, "long_headlines": 0,
+                                   "truncated": 0, "duplicates": 0, "banned_words": set()}
+        row["truncated"] += truncated
+        if duplicate:
+            row["duplicates"] += 1
+        elif not banned:
+            row[field] += 1
+        row["banned_words"].update(banned)
+
+    report = []
+    for row in groups.values():
+        missing = [field for field in PMAX_SECTIONS if row[field] < PMAX_COUNTS[field]]
+        row["banned_words"] = ", ".join(sorted(row["banned_words"]))
+        row["missing"] = ", ".join(missing)
+        row["compliant"] = not missing and not row["duplicates"] and not row["banned_words"]
+        report.append(row)
+    return report
+
+
+def batch_compliance(records: list, banned_words) -> tuple:
+    """(asset table, report) for the PMAX records of a batch run.
+
+    ``banned_words`` is one list for every record, or a function returning a record's own
+    list (a brand's words on top of the house list); records sharing a list are checked together.
+    """
+    by_words = {}
+    for record in records:
+        if record.get("content_type") == "PMAX":
+            words = banned_words(record) if callable(banned_words) else banned_words
+            by_words.setdefault(tuple(words or ()), []).append(record)
+
+    table = AssetTable()
+    report = []
+    for words, group in by_words.items():
+        group_table = AssetTable.from_records(group)
+        report += compliance_report(group_table, validate_assets(group_table, list(words)))
+        table.extend(group_table)
+    return table, report
+
+
+def write_report(report: list, path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def print_summary(table: AssetTable, report: list, limit: int = 20):
+    failing = [row for row in report if not row["compliant"]]
+    print(f"PMAX: {len(table)} assets in {len(report)} asset groups, {len(failing)} not compliant", file=sys.stderr)
+    for row in failing[:limit]:
+        print(f"  {row['group']}: missing [{row['missing']}] duplicates {row['duplicates']} "
+              f"banned [{row['banned_words']}]", file=sys.stderr)
+
@@ -0,0 +1,92 @@
+"""Single-pass parsing of raw model output.
+
+``parse_output`` splits the completion into lines once, runs one precompiled
+pattern over the few lines that can hold a PMAX section header or scaffolding
+label ("Headline:", "Variation 2", ...), and records each remaining line's length,
+word count, section and role. The ``_format_*`` handlers in the generator all
+work from this result instead of re-splitting and re-filtering the text.
+``parse_line`` is the same step for one line, for parsers that read a stream.
+"""
+import re
+
+# Lines containing any of these are model scaffolding, not copy
+LABELS = ['headline:', 'subject:', 'description:', 'cta:', 'variation', 'format:', 'line 1:', 'line 2:']
+
+PMAX_SECTIONS = ('headlines', 'descriptions', 'long_headlines')
+LABEL = 'label'
+
+# Matched against the lower-cased line; section headers come first so
+# "Long Headlines:" is never read as "Headlines:"
+LINE_PATTERN = re.compile(
+    r"(?P<long_headlines>long[ -]headlines:)|(?P<headlines>headlines:)|(?P<descriptions>descriptions:)"
+    r"|(?P<label>" + "|".join(re.escape(label) for label in LABELS) + ")"
+)
+
+# Roles: the first substantial line is the headline, longer lines are body copy,
+# short ones (four words or fewer) read as a call to action
+HEADLINE, BODY, CTA = "headline", "body", "cta"
+
+
+class Line:
+    __slots__ = ("text", "length", "words", "section", "role")
+
+    def __init__(self, text: str, section: str):
+        self.text = text
+        self.length = len(text)
+        self.words = len(text.split())
+        self.section = section
+        self.role = BODY if self.words > 4 else CTA
+
+    def __repr__(self):
+        return f"Line({self.text!r}, role={self.role}, section={self.section})"
+
+
+class ParsedOutput:
+    __slots__ = ("lines", "substantial", "sections")
+
+    def __init__(self, lines: list):
+        self.lines = lines
+        # Every format handler ignores fragments of five characters or fewer
+        self.substantial = [line for line in lines if line.length > 5]
+        if self.substantial:
+            self.substantial[0].role = HEADLINE
+        self.sections = {name: [] for name in PMAX_SECTIONS}
+        for line in lines:
+            if line.section:
+                self.sections[line.section].append(line)
+
+
+def _classify(lowered: str):
+    """Return the PMAX section a header line opens, LABEL for scaffolding, or None for copy"""
+    for match in LINE_PATTERN.finditer(lowered):
+        kind = match.lastgroup
+        # "Headlines:" next to "long" is a malformed long-headlines header, not a section
+        if kind != 'headlines' or 'long' not in lowered:
+            return kind
+    return None
+
+
+def parse_line(raw: str, section: str = None) -> tuple:
+    """(Line, or None for blanks, labels and headers; the section that follows) for one raw line"""
+    text = raw.strip()
+    if not text:
+        return None, section
+    lowered = text.lower()
+    # Every header and label but "variation" ends in a colon; plain copy skips the regex
+    if ':' in lowered or 'variation' in lowered:
+        kind = _classify(lowered)
+        if kind == LABEL:
+            return None, section
+        if kind:
+            return None, kind
+    return Line(text, section), section
+
+
+def parse_output(content: str) -> ParsedOutput:
+    lines = []
+    section = None
+    for raw in content.split('\n'):
+        line, section = parse_line(raw, section)
+        if line is not None:
+            lines.append(line)
+    return ParsedOutput(lines)
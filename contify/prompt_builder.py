@@ -1,7 +1,39 @@
+import hashlib
+import json
 import random
 
+from contify.pmax import find_banned_words
+from contify.templates import (
+    BRIEF, FORMAT_INSTRUCTIONS, MULTI_BRIEF, RULES, VARIATION_BLOCK, PromptTemplate, brand_fragment, format_key
+)
+
+
+def stable_seed(*parts) -> int:
+    """Derive a repeatable RNG seed from request inputs"""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest()[:8], "big")
+
+
 class ImprovedPromptBuilder:
-    def __init__(self):
+    """Prompt and fallback builder with its own random source.
+    
+    An unseeded builder keeps the original behaviour (fresh choices on every call).
+    With ``seed`` set, each call derives its own RNG from the seed and the call's
+    inputs, so results are reproducible regardless of call order or concurrency.
+    Any method can also take an explicit per-call ``seed``.
+    
+    A brand ``profile`` (see ``contify.brands``) adds the brand's banned words to
+    the house list, replaces the greeting and CTA pools with the brand's preferred
+    ones, fills brand, fabric and USP defaults, and compiles its voice into every
+    prompt template.
+    """
+    
+    def __init__(self, seed: int = None, profile: dict = None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.profile = profile or {}
+        self._templates = {}
+        
         self.banned_words = [
             "discover", "explore", "embrace", "immerse", "timeless", 
             "elegance", "luxury", "opulence", "wrap", "celebrate", "effortless"
@@ -67,47 +99,90 @@ class ImprovedPromptBuilder:
             "lifestyle_integration_cta", "trend_forecast_join", "expert_recommendation_trust"
         ]
         
+        if self.profile:
+            self._apply_profile(self.profile)
+        
+        # Pools feed prompts and fallback copy; "Explore Now" would ask for a banned word
+        self.greetings = self._without_banned(self.greetings)
+        self.ctas = self._without_banned(self.ctas)
+        self.opening_hooks = self._without_banned(self.opening_hooks)
+        self.emotional_connectors = self._without_banned(self.emotional_connectors)
+        
         # Dynamic strategy assignment - randomly selects from expanded options
         self.strategies = {
             1: {
-                "focus": random.choice(self.focus_types[:4]),  # First 4 for variation 1
-                "tone": random.choice(self.tone_types[:4]),    # First 4 for variation 1
-                "approach": random.choice(self.approach_types[:4])  # First 4 for variation 1
+                "focus": self.rng.choice(self.focus_types[:4]),  # First 4 for variation 1
+                "tone": self.rng.choice(self.tone_types[:4]),    # First 4 for variation 1
+                "approach": self.rng.choice(self.approach_types[:4])  # First 4 for variation 1
             },
             2: {
-                "focus": random.choice(self.focus_types[4:8]),  # Middle 4 for variation 2
-                "tone": random.choice(self.tone_types[4:8]),    # Middle 4 for variation 2
-                "approach": random.choice(self.approach_types[4:8])  # Middle 4 for variation 2
+                "focus": self.rng.choice(self.focus_types[4:8]),  # Middle 4 for variation 2
+                "tone": self.rng.choice(self.tone_types[4:8]),    # Middle 4 for variation 2
+                "approach": self.rng.choice(self.approach_types[4:8])  # Middle 4 for variation 2
             },
             3: {
-                "focus": random.choice(self.focus_types[8:]),   # Last 4+ for variation 3
-                "tone": random.choice(self.tone_types[8:]),     # Last 4+ for variation 3
-                "approach": random.choice(self.approach_types[8:])  # Last 4+ for variation 3
+                "focus": self.rng.choice(self.focus_types[8:]),   # Last 4+ for variation 3
+                "tone": self.rng.choice(self.tone_types[8:]),     # Last 4+ for variation 3
+                "approach": self.rng.choice(self.approach_types[8:])  # Last 4+ for variation 3
             }
         }
 
-    def _get_random_strategy(self, variation_number: int) -> dict:
+    def _apply_profile(self, profile: dict):
+        """Brand banned words on top of the house list; the brand's greetings and CTAs instead of the defaults"""
+        banned = {word.casefold() for word in self.banned_words}
+        self.banned_words = self.banned_words + [word for word in profile.get("banned_words", [])
+                                                 if word.casefold() not in banned]
+        # A brand pool with nothing left after the banned words keeps the defaults
+        greetings = self._without_banned(profile.get("greetings", []))
+        if greetings:
+            self.greetings = greetings
+        ctas = self._without_banned(profile.get("ctas", []))
+        if ctas:
+            self.ctas = ctas
+    
+    def _without_banned(self, phrases: list) -> list:
+        """phrases holding none of the banned words"""
+        return [phrase for phrase in phrases
+                if next(find_banned_words(phrase.casefold(), self.banned_words), None) is None]
+    
+    def precompile(self) -> "ImprovedPromptBuilder":
+        """Compile every template up front, so no request pays for it"""
+        for content_type in FORMAT_INSTRUCTIONS:
+            for kind in ("prompt", "block", "multi"):
+                self._template(kind, content_type)
+        return self
+    
+    def _call_rng(self, seed, *inputs) -> random.Random:
+        """RNG for one call: explicit seed, else derived from the builder seed, else shared"""
+        if seed is not None:
+            return random.Random(seed)
+        if self.seed is not None:
+            return random.Random(stable_seed(self.seed, *inputs))
+        return self.rng
+    
+    def _get_random_strategy(self, variation_number: int, rng: random.Random = None) -> dict:
         """Generate random strategy for each variation with different pools"""
+        rng = rng or self.rng
         if variation_number == 1:
             # Business-focused strategies
             return {
-                "focus": random.choice(self.focus_types[:4]),
-                "tone": random.choice(self.tone_types[:4]), 
-                "approach": random.choice(self.approach_types[:4])
+                "focus": rng.choice(self.focus_types[:4]),
+                "tone": rng.choice(self.tone_types[:4]), 
+                "approach": rng.choice(self.approach_types[:4])
             }
         elif variation_number == 2:
             # Emotional and social strategies  
             return {
-                "focus": random.choice(self.focus_types[4:8]),
-                "tone": random.choice(self.tone_types[4:8]),
-                "approach": random.choice(self.approach_types[4:8])
+                "focus": rng.choice(self.focus_types[4:8]),
+                "tone": rng.choice(self.tone_types[4:8]),
+                "approach": rng.choice(self.approach_types[4:8])
             }
         else:
             # Lifestyle and aspiration strategies
             return {
-                "focus": random.choice(self.focus_types[8:]),
-                "tone": random.choice(self.tone_types[8:]),
-                "approach": random.choice(self.approach_types[8:])
+                "focus": rng.choice(self.focus_types[8:]),
+                "tone": rng.choice(self.tone_types[8:]),
+                "approach": rng.choice(self.approach_types[8:])
             }
     
     def get_strategy_options(self) -> dict:
@@ -118,127 +193,119 @@ class ImprovedPromptBuilder:
             "approach_types": self.approach_types
         }
     
-    def build_focused_prompt(self, data: dict, variation_number: int, content_type: str) -> str:
-        """Build focused, strategy-based prompts with enhanced randomness"""
-        
-        # Regenerate strategy for each call to ensure randomness
-        strategy = self._get_random_strategy(variation_number)
+    def build_focused_prompt(self, data: dict, variation_number: int, content_type: str, seed: int = None) -> str:
+        """Build focused, strategy-based prompts with enhanced randomness.
         
-        # Select random elements
-        greeting = random.choice(self.greetings)
-        cta = random.choice(self.ctas)
-        hook = random.choice(self.opening_hooks)
-        connector = random.choice(self.emotional_connectors)
+        Passing a seed makes the prompt reproducible (and therefore cacheable).
+        """
+        return self.build_prompt(data, variation_number, content_type, seed)["prompt"]
+    
+    def build_prompt(self, data: dict, variation_number: int, content_type: str, seed: int = None) -> dict:
+        """Like build_focused_prompt, but also returns the strategy and elements that were picked"""
+        rng = self._call_rng(seed, "prompt", data, variation_number, content_type)
         
-        # Extract data
-        product = data.get('product', 'Premium Collection')
-        brand = data.get('brand', 'Our Brand')
-        fabric = data.get('fabric', 'Quality Materials')
-        festival = data.get('festival', 'Special Occasions')
-        discount = data.get('discount', 0)
-        char_limit = data.get('char_limit', 300)
-        tone = data.get('tone', 'Premium & Aspirational')
+        # Regenerate strategy for each call to ensure randomness
+        strategy = self._get_random_strategy(variation_number, rng)
+        elements = self._pick_elements(rng)
         
-        base_prompt = f"""
-Create fashion marketing copy variation #{variation_number}.
-
-BRAND: {brand}
-PRODUCT: {product} in {fabric}
-OCCASION: {festival}
-DISCOUNT: {discount}% {"(highlight this)" if discount > 0 else "(ignore)"}
-
-STRATEGY: 
-- Focus: {strategy['focus']} (what to emphasize)
-- Tone: {strategy['tone']} (how to sound)
-- Approach: {strategy['approach']} (content structure)
+        values = self._brief_values(data)
+        values.update(strategy)
+        values.update(elements)
+        values["variation_number"] = variation_number
+        return {
+            "prompt": self._template("prompt", content_type).render(values),
+            "strategy": strategy,
+            "elements": elements
+        }
 
-RANDOM ELEMENTS TO INCORPORATE:
-- Greeting style: "{greeting}"
-- Call-to-action: "{cta}" 
-- Opening hook: "{hook}"
-- Emotional connector: "{connector}"
+    def build_multi_variation_prompt(self, data: dict, variation_numbers: list, content_type: str,
+                                     seed: int = None) -> dict:
+        """One prompt asking for several variations as JSON, sharing the brand/product/rules preamble"""
+        rng = self._call_rng(seed, "multi", data, list(variation_numbers), content_type)
+        block = self._template("block", content_type)
 
-RULES:
-1. NO banned words: {', '.join(self.banned_words)}
-2. Use periods and commas only - NO exclamation marks
-3. No labels like "Headline:" or "Description:"
-4. Character limit: {char_limit}
-5. Make each line complete and natural
+        strategies = {}
+        blocks = []
+        for variation_number in variation_numbers:
+            strategy = self._get_random_strategy(variation_number, rng)
+            strategies[variation_number] = strategy
+            values = self._pick_elements(rng)
+            values.update(strategy)
+            values["variation_number"] = variation_number
+            blocks.append(block.render(values))
 
-{self._get_format_instructions(content_type, strategy, greeting, cta, hook, connector)}
-"""
-        return base_prompt
-    
-    def _get_format_instructions(self, content_type: str, strategy: dict, greeting: str, cta: str, hook: str, connector: str) -> str:
-        """Get format-specific instructions with random elements"""
-        
-        if content_type == "Email Subject Lines":
-            return f"""
-CREATE EMAIL (2 lines):
-Line 1: **Bold subject** - use "{hook}" concept
-Line 2: Email body - weave in "{connector}" naturally
-Line 3: End with strong "{cta}" call-to-action
+        values = self._brief_values(data)
+        values["count"] = len(variation_numbers)
+        shape = ', '.join(f'{{"variation": {n}, "content": "..."}}' for n in variation_numbers)
+        prompt = f"""{self._template("multi", content_type).render(values)}{''.join(blocks)}
 
-Write like a fashion brand email that gets opened.
+Respond with JSON only, in exactly this shape, putting line breaks inside "content" as \\n:
+{{"variations": [{shape}]}}
 """
-        
-        elif content_type == "WhatsApp Broadcast":
-            return f"""
-CREATE WHATSAPP (3 lines):
-Line 1: Start with "{greeting}" vibe - casual and friendly
-Line 2: Develop the story with product details and connect emotionally - use "{connector}" idea and in at least 3-4 sentences.
-Line 3: End with "{cta}" or similar
+        return {"prompt": prompt, "strategies": strategies}
 
-Write like texting a fashion-loving friend.
-"""
-        
-        elif content_type == "PMAX":
-            return f"""
-CREATE GOOGLE ADS - 3 sections:
+    def static_prefix(self, content_type: str = None) -> str:
+        """Leading prompt text that is identical for every request from this builder"""
+        return self._template("prompt", content_type).prefix
 
-Headlines: (15 items, max 30 chars each)
-Descriptions: (5 items, max 90 chars each)  
-Long Headlines: (5 items, max 120 chars each)
+    def _template(self, kind: str, content_type: str) -> PromptTemplate:
+        """Compiled template, built on first use per content type and banned-word list"""
+        key = (kind, format_key(content_type), tuple(self.banned_words))
+        template = self._templates.get(key)
+        if template is None:
+            instructions = FORMAT_INSTRUCTIONS[key[1]]
+            # Brand text goes in as literal text, never as a slot, so braces in it are safe
+            profile = brand_fragment(self.profile)
+            source = {
+                "prompt": RULES + "{brand_profile}" + BRIEF + instructions,
+                "block": VARIATION_BLOCK + instructions,
+                "multi": RULES + "{brand_profile}" + MULTI_BRIEF,
+                "format": instructions
+            }[kind]
+            template = self._templates[key] = PromptTemplate(source, banned_words=', '.join(self.banned_words),
+                                                             brand_profile=profile)
+        return template
 
-Use variety - mix formal, casual, urgent, emotional tones.
-Include "{cta}" in some headlines.
-CHARACTER LIMITS ARE STRICT.
-"""
-        
-        elif content_type == "Long Content":
-            return f"""
-CREATE STORY (4 lines):
-Line 1: Open with "{hook}" energy
-Line 2: Develop the story with product details
-Line 3: Connect emotionally - use "{connector}" idea
-Line 4: Close with "{cta}" power
+    def _pick_elements(self, rng: random.Random) -> dict:
+        return {
+            "greeting": rng.choice(self.greetings),
+            "cta": rng.choice(self.ctas),
+            "hook": rng.choice(self.opening_hooks),
+            "connector": rng.choice(self.emotional_connectors)
+        }
 
-Flow like a mini-story that sells.
-"""
-        
-        else:  # Concise Content
-            return f"""
-CREATE CONCISE (3 lines):
-Line 1: Punchy headline with "{hook}" feel
-Line 2: Smart description with key benefits
-Line 3: Strong "{cta}" finish
+    def _brief_values(self, data: dict) -> dict:
+        discount = data.get('discount', 0)
+        return {
+            "product": data.get('product', 'Premium Collection'),
+            "brand": data.get('brand', self.profile.get('name', 'Our Brand')),
+            "fabric": data.get('fabric', ", ".join(self.profile.get('fabrics', [])) or 'Quality Materials'),
+            "festival": data.get('festival', 'Special Occasions'),
+            "discount": discount,
+            "discount_note": "(highlight this)" if discount > 0 else "(ignore)",
+            "char_limit": data.get('char_limit', 300)
+        }
 
-Make every word count.
-"""
+    def _get_format_instructions(self, content_type: str, strategy: dict, greeting: str, cta: str, hook: str, connector: str) -> str:
+        """Get format-specific instructions with random elements"""
+        return self._template("format", content_type).render(
+            {"greeting": greeting, "cta": cta, "hook": hook, "connector": connector}
+        )
     
-    def create_fallback_content(self, data: dict, content_type: str, variation_number: int) -> str:
+    def create_fallback_content(self, data: dict, content_type: str, variation_number: int, seed: int = None) -> str:
         """Create reliable fallback content with enhanced randomness"""
         product = data.get('product', 'Premium Collection')
-        brand = data.get('brand', 'Our Brand')
-        fabric = data.get('fabric', 'Quality Materials')
+        brand = data.get('brand', self.profile.get('name', 'Our Brand'))
+        fabric = data.get('fabric', ", ".join(self.profile.get('fabrics', [])) or 'Quality Materials')
         festival = data.get('festival', 'Special Occasions')
         discount = data.get('discount', 0)
         
         # Random selections for fallback with strategy influence
-        strategy = self._get_random_strategy(variation_number)
-        greeting = random.choice(self.greetings)
-        cta = random.choice(self.ctas)
-        hook = random.choice(self.opening_hooks)
+        rng = self._call_rng(seed, "fallback", data, content_type, variation_number)
+        strategy = self._get_random_strategy(variation_number, rng)
+        greeting = rng.choice(self.greetings)
+        cta = rng.choice(self.ctas)
+        hook = rng.choice(self.opening_hooks)
         
         # Strategy-influenced templates
         if "direct_benefits" in strategy['focus']:
@@ -280,7 +347,7 @@ Make every word count.
             template["line2"] = f"{discount}% off {template['line2'].lower()}"
         
         if content_type == "PMAX":
-            return self._create_pmax_fallback(product, brand, fabric, festival, discount, strategy)
+            return self._create_pmax_fallback(product, brand, fabric, festival, discount, strategy, rng)
         elif content_type == "Email Subject Lines":
             subjects = [
                 f"{hook} - new {product}",
@@ -300,14 +367,16 @@ Make every word count.
             whatsapp_templates = [
                 f"{greeting}\n{template['line2']}\n{template['line3']}",
                 f"{hook}\n{fabric} {product} perfect for {festival}\n{cta}",
-                f"Perfect timing\n{template['line2']}\n{random.choice(self.ctas)}"
+                f"Perfect timing\n{template['line2']}\n{rng.choice(self.ctas)}"
             ]
             return whatsapp_templates[(variation_number - 1) % len(whatsapp_templates)]
         else:
             return f"{template['line1']}\n\n{template['line2']}\n\n{template['line3']}"
     
-    def _create_pmax_fallback(self, product: str, brand: str, fabric: str, festival: str, discount: int, strategy: dict = None) -> str:
+    def _create_pmax_fallback(self, product: str, brand: str, fabric: str, festival: str, discount: int, strategy: dict = None,
+                             rng: random.Random = None) -> str:
         """Enhanced PMAX fallback with strategy-based randomness"""
+        rng = rng or self.rng
         
         # Strategy-influenced headline generation
         if strategy and "quality_craftsmanship" in strategy['focus']:
@@ -320,13 +389,13 @@ Make every word count.
             focus_headlines = [f"New {product}", f"{brand} Style", f"Premium {fabric}", "Perfect Fit", "Quality First"]
         
         # Dynamic headline mixing
-        action_headlines = random.sample(self.ctas, 5)
+        action_headlines = rng.sample(self.ctas, min(5, len(self.ctas)))
         trend_headlines = ["Trending Now", "Must Have", "Best Choice", "Modern Look", "Classic Style"]
         seasonal_headlines = [f"Perfect for {festival}", "Season Ready", "Occasion Perfect", "Celebration Style", "Festive Ready"]
         
-        # Combine and shuffle
-        all_headlines = focus_headlines + action_headlines + trend_headlines + seasonal_headlines
-        random.shuffle(all_headlines)
+        # Combine and shuffle; a brand's banned words can hit the fixed phrases too
+        all_headlines = self._without_banned(focus_headlines + action_headlines + trend_headlines + seasonal_headlines)
+        rng.shuffle(all_headlines)
         headlines = all_headlines[:15]
         
         # Strategy-influenced descriptions
@@ -336,7 +405,7 @@ Make every word count.
                 f"Easy-care {product} that looks great and feels amazing",
                 f"Hassle-free {fabric} pieces perfect for busy lifestyles",
                 f"{brand} comfort meets style in every {product}",
-                f"Effortless elegance in premium {fabric} collection"
+                f"Easy polish in a premium {fabric} collection"
             ]
         elif strategy and "social_proof" in strategy['focus']:
             descriptions = [
@@ -350,7 +419,7 @@ Make every word count.
             descriptions = [
                 f"Premium {fabric} {product} for {festival}",
                 f"{brand} quality craftsmanship in every piece",
-                f"Perfect {product} {random.choice(self.emotional_connectors)}", 
+                f"Perfect {product} {rng.choice(self.emotional_connectors)}", 
                 f"Handpicked {fabric} designs for discerning taste",
                 f"New {product} collection now available online"
             ]
@@ -359,7 +428,7 @@ Make every word count.
         if strategy and "aspirational_lifestyle" in strategy['focus']:
             long_headlines = [
                 f"Elevate Your Style with {brand} Premium {product} Collection",
-                f"Luxury {fabric} {product} for the Modern Fashion Enthusiast",
+                f"Refined {fabric} {product} for the Modern Fashion Enthusiast",
                 f"Transform Your Wardrobe with {brand} Exclusive {product} Line",
                 f"Sophisticated {fabric} {product} for Discerning Fashion Lovers",
                 f"Premium Lifestyle Begins with {brand} {product} Collection"
@@ -370,7 +439,7 @@ Make every word count.
                 f"Perfect {fabric} {product} for {festival} Celebrations",
                 f"New {product} Collection - Handcrafted {fabric} Pieces", 
                 f"{brand} {fabric} {product} - Modern Style Statement",
-                f"Premium {product} in {fabric} - {random.choice(self.ctas)} Collection"
+                f"Premium {product} in {fabric} - {rng.choice(self.ctas)} Collection"
             ]
         
         # Add discount elements if present
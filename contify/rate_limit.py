@@ -0,0 +1,228 @@
+"""Client-side rate limiting and retry/backoff for Groq calls.
+
+Each model gets two token buckets, one for requests per minute and one for
+tokens per minute. Callers block until both buckets have room, so bursts are
+queued locally instead of being rejected upstream and turned into fallback
+copy. A request reserves its prompt and expected completion; the reservation is
+settled against the usage the API reports once the reply is in. Calls that still fail with a rate limit or a transient error are retried
+with jittered exponential backoff, honouring any ``retry-after`` header.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+import groq
+
+# Requests/tokens per minute for each model; unknown models use "default"
+DEFAULT_MODEL_LIMITS = {
+    "llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000},
+    "gemma2-9b-it": {"rpm": 30, "tpm": 15000},
+    "default": {"rpm": 30, "tpm": 6000}
+}
+
+# Share of max_completion_tokens a reply is expected to use: budgets carry about double the
+# copy's size in slack (see contify.budget), and record_usage settles the difference afterwards
+EXPECTED_COMPLETION_SHARE = 0.5
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)"""
+        self._refill(now)
+        # Never ask for more than a full bucket, or large prompts would wait forever
+        amount = min(amount, self.capacity)
+        wait = max(self.paused_until - now, 0.0)
+        if self.tokens < amount:
+            wait = max(wait, (amount - self.tokens) / self.rate)
+        return wait
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict = None, max_retries: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 30.0):
+        self.limits = dict(DEFAULT_MODEL_LIMITS)
+        self.limits.update(limits or {})
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets = {}
+        self._condition = threading.Condition()
+        self.stats = {"requests": 0, "throttled": 0, "throttle_wait_seconds": 0.0,
+                      "retries": 0, "rate_limited": 0, "gave_up": 0}
+
+    @classmethod
+    def from_env(cls, rpm: float = None, tpm: float = None) -> "RateLimiter":
+        """Apply rpm / tpm, else GROQ_RPM_LIMIT / GROQ_TPM_LIMIT (if set), to every model"""
+        rpm, tpm = rpm or os.getenv("GROQ_RPM_LIMIT"), tpm or os.getenv("GROQ_TPM_LIMIT")
+        limits = {}
+        for model, limit in DEFAULT_MODEL_LIMITS.items():
+            limits[model] = {"rpm": float(rpm or limit["rpm"]), "tpm": float(tpm or limit["tpm"])}
+        return cls(limits)
+
+    def _model_buckets(self, model: str) -> tuple:
+        if model not in self._buckets:
+            limit = self.limits.get(model, self.limits["default"])
+            self._buckets[model] = (TokenBucket(limit["rpm"], limit["rpm"]),
+                                    TokenBucket(limit["tpm"], limit["tpm"]))
+        return self._buckets[model]
+
+    def _reserve(self, model: str, estimated_tokens: int) -> float:
+        """Take headroom if the model has it now, else return seconds to wait (hold the condition)"""
+        requests, tokens = self._model_buckets(model)
+        now = time.monotonic()
+        wait = max(requests.wait_time(1, now), tokens.wait_time(estimated_tokens, now))
+        if wait <= 0:
+            requests.take(1)
+            tokens.take(estimated_tokens)
+            self.stats["requests"] += 1
+        return wait
+
+    def wait_estimate(self, model: str, estimated_tokens: int) -> float:
+        """Seconds a request would wait for headroom right now, without taking any"""
+        with self._condition:
+            requests, tokens = self._model_buckets(model)
+            now = time.monotonic()
+            return max(requests.wait_time(1, now), tokens.wait_time(estimated_tokens, now))
+
+    def _record_wait(self, waited: float):
+        if waited:
+            self.stats["throttled"] += 1
+            self.stats["throttle_wait_seconds"] += waited
+
+    def acquire(self, model: str, estimated_tokens: int) -> float:
+        """Block until the model has request and token headroom; returns seconds waited"""
+        waited = 0.0
+        with self._condition:
+            while True:
+                started = time.monotonic()
+                wait = self._reserve(model, estimated_tokens)
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+                waited += time.monotonic() - started
+            self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self, model: str, estimated_tokens: int) -> float:
+        """Like acquire, but sleeps on the event loop instead of blocking a thread"""
+        waited = 0.0
+        while True:
+            with self._condition:
+                wait = self._reserve(model, estimated_tokens)
+                if wait <= 0:
+                    self._record_wait(waited)
+                    return waited
+            started = time.monotonic()
+            await asyncio.sleep(wait)
+            waited += time.monotonic() - started
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Correct the token bucket once the real usage is known"""
+        if actual_tokens is None:
+            return
+        with self._condition:
+            _, tokens = self._model_buckets(model)
+            tokens.tokens = min(tokens.capacity, tokens.tokens + estimated_tokens - actual_tokens)
+            self._condition.notify_all()
+
+    def pause(self, model: str, seconds: float):
+        """Stop sending requests for `model` for a while (after a 429)"""
+        with self._condition:
+            requests, _ = self._model_buckets(model)
+            requests.paused_until = max(requests.paused_until, time.monotonic() + seconds)
+
+    def call(self, model: str, estimated_tokens: int, fn):
+        """Run `fn()` under the limiter, retrying rate limits and transient failures"""
+        attempt = 0
+        while True:
+            self.acquire(model, estimated_tokens)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(model, attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def call_async(self, model: str, estimated_tokens: int, fn):
+        """Like call, for an `fn()` that returns an awaitable"""
+        attempt = 0
+        while True:
+            await self.acquire_async(model, estimated_tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(model, attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, model: str, attempt: int, error: Exception):
+        """Seconds to back off before retrying `error`, or None to give up"""
+        if not self._is_retryable(error) or attempt >= self.max_retries:
+            if self._is_retryable(error):
+                self.stats["gave_up"] += 1
+            return None
+        delay = self._backoff(attempt, error)
+        if getattr(error, "status_code", None) == 429:
+            self.stats["rate_limited"] += 1
+            self.pause(model, delay)
+        self.stats["retries"] += 1
+        return delay
+
+    def _is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, groq.APIConnectionError):
+            return True
+        return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _retry_after(self, error: Exception):
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        value = response.headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def metrics(self) -> dict:
+        with self._condition:
+            stats = dict(self.stats)
+        stats["throttle_wait_seconds"] = round(stats["throttle_wait_seconds"], 2)
+        return stats
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """~4 characters per prompt token"""
+    return sum(len(m["content"]) for m in messages) // 4
+
+
+def estimate_tokens(messages: list, max_completion_tokens: int) -> int:
+    """Tokens to reserve for a request: the prompt plus the completion it is expected to use, not its cap"""
+    return estimate_prompt_tokens(messages) + int(max_completion_tokens * EXPECTED_COMPLETION_SHARE)
@@ -0,0 +1,92 @@
+"""Automatic model choice by live latency, error rate and rate-limit headroom.
+
+Every finished or failed call is recorded per model as an exponentially
+weighted average of latency and error rate. When a variation is requested
+with ``model=AUTO_MODEL``, ``ModelRouter.route`` estimates how long each model
+would take right now (time until the rate limiter would let a request through,
+plus its average latency, inflated by its error rate) and orders the models:
+the first preferred model expected to meet the target latency (and failing
+no more than ``ERROR_TOLERANCE`` of its calls), then the rest fastest first. The generator tries them in that order, so a failing model
+fails over to the other one instead of to template copy.
+"""
+import threading
+import time
+
+AUTO_MODEL = "auto"
+
+# In order of preference when more than one meets the target
+ROUTED_MODELS = ["gemma2-9b-it", "llama-3.1-8b-instant"]
+
+# Weight of the newest sample in the moving averages
+SMOOTHING = 0.2
+
+# A model not used for this long is treated as unmeasured again, so it gets retried
+STALE_SECONDS = 60.0
+
+# Above this error rate a model is only the first choice if nothing else meets the target
+ERROR_TOLERANCE = 0.1
+
+
+class ModelStats:
+    __slots__ = ("latency", "error_rate", "calls", "errors", "last_used")
+
+    def __init__(self):
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_used = 0.0
+
+
+class ModelRouter:
+    def __init__(self, models: list = None, target_latency: float = 3.0, rate_limiter=None,
+                 estimated_tokens: int = 700):
+        self.models = list(models or ROUTED_MODELS)
+        self.target_latency = target_latency
+        self.rate_limiter = rate_limiter
+        self.estimated_tokens = estimated_tokens
+        self._stats = {model: ModelStats() for model in self.models}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, latency: float = None, error: bool = False):
+        """Record one call: its latency in seconds on success, or error=True"""
+        with self._lock:
+            stats = self._stats.setdefault(model, ModelStats())
+            stats.calls += 1
+            stats.last_used = time.monotonic()
+            stats.errors += error
+            stats.error_rate += SMOOTHING * (float(error) - stats.error_rate)
+            if latency is not None:
+                stats.latency = latency if stats.latency is None else stats.latency + SMOOTHING * (latency - stats.latency)
+
+    def estimate(self, model: str) -> float:
+        """Expected seconds for a call to model if sent now"""
+        wait = self.rate_limiter.wait_estimate(model, self.estimated_tokens) if self.rate_limiter else 0.0
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None or now - stats.last_used > STALE_SECONDS:
+                # Unmeasured or stale: optimistic, so it gets tried
+                return wait
+            latency = stats.latency or 0.0
+            # A failure costs a whole target latency before the next model is tried
+            success = max(1.0 - stats.error_rate, 0.1)
+            return wait + latency / success + stats.error_rate / success * self.target_latency
+
+    def route(self) -> list:
+        """[(model, estimated seconds)] in the order to try them"""
+        estimates = [(model, self.estimate(model)) for model in self.models]
+        now = time.monotonic()
+        with self._lock:
+            reliable = {model for model, stats in self._stats.items()
+                        if stats.error_rate <= ERROR_TOLERANCE or now - stats.last_used > STALE_SECONDS}
+        meeting = [pair for pair in estimates if pair[1] <= self.target_latency and pair[0] in reliable]
+        first = meeting[0] if meeting else min(estimates, key=lambda pair: pair[1])
+        rest = sorted((pair for pair in estimates if pair is not first), key=lambda pair: pair[1])
+        return [first] + rest
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {model: {"latency_ms": round(stats.latency * 1000, 1) if stats.latency is not None else None,
+                            "error_rate": round(stats.error_rate, 3), "calls": stats.calls, "errors": stats.errors}
+                    for model, stats in self._stats.items()}
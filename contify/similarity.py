@@ -0,0 +1,140 @@
+"""Near-duplicate detection for generated copy.
+
+Each text gets a 128-bit SimHash over character 4-grams of its words: similar
+texts get fingerprints that differ in only a few bits. Character shingles give
+even a three-line ad a hundred or so features, so a one-word edit moves the
+fingerprint by a handful of bits instead of flipping the majority in whole
+columns the way a dozen word features do.
+
+``SimilarityIndex`` is the locality-sensitive index over those fingerprints.
+It cuts each fingerprint into eight 16-bit bands, twice (the second time
+rotated by half a band), and buckets entries by band value. A lookup probes
+every band value and each of its one-bit flips, so it finds any entry that
+agrees with the query to within a bit on one band: in practice every near
+duplicate, as ``benchmarks.similarity`` measures. A bucket holds about n/65536
+entries, so a lookup compares against about n/240 candidates (around 80 at
+20k texts) instead of everything stored.
+"""
+import hashlib
+import re
+import threading
+
+WORD_PATTERN = re.compile(r"\w+")
+
+FINGERPRINT_BITS = 128
+FINGERPRINT_MASK = (1 << FINGERPRINT_BITS) - 1
+SHINGLE_CHARS = 4
+
+BAND_BITS = 16
+BANDS = FINGERPRINT_BITS // BAND_BITS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Bit offsets of the two band layouts; the second catches matches whose differing bits straddle the first's bands
+LAYOUT_SHIFTS = (0, BAND_BITS // 2)
+
+# Measured on three-line ads: a one-word edit moves up to ~25 of 128 bits (p99), two edits ~27
+# (p90), while different copy for the same product stays 36 or more apart
+NEAR_DUPLICATE_DISTANCE = 28
+
+
+def shingles(text: str, size: int = SHINGLE_CHARS) -> set:
+    """Character n-grams of the casefolded words joined by single spaces (the whole text if it is shorter)"""
+    words = " ".join(WORD_PATTERN.findall(text.casefold()))
+    if len(words) <= size:
+        return {words}
+    return {words[i:i + size] for i in range(len(words) - size + 1)}
+
+
+def simhash(text: str, size: int = SHINGLE_CHARS) -> int:
+    """128-bit SimHash of the text's character shingles"""
+    rows = [format(int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=16).digest(), "big"),
+                   "0128b")
+            for shingle in shingles(text, size)]
+    half = len(rows) / 2
+    # Count set bits column by column: a bit is set when most shingles set it
+    bits = "".join("1" if column.count("1") > half else "0" for column in zip(*rows))
+    return int(bits, 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def bands(fingerprint: int) -> list:
+    """(band, value) keys an entry is stored under, one per band of each layout"""
+    keys = []
+    for layout, shift in enumerate(LAYOUT_SHIFTS):
+        rotated = ((fingerprint >> shift) | (fingerprint << (FINGERPRINT_BITS - shift))) & FINGERPRINT_MASK
+        for band in range(BANDS):
+            keys.append((layout * BANDS + band, (rotated >> (band * BAND_BITS)) & BAND_MASK))
+    return keys
+
+
+def probes(fingerprint: int) -> list:
+    """Bucket keys a lookup reads: every band value and each of its one-bit flips"""
+    keys = []
+    for band, value in bands(fingerprint):
+        keys.append((band, value))
+        keys.extend((band, value ^ (1 << bit)) for bit in range(BAND_BITS))
+    return keys
+
+
+class SimilarityIndex:
+    """Fingerprints by key, bucketed by band for near-duplicate lookups"""
+
+    def __init__(self, max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = max_distance
+        self._fingerprints = {}
+        self._buckets = {}  # (band, band value) -> set of keys
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def __contains__(self, key):
+        return key in self._fingerprints
+
+    def add(self, key, fingerprint: int):
+        with self._lock:
+            if key in self._fingerprints:
+                self._discard(key)
+            self._fingerprints[key] = fingerprint
+            for bucket in bands(fingerprint):
+                self._buckets.setdefault(bucket, set()).add(key)
+
+    def add_text(self, key, text: str) -> int:
+        fingerprint = simhash(text)
+        self.add(key, fingerprint)
+        return fingerprint
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._fingerprints:
+                self._discard(key)
+
+    def _discard(self, key):
+        for bucket in bands(self._fingerprints.pop(key)):
+            keys = self._buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self._buckets[bucket]
+
+    def candidates(self, fingerprint: int) -> set:
+        """Keys sharing a probed bucket with fingerprint: what a query compares against"""
+        with self._lock:
+            return self._candidates(fingerprint)
+
+    def _candidates(self, fingerprint: int) -> set:
+        candidates = set()
+        for bucket in probes(fingerprint):
+            keys = self._buckets.get(bucket)
+            if keys:
+                candidates.update(keys)
+        return candidates
+
+    def query(self, fingerprint: int, keys=None) -> list:
+        """Keys within max_distance bits of fingerprint, restricted to keys if given"""
+        with self._lock:
+            candidates = self._candidates(fingerprint)
+            if keys is not None:
+                candidates.intersection_update(keys)
+            return [key for key in candidates if hamming(fingerprint, self._fingerprints[key]) <= self.max_distance]
@@ -0,0 +1,133 @@
+"""Chunk collection for streamed completions.
+
+Chunks are kept in a list and joined only when a UI update is due, and updates
+are throttled (time- and chunk-based), so rendering cost stays roughly linear
+in the output length instead of re-sending the whole text on every token.
+
+Given a ``StreamValidator``, the collector feeds it every chunk and stops
+reading (and closes the stream) as soon as the reply is complete or invalid,
+so a model that keeps writing past the copy, or writes copy that will be
+rejected, is not waited for.
+"""
+import time
+
+# Push a UI update at most every 50 ms, or sooner after this many chunks
+RENDER_INTERVAL_SECONDS = 0.05
+RENDER_EVERY_CHUNKS = 20
+
+
+class StreamCollector:
+    def __init__(self, on_update=None, interval: float = RENDER_INTERVAL_SECONDS,
+                 every_chunks: int = RENDER_EVERY_CHUNKS, started_at: float = None, validator=None):
+        self.on_update = on_update
+        self.validator = validator
+        self.interval = interval
+        self.every_chunks = every_chunks
+        self.started_at = started_at or time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.finish_reason = None
+        self.stopped_early = False
+        self.updates = 0
+        self._chunks = []
+        self._length = 0
+        self._rendered = ""
+        self._rendered_chunks = 0
+        self._last_update = 0.0
+
+    def consume(self, completion) -> str:
+        """Read a streamed chat completion to the end and return the full text"""
+        for chunk in completion:
+            self._read(chunk)
+            if self.stopped_early:
+                # Closing the response tells the server to stop generating
+                close = getattr(completion, "close", None)
+                if close:
+                    close()
+                break
+        return self.finish()
+
+    async def consume_async(self, completion) -> str:
+        """consume() for a stream from the async client"""
+        async for chunk in completion:
+            self._read(chunk)
+            if self.stopped_early:
+                close = getattr(completion, "close", None)
+                if close:
+                    await close()
+                break
+        return self.finish()
+
+    def _read(self, chunk):
+        if chunk.choices:
+            if chunk.choices[0].delta.content:
+                self.add(chunk.choices[0].delta.content)
+            self.finish_reason = chunk.choices[0].finish_reason or self.finish_reason
+        # Groq reports real usage on the final chunk
+        usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", None)
+            self.completion_tokens = usage.completion_tokens
+
+    def add(self, text: str):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        if self.validator and not self.stopped_early and self.validator.feed(text):
+            self.stopped_early = True
+            if self.validator.complete:
+                # The start of a line past the copy is dropped with the rest
+                text = text[:self.validator.cut - self._length]
+        self._length += len(text)
+        self._chunks.append(text)
+        if self.on_update and (len(self._chunks) - self._rendered_chunks >= self.every_chunks
+                               or now - self._last_update >= self.interval):
+            self._emit(now)
+
+    def finish(self) -> str:
+        self.finished_at = time.perf_counter()
+        if self.validator and not self.stopped_early:
+            self.validator.close()
+        if self.on_update and self._rendered_chunks < len(self._chunks):
+            self._emit(self.finished_at)
+        return self.text
+
+    @property
+    def text(self) -> str:
+        self._catch_up()
+        return self._rendered
+
+    def _catch_up(self):
+        # Only join the chunks that arrived since the last render
+        if self._rendered_chunks < len(self._chunks):
+            self._rendered += "".join(self._chunks[self._rendered_chunks:])
+            self._rendered_chunks = len(self._chunks)
+
+    def _emit(self, now: float):
+        self._catch_up()
+        self._last_update = now
+        self.updates += 1
+        self.on_update(self._rendered)
+
+    def stats(self) -> dict:
+        end = self.finished_at or time.perf_counter()
+        tokens = self.completion_tokens if self.completion_tokens is not None else len(self._chunks)
+        generating = end - (self.first_token_at or end)
+        return {
+            "ttft_ms": round((self.first_token_at - self.started_at) * 1000, 1) if self.first_token_at else None,
+            "total_ms": round((end - self.started_at) * 1000, 1),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": tokens,
+            "tokens_per_sec": round(tokens / generating, 1) if generating > 0 else None,
+            "ui_updates": self.updates,
+            "finish_reason": self._finish_reason()
+        }
+
+    def _finish_reason(self) -> str:
+        if self.validator and self.validator.invalid:
+            return "invalid"
+        if self.stopped_early:
+            return "complete"
+        return self.finish_reason
@@ -0,0 +1,234 @@
+"""Per-stage timing, token usage and their export.
+
+Each variation reports the milliseconds it spent in every stage of the hot
+path under ``metrics["stages_ms"]``:
+
+    prompt_build  building the prompt (and routing, for ``model=AUTO_MODEL``)
+    queue_wait    waiting on the client-side rate limiter and retry backoff
+    ttft          time to first token once the request was sent (streaming only)
+    llm           the answered request, from sending it to its last token
+    postprocess   ``_clean_content``
+    fallback      building template copy after a failure or a missed deadline
+
+``Telemetry.observe`` folds those spans, and the token usage from the API
+response, into Prometheus histograms and counters. They can be scraped from
+``Telemetry.serve`` (``GET /metrics``) or written to a textfile for the node
+exporter, and every observation can also be appended to a JSONL trace log.
+Whole ``generate_variations`` calls are recorded as the ``generation`` stage,
+and front ends can add their own stages with ``record``.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = ["prompt_build", "queue_wait", "ttft", "llm", "postprocess", "fallback"]
+
+# Histogram bucket bounds in seconds, from prompt building to slow completions
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Recent samples kept per stage for the percentiles in summary()
+RECENT_SAMPLES = 1000
+
+# Minimum seconds between rewrites of the Prometheus textfile
+TEXTFILE_INTERVAL = 10.0
+
+
+@contextmanager
+def span(stages: dict, stage: str):
+    """Add the time spent in the block to stages[stage], in milliseconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = round(stages.get(stage, 0.0) + (time.perf_counter() - started) * 1000, 2)
+
+
+def outcome(metrics: dict) -> str:
+    """How a variation was produced, from its metrics"""
+    for name in ("cached", "coalesced", "fallback", "failed"):
+        if metrics.get(name):
+            return name
+    return "model"
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.sum += seconds
+        self.count += 1
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[position] += 1
+                break
+
+
+class Telemetry:
+    def __init__(self, trace_path: str = None, textfile_path: str = None,
+                 textfile_interval: float = TEXTFILE_INTERVAL):
+        self.trace_path = trace_path
+        self.textfile_path = textfile_path
+        self.textfile_interval = textfile_interval
+        self._histograms = {}  # (stage, model) -> _Histogram
+        self._recent = {}  # stage -> deque of recent seconds
+        self._tokens = {}  # (model, kind) -> count
+        self._outcomes = {}  # (kind, outcome) -> count
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        self._trace_file = None
+        self._textfile_written = 0.0
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        """Export to CONTIFY_TRACE_PATH (JSONL) and CONTIFY_METRICS_FILE (Prometheus textfile) if set"""
+        return cls(os.getenv("CONTIFY_TRACE_PATH") or None, os.getenv("CONTIFY_METRICS_FILE") or None)
+
+    def record(self, stage: str, seconds: float, model: str = ""):
+        """Add one timing for a stage"""
+        with self._lock:
+            self._record(stage, seconds, model)
+        self._maybe_write_textfile()
+
+    def _record(self, stage: str, seconds: float, model: str):
+        histogram = self._histograms.get((stage, model))
+        if histogram is None:
+            histogram = self._histograms[(stage, model)] = _Histogram()
+        histogram.add(seconds)
+        recent = self._recent.get(stage)
+        if recent is None:
+            recent = self._recent[stage] = deque(maxlen=RECENT_SAMPLES)
+        recent.append(seconds)
+
+    def observe(self, kind: str, metrics: dict, **attributes):
+        """Record a variation's (or combined call's) stages, tokens and outcome, and trace it"""
+        model = metrics.get("model") or attributes.get("model") or ""
+        stages = metrics.get("stages_ms") or {}
+        usage = {name: metrics[name] for name in ("prompt_tokens", "completion_tokens") if metrics.get(name) is not None}
+        result = outcome(metrics)
+        with self._lock:
+            for stage, ms in stages.items():
+                self._record(stage, ms / 1000, model)
+            for name, tokens in usage.items():
+                self._tokens[(model, name)] = self._tokens.get((model, name), 0) + tokens
+            self._outcomes[(kind, result)] = self._outcomes.get((kind, result), 0) + 1
+        self.trace(dict(attributes, kind=kind, model=model, outcome=result, stages_ms=stages, usage=usage))
+        self._maybe_write_textfile()
+
+    def observe_generation(self, seconds: float, records: list, **attributes):
+        """Record one whole generate_variations call"""
+        self.record("generation", seconds, attributes.get("model", ""))
+        self.trace(dict(attributes, kind="generation", total_ms=round(seconds * 1000, 1), variations=len(records)))
+
+    def trace(self, event: dict):
+        """Append one event to the JSONL trace log, if there is one"""
+        if not self.trace_path:
+            return
+        line = json.dumps(dict(event, ts=round(time.time(), 3), id=uuid.uuid4().hex[:16]),
+                          ensure_ascii=False, default=str)
+        with self._trace_lock:
+            if self._trace_file is None:
+                self._trace_file = open(self.trace_path, "a", encoding="utf-8", buffering=1)
+            self._trace_file.write(line + "\n")
+
+    def summary(self) -> dict:
+        """{stage: {"count", "p50_ms", "p95_ms", "max_ms"}} over recent samples, plus tokens and outcomes"""
+        with self._lock:
+            recent = {stage: sorted(samples) for stage, samples in self._recent.items()}
+            tokens = dict(self._tokens)
+            outcomes = dict(self._outcomes)
+        stages = {}
+        for stage, samples in recent.items():
+            stages[stage] = {
+                "count": len(samples),
+                "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+                "p95_ms": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1)
+            }
+        token_totals = {}
+        for (_, kind), count in tokens.items():
+            token_totals[kind] = token_totals.get(kind, 0) + count
+        outcome_totals = {}
+        for (_, result), count in outcomes.items():
+            outcome_totals[result] = outcome_totals.get(result, 0) + count
+        return {"stages": stages, "tokens": token_totals, "outcomes": outcome_totals}
+
+    def prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            tokens = dict(self._tokens)
+            outcomes = dict(self._outcomes)
+
+        lines = ["# HELP contify_stage_duration_seconds Time spent in each generation stage.",
+                 "# TYPE contify_stage_duration_seconds histogram"]
+        for (stage, model), (counts, total, count) in sorted(histograms.items()):
+            labels = f'stage="{stage}",model="{model}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'contify_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'contify_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"contify_stage_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"contify_stage_duration_seconds_count{{{labels}}} {count}")
+
+        lines += ["# HELP contify_tokens_total Tokens reported by the API.", "# TYPE contify_tokens_total counter"]
+        for (model, kind), count in sorted(tokens.items()):
+            lines.append(f'contify_tokens_total{{model="{model}",kind="{kind.replace("_tokens", "")}"}} {count}')
+
+        lines += ["# HELP contify_calls_total Variation and combined calls by how they were answered.",
+                  "# TYPE contify_calls_total counter"]
+        for (kind, result), count in sorted(outcomes.items()):
+            lines.append(f'contify_calls_total{{kind="{kind}",outcome="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str = None):
+        """Write prometheus() to path (default textfile_path), replacing it atomically"""
+        path = path or self.textfile_path
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(temporary, path)
+
+    def _maybe_write_textfile(self):
+        if not self.textfile_path:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._textfile_written < self.textfile_interval:
+                return
+            self._textfile_written = now
+        self.write_textfile()
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+        """Serve prometheus() at GET /metrics from a daemon thread"""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="contify-metrics", daemon=True).start()
+        return server
@@ -0,0 +1,167 @@
+"""Prompt templates compiled once and filled per call.
+
+Each content type's prompt is a fixed text with a handful of slots (brand,
+product, strategy, random elements). ``PromptTemplate`` splits the source into
+literal chunks and named slots once, bakes in values that never change per call
+(the banned-word list), and renders by joining the chunks with the slot values,
+with no format-string parsing per call.
+
+Prompts start with the rules block, which contains no per-call slots, so every
+request from the same builder shares ``PromptTemplate.prefix`` and
+provider-side prompt caching can reuse it. A builder loaded with a brand
+profile compiles the brand's voice, tone and USP right after the rules, so
+each brand gets its own static prefix.
+"""
+from string import Formatter
+
+RULES = """RULES:
+1. NO banned words: {banned_words}
+2. Use periods and commas only - NO exclamation marks
+3. No labels like "Headline:" or "Description:"
+4. Make each line complete and natural
+"""
+
+# Brand profile fields written into the prompts of that brand's builder, in order
+BRAND_LINES = {
+    "voice": "BRAND VOICE",
+    "tone": "TONE",
+    "usp": "UNIQUE SELLING POINT"
+}
+
+BRIEF = """
+Create fashion marketing copy variation #{variation_number}.
+
+BRAND: {brand}
+PRODUCT: {product} in {fabric}
+OCCASION: {festival}
+DISCOUNT: {discount}% {discount_note}
+CHARACTER LIMIT: {char_limit}
+
+STRATEGY:
+- Focus: {focus} (what to emphasize)
+- Tone: {tone} (how to sound)
+- Approach: {approach} (content structure)
+
+RANDOM ELEMENTS TO INCORPORATE:
+- Greeting style: "{greeting}"
+- Call-to-action: "{cta}"
+- Opening hook: "{hook}"
+- Emotional connector: "{connector}"
+"""
+
+MULTI_BRIEF = """
+Create {count} distinct fashion marketing copy variations.
+
+BRAND: {brand}
+PRODUCT: {product} in {fabric}
+OCCASION: {festival}
+DISCOUNT: {discount}% {discount_note}
+CHARACTER LIMIT: {char_limit}
+
+Each variation follows its own strategy below and must read differently from the others.
+"""
+
+VARIATION_BLOCK = """
+=== VARIATION {variation_number} ===
+STRATEGY: Focus: {focus} | Tone: {tone} | Approach: {approach}
+ELEMENTS: Greeting "{greeting}" | Call-to-action "{cta}" | Opening hook "{hook}" | Emotional connector "{connector}"
+"""
+
+FORMAT_INSTRUCTIONS = {
+    "Email Subject Lines": """
+CREATE EMAIL (2 lines):
+Line 1: **Bold subject** - use "{hook}" concept
+Line 2: Email body - weave in "{connector}" naturally
+Line 3: End with strong "{cta}" call-to-action
+
+Write like a fashion brand email that gets opened.
+""",
+    "WhatsApp Broadcast": """
+CREATE WHATSAPP (3 lines):
+Line 1: Start with "{greeting}" vibe - casual and friendly
+Line 2: Develop the story with product details and connect emotionally - use "{connector}" idea and in at least 3-4 sentences.
+Line 3: End with "{cta}" or similar
+
+Write like texting a fashion-loving friend.
+""",
+    "PMAX": """
+CREATE GOOGLE ADS - 3 sections:
+
+Headlines: (15 items, max 30 chars each)
+Descriptions: (5 items, max 90 chars each)
+Long Headlines: (5 items, max 120 chars each)
+
+Use variety - mix formal, casual, urgent, emotional tones.
+Include "{cta}" in some headlines.
+CHARACTER LIMITS ARE STRICT.
+""",
+    "Long Content": """
+CREATE STORY (4 lines):
+Line 1: Open with "{hook}" energy
+Line 2: Develop the story with product details
+Line 3: Connect emotionally - use "{connector}" idea
+Line 4: Close with "{cta}" power
+
+Flow like a mini-story that sells.
+""",
+    "Concise Content": """
+CREATE CONCISE (3 lines):
+Line 1: Punchy headline with "{hook}" feel
+Line 2: Smart description with key benefits
+Line 3: Strong "{cta}" finish
+
+Make every word count.
+"""
+}
+
+# Anything unrecognised is written as concise copy
+DEFAULT_FORMAT = "Concise Content"
+
+
+def brand_fragment(profile: dict) -> str:
+    """The lines a brand profile adds after the rules; empty without a profile"""
+    lines = [f"{label}: {profile[field]}" for field, label in BRAND_LINES.items() if (profile or {}).get(field)]
+    return "\nBRAND PROFILE:\n" + "\n".join(f"- {line}" for line in lines) + "\n" if lines else ""
+
+
+def format_key(content_type: str) -> str:
+    return content_type if content_type in FORMAT_INSTRUCTIONS else DEFAULT_FORMAT
+
+
+class PromptTemplate:
+    """A prompt split once into literal chunks and named slots.
+
+    ``constants`` are substituted at compile time. ``offsets[i]`` is where
+    ``slots[i]`` sits in the literal text, and ``prefix`` is the literal text
+    before the first slot: identical for every render.
+    """
+
+    def __init__(self, source: str, **constants):
+        self.chunks = []
+        self.slots = []
+        self.offsets = []
+        literal = ""
+        for chunk, field, spec, conversion in Formatter().parse(source):
+            literal += chunk
+            if field is None:
+                continue
+            if field in constants:
+                literal += str(constants[field])
+                continue
+            self.chunks.append(literal)
+            self.offsets.append(sum(len(c) for c in self.chunks))
+            self.slots.append(field)
+            literal = ""
+        self.chunks.append(literal)
+        self.prefix = self.chunks[0]
+        self._pairs = list(zip(self.chunks, self.slots))
+
+    def render(self, values: dict) -> str:
+        parts = []
+        for chunk, slot in self._pairs:
+            parts += (chunk, str(values[slot]))
+        parts.append(self.chunks[-1])
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"PromptTemplate(slots={self.slots}, prefix_chars={len(self.prefix)})"